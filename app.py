@@ -5,7 +5,23 @@ import base64
 import io
 from mtcnn import MTCNN
 import tensorflow as tf
-from face_recognition_system import FaceRecognitionSystem
+from face_recognition_system import FaceRecognitionSystem, recognizer_options
+from jpeg_encoder import create_jpeg_encoder
+from detection_pipeline import (detect_faces_in_frame, detect_faces_in_regions,
+                                create_coarse_to_fine_detector, warm_up_detector, detector_input_shapes)
+from recognition_cache import RecognitionCache
+from face_tracker import FaceTracker
+from worker_pool import DetectionWorkerPool
+from frame_sources import create_frame_source, LatencyWindow, ThreadedCapture
+from pipeline_state import SnapshotPublisher
+from motion_gate import create_detection_gate
+from face_quality import create_quality_gate, merge_quality_stats, TrackResultMemory
+from enrollment_jobs import EnrollmentQueue
+from event_recorder import create_event_recorder
+from overload_control import create_overload_controller
+from overlay_renderer import OverlayRenderer
+from frame_tracer import tracer
+from thread_budget import apply_thread_budget, server_budget, load_thread_profile, get_thread_stats
 from config import config
 import os
 import threading
@@ -19,30 +35,79 @@ app = Flask(__name__)
 config_name = os.environ.get('FLASK_CONFIG', 'development')
 app.config.from_object(config[config_name])
 config[config_name].init_app(app)
+# Thread settings measured on this machine by tune_threads.py
+load_thread_profile(app.config)
 
 # Global variables
 detector = None
 face_recognition_sys = None
+worker_pool = None
+enrollment_queue = None
 camera = None
 detection_active = False
-current_frame = None
-detection_results = []
+detection_gate = None
+multires_detector = None
+event_recorder = None
+track_results = None
+# Latest frame + detection results, published atomically by capture_frames
+pipeline = SnapshotPublisher()
+# Milliseconds from frame grab to publish (after detection) and to encoded stream chunk
+latency = {'publish': LatencyWindow(), 'stream': LatencyWindow()}
+# Sheds stream, detection and recognition work step by step when the pipeline falls behind
+overload = create_overload_controller(app.config)
+# Label sprites are rasterized once and blended into each streamed frame
+overlay_renderer = OverlayRenderer(app.config['OVERLAY_SPRITE_CACHE_SIZE'])
 
 def initialize_models():
     """Initialize MTCNN detector and face recognition system"""
-    global detector, face_recognition_sys
+    global detector, face_recognition_sys, worker_pool, enrollment_queue
     try:
+        # Size the OpenCV/TensorFlow thread pools before TensorFlow starts its runtime
+        budget = apply_thread_budget(**server_budget(app.config))
+        if budget:
+            print(f"⚙️ Thread budget: {budget}")
+        
         # Initialize MTCNN with default configuration for better compatibility
         print("Initializing MTCNN detector...")
         detector = MTCNN()
         
-        # Test detector with a small dummy image to check compatibility
-        test_image = np.ones((48, 48, 3), dtype=np.uint8) * 128
-        test_result = detector.detect_faces(test_image)
-        print(f"MTCNN test completed: {len(test_result) if test_result else 0} faces detected")
+        # Run every detector input shape once so live frames do not pay the first-call cost
+        warmup_shapes = detector_input_shapes(app.config)
+        timings = warm_up_detector(detector, warmup_shapes)
+        print(f"MTCNN warm-up completed: {len(timings)} input shape(s) in {sum(timings.values()):.0f} ms")
+        # The coarse and fine passes call the detector with their own options
+        multires = create_coarse_to_fine_detector(detector, app.config)
+        if multires is not None:
+            timings = multires.warm_up((app.config['CAMERA_WIDTH'], app.config['CAMERA_HEIGHT']))
+            print(f"Coarse-to-fine warm-up completed: {', '.join(timings)} in {sum(timings.values()):.0f} ms")
         
         print("Initializing face recognition system...")
-        face_recognition_sys = FaceRecognitionSystem()
+        recognition_cache = RecognitionCache(
+            max_size=app.config['RECOGNITION_CACHE_SIZE'],
+            ttl=app.config['RECOGNITION_CACHE_TTL'],
+            max_hash_distance=app.config['RECOGNITION_CACHE_MAX_HASH_DISTANCE'])
+        options = recognizer_options(app.config)
+        quality_config = {key: app.config[key] for key in app.config if key.startswith('FACE_QUALITY_')}
+        face_recognition_sys = FaceRecognitionSystem(recognition_cache=recognition_cache,
+                                                     quality_gate=create_quality_gate(quality_config),
+                                                     **options)
+        enrollment_queue = EnrollmentQueue(face_recognition_sys)
+        
+        if app.config['DETECTION_WORKERS'] > 0:
+            print(f"Starting {app.config['DETECTION_WORKERS']} detection worker process(es)...")
+            worker_pool = DetectionWorkerPool(app.config['DETECTION_WORKERS'],
+                                              max_width=app.config['FRAME_RESIZE_MAX_WIDTH'],
+                                              slot_bytes=app.config['WORKER_SLOT_BYTES'],
+                                              slots_per_worker=app.config['WORKER_SLOTS_PER_WORKER'],
+                                              # Workers map the shard files themselves instead of
+                                              # starting their own shard processes
+                                              recognizer_options=dict(options, shard_processes=False),
+                                              quality_config=quality_config,
+                                              buckets=app.config['DETECTOR_INPUT_BUCKETS'],
+                                              warmup_shapes=warmup_shapes,
+                                              thread_config={key: app.config[key] for key in app.config
+                                                             if key.startswith('WORKER_')})
+            worker_pool.wait_ready()
         
         print("✅ Models initialized successfully")
         return True
@@ -51,180 +116,180 @@ def initialize_models():
         print("💡 Try: pip install --upgrade mtcnn tensorflow")
         return False
 
-def visualize_faces(image, detection_results):
-    """Enhanced face visualization with recognition status"""
-    vis_image = image.copy()
-    
-    if not detection_results:
-        cv2.putText(vis_image, "No faces detected", (10, 30), 
-                   cv2.FONT_HERSHEY_SIMPLEX, 1, (0, 0, 255), 2)
-        return vis_image
-
-    for i, face in enumerate(detection_results):
-        try:
-            x, y, width, height = face['box']
-            
-            # Ensure coordinates are within image bounds
-            x = max(0, x)
-            y = max(0, y)
-            width = min(width, image.shape[1] - x)
-            height = min(height, image.shape[0] - y)
-            
-            # Check if this is an authorized person
-            is_authorized = face_recognition_sys.is_authorized_person(image, face)
-            
-            # Color coding: Green for authorized, Red for unauthorized
-            box_color = (0, 255, 0) if is_authorized else (0, 0, 255)
-            status_text = "AUTHORIZED" if is_authorized else "UNAUTHORIZED"
-            
-            # Draw bounding box
-            cv2.rectangle(vis_image, (x, y), (x + width, y + height), box_color, 2)
-
-            # Draw confidence score and status
-            confidence = face['confidence']
-            cv2.putText(vis_image, f'Face {i+1}: {confidence:.3f}',
-                        (x, y - 25), cv2.FONT_HERSHEY_SIMPLEX, 0.6,
-                        box_color, 2)
-            
-            cv2.putText(vis_image, status_text,
-                        (x, y - 5), cv2.FONT_HERSHEY_SIMPLEX, 0.6,
-                        box_color, 2)
+def is_face_authorized(frame, face):
+    """Use the worker's recognition result when present, otherwise recognize in-process"""
+    if 'authorized' in face:
+        return face['authorized']
+    reuse_track_age = None
+    if overload is not None and overload.policy['skip_known_tracks']:
+        reuse_track_age = overload.track_result_max_age
+    return face_recognition_sys.is_authorized_person(frame, face, reuse_track_age)
 
-            # Draw keypoints if available
-            if 'keypoints' in face:
-                keypoints = face['keypoints']
-                colors = {
-                    'left_eye': (255, 0, 0),
-                    'right_eye': (255, 0, 0),
-                    'nose': (0, 255, 255),
-                    'mouth_left': (0, 0, 255),
-                    'mouth_right': (0, 0, 255)
-                }
-                
-                for key, (kx, ky) in keypoints.items():
-                    color = colors.get(key, (255, 255, 255))
-                    cv2.circle(vis_image, (int(kx), int(ky)), 3, color, -1)
-                    
-        except Exception as e:
-            print(f"Error visualizing face {i}: {e}")
-            continue
+def visualize_faces(image, detection_results):
+    """Enhanced face visualization with recognition status (labels come from cached sprites)"""
+    return overlay_renderer.render(image, detection_results, is_face_authorized)
 
-    return vis_image
+def report_unauthorized_faces(snapshot):
+    """Start or extend an event clip when a detected face is not authorized"""
+    unauthorized = [face for face in snapshot.faces if not is_face_authorized(snapshot.frame, face)]
+    if unauthorized:
+        event_recorder.trigger('unauthorized', unauthorized)
 
 def capture_frames():
     """Background thread function to capture and process frames"""
-    global camera, current_frame, detection_results, detection_active
+    global camera, detection_active, detection_gate, multires_detector, event_recorder, track_results
     
     frame_count = 0
     last_detection_results = []
+    last_worker_seq = None
+    tracker = FaceTracker(iou_threshold=app.config['TRACKER_IOU_THRESHOLD'],
+                          max_missed=app.config['TRACKER_MAX_MISSED'])
+    # ROI/motion gating decides whether and where the detector runs
+    detection_gate = create_detection_gate(app.config)
+    # Coarse-to-fine detection replaces the single fixed-scale pass when enabled
+    multires_detector = create_coarse_to_fine_detector(detector, app.config)
+    # Pre-roll buffer for evidence clips of unauthorized faces
+    event_recorder = create_event_recorder(app.config)
+    # Workers cannot defer low-quality faces themselves (no track IDs there), so it happens here
+    track_results = None
+    if worker_pool is not None and app.config['FACE_QUALITY_MODE'] == 'defer':
+        track_results = TrackResultMemory(app.config['RECOGNITION_CACHE_TTL'])
     
     while detection_active:
+        if camera is not None and not camera.isOpened():
+            # A non-looping replay ended (or the source gave up): stop as /stop_detection does
+            print("📷 Frame source ended, stopping detection")
+            detection_active = False
+            source, camera = camera, None
+            source.release()
+            pipeline.reset()
+            break
         if camera is not None and camera.isOpened():
-            ret, frame = camera.read()
+            with tracer.span('capture', frame=frame_count + 1):
+                ret, frame = camera.read()
             if ret:
-                current_frame = frame.copy()
                 frame_count += 1
+                new_results = False
+                detect_every = app.config['PROCESS_EVERY_N_FRAMES']
+                if overload is not None:
+                    detect_every = overload.detection_interval(detect_every)
                 
                 # Process frame for face detection (every nth frame for performance)
-                if frame_count % app.config['PROCESS_EVERY_N_FRAMES'] == 0:
+                if worker_pool is not None:
+                    # Frames are dropped while every worker slot is busy
+                    if frame_count % detect_every == 0:
+                        # Workers detect on whole frames, so the gate can only skip here
+                        if detection_gate is None or detection_gate.plan(frame) is not None:
+                            worker_pool.submit(frame)
+                    
+                    latest = worker_pool.latest_result()
+                    if latest is not None and latest['seq'] != last_worker_seq:
+                        last_worker_seq = latest['seq']
+                        if 'error' in latest:
+                            print(f"Error during face detection: {latest['error']}")
+                        else:
+                            last_detection_results = tracker.update(latest['faces'])
+                            if track_results is not None:
+                                last_detection_results = track_results.apply(last_detection_results)
+                            new_results = True
+                
+                elif frame_count % detect_every == 0:
                     try:
-                        # Validate frame
-                        if frame is None or frame.size == 0:
-                            print("Invalid frame detected, skipping...")
-                            detection_results = last_detection_results
-                            continue
-                        
-                        height, width = frame.shape[:2]
-                        
-                        # Ensure minimum frame size
-                        if height < 24 or width < 24:
-                            print(f"Frame too small ({width}x{height}), skipping...")
-                            detection_results = last_detection_results
-                            continue
-                        
-                        # Resize frame for optimal processing
-                        target_width = min(width, app.config['FRAME_RESIZE_MAX_WIDTH'])
-                        if width > target_width:
-                            scale = target_width / width
-                            new_width = int(width * scale)
-                            new_height = int(height * scale)
-                            
-                            # Ensure dimensions are even numbers and minimum size
-                            new_width = max(48, new_width - (new_width % 2))
-                            new_height = max(48, new_height - (new_height % 2))
-                            
-                            frame_resized = cv2.resize(frame, (new_width, new_height), interpolation=cv2.INTER_AREA)
+                        regions = detection_gate.plan(frame) if detection_gate is not None else None
+                        if detection_gate is not None and regions is None:
+                            # No motion in the ROIs: keep the previous results
+                            result = None
+                        elif multires_detector is not None:
+                            result = multires_detector.detect(frame, regions)
+                        elif regions is not None:
+                            result = detect_faces_in_regions(detector, frame, regions,
+                                                             app.config['FRAME_RESIZE_MAX_WIDTH'],
+                                                             app.config['DETECTOR_INPUT_BUCKETS'])
                         else:
-                            frame_resized = frame.copy()
-                            scale = 1.0
-                        
-                        # Additional validation after resize
-                        if frame_resized.shape[0] < 48 or frame_resized.shape[1] < 48:
-                            print("Resized frame too small, skipping...")
-                            detection_results = last_detection_results
-                            continue
-                        
-                        # Convert BGR to RGB for MTCNN
-                        rgb_frame = cv2.cvtColor(frame_resized, cv2.COLOR_BGR2RGB)
-                        
-                        # Ensure the frame is contiguous in memory
-                        rgb_frame = np.ascontiguousarray(rgb_frame)
-                        
-                        # Detect faces with timeout protection
-                        result = detector.detect_faces(rgb_frame)
-                        
-                        # Validate detection results
-                        if result is None:
-                            result = []
-                        
-                        # Scale back coordinates if frame was resized
-                        if scale != 1.0 and len(result) > 0:
-                            for face in result:
-                                if 'box' in face and len(face['box']) >= 4:
-                                    face['box'][0] = int(face['box'][0] / scale)
-                                    face['box'][1] = int(face['box'][1] / scale)
-                                    face['box'][2] = int(face['box'][2] / scale)
-                                    face['box'][3] = int(face['box'][3] / scale)
-                                    
-                                    if 'keypoints' in face:
-                                        for key, (x, y) in face['keypoints'].items():
-                                            face['keypoints'][key] = (int(x / scale), int(y / scale))
-                        
-                        detection_results = result
-                        last_detection_results = result.copy() if result else []
-                        
+                            result = detect_faces_in_frame(detector, frame,
+                                                           app.config['FRAME_RESIZE_MAX_WIDTH'],
+                                                           app.config['DETECTOR_INPUT_BUCKETS'])
+                        if result is not None:
+                            # Track IDs let recognition reuse cached matches
+                            last_detection_results = tracker.update(result)
+                            new_results = True
                     except Exception as e:
+                        # Keep the last known good results instead of an empty list
                         print(f"Error during face detection: {e}")
-                        # Use last known good results instead of empty list
-                        detection_results = last_detection_results
-                else:
-                    # Use previous results for non-processing frames
-                    detection_results = last_detection_results
+                
+                # Frame and results go out together; nothing is mutated after this
+                captured = getattr(camera, 'captured_at', None)
+                snapshot = pipeline.publish(frame, last_detection_results, captured)
+                lag_ms = (snapshot.timestamp - snapshot.captured) * 1000
+                latency['publish'].add(lag_ms)
+                if overload is not None:
+                    overload.observe_lag(lag_ms)
+                    overload.update()
+                
+                if event_recorder is not None:
+                    event_recorder.add_frame(snapshot)
+                    if new_results:
+                        report_unauthorized_faces(snapshot)
         
-        time.sleep(0.033)  # ~30 FPS
+        # A threaded capture's read() already waits for the next frame
+        if not isinstance(camera, ThreadedCapture) or not camera.isOpened():
+            time.sleep(0.033)  # ~30 FPS
+    
+    if event_recorder is not None:
+        # Save the clip in progress
+        event_recorder.close()
+
+def render_stream_chunk(snapshot, encoder):
+    """Draw the overlay for a snapshot and encode it as one multipart MJPEG chunk"""
+    if overload is not None:
+        encoder.set_quality(overload.jpeg_quality(app.config['JPEG_QUALITY']))
+    
+    # Create visualization (in client mode the browser draws the boxes from /overlay_data)
+    if app.config['OVERLAY_MODE'] == 'client':
+        vis_frame = snapshot.frame
+    else:
+        with tracer.span('overlay', seq=snapshot.seq):
+            vis_frame = visualize_faces(snapshot.frame, snapshot.faces)
+    
+    # Encode frame
+    with tracer.span('encode', seq=snapshot.seq):
+        frame_bytes = encoder.encode(vis_frame)
+    if frame_bytes is None:
+        return None
+    # Glass-to-glass up to the server's output: grab to encoded chunk
+    latency['stream'].add((time.time() - snapshot.captured) * 1000)
+    return b''.join((b'--frame\r\n'
+                     b'Content-Type: image/jpeg\r\n\r\n', frame_bytes, b'\r\n'))
 
 def generate_frames():
     """Generate frames for video streaming"""
-    global current_frame, detection_results
+    # One encoder per stream so its output buffer can be reused between frames
+    encoder = create_jpeg_encoder(app.config['JPEG_ENCODER'], app.config['JPEG_QUALITY'],
+                                  app.config['TURBOJPEG_LIB_PATH'])
+    last_seq = None
+    last_sent = 0.0
     
     while detection_active:
-        if current_frame is not None:
-            # Create visualization
-            vis_frame = visualize_faces(current_frame, detection_results)
-            
-            # Encode frame
-            ret, buffer = cv2.imencode('.jpg', vis_frame)
-            if ret:
-                frame_bytes = buffer.tobytes()
-                yield (b'--frame\r\n'
-                       b'Content-Type: image/jpeg\r\n\r\n' + frame_bytes + b'\r\n')
+        snapshot = pipeline.wait_for_update(last_seq, timeout=1.0)
+        
+        # Only render and encode frames this viewer has not seen yet
+        if snapshot.seq == last_seq or snapshot.frame is None:
+            continue
+        last_seq = snapshot.seq
         
-        time.sleep(0.033)  # ~30 FPS
+        # Under overload the stream frame rate is capped
+        if overload is not None and snapshot.timestamp - last_sent < overload.stream_interval():
+            continue
+        last_sent = snapshot.timestamp
+        
+        chunk = render_stream_chunk(snapshot, encoder)
+        if chunk is not None:
+            yield chunk
 
 @app.route('/')
 def index():
     """Main page"""
-    return render_template('index.html')
+    return render_template('index.html', overlay_mode=app.config['OVERLAY_MODE'])
 
 @app.route('/dashboard')
 def dashboard():
@@ -238,13 +303,12 @@ def start_detection():
     
     if not detection_active:
         try:
-            camera = cv2.VideoCapture(app.config['CAMERA_INDEX'])
-            camera.set(cv2.CAP_PROP_FRAME_WIDTH, app.config['CAMERA_WIDTH'])
-            camera.set(cv2.CAP_PROP_FRAME_HEIGHT, app.config['CAMERA_HEIGHT'])
-            camera.set(cv2.CAP_PROP_FPS, app.config['CAMERA_FPS'])
+            camera = create_frame_source(app.config)
             
             if camera.isOpened():
                 detection_active = True
+                if overload is not None:
+                    overload.reset()
                 # Start background thread for frame capture
                 threading.Thread(target=capture_frames, daemon=True).start()
                 return jsonify({"status": "success", "message": "Detection started"})
@@ -267,40 +331,166 @@ def stop_detection():
         camera.release()
         camera = None
     
+    pipeline.reset()
+    
     return jsonify({"status": "success", "message": "Detection stopped"})
 
 @app.route('/video_feed')
 def video_feed():
     """Video streaming route"""
-    return Response(generate_frames(),
-                    mimetype='multipart/x-mixed-replace; boundary=frame')
+    if overload is not None and not overload.acquire_viewer():
+        return jsonify({"status": "error", "message": "Server overloaded, too many viewers"}), 503
+    response = Response(generate_frames(),
+                        mimetype='multipart/x-mixed-replace; boundary=frame')
+    if overload is not None:
+        response.call_on_close(overload.release_viewer)
+    return response
 
-@app.route('/detection_status')
-def detection_status():
-    """Get current detection status"""
-    global detection_results
+def build_detection_status():
+    """Build the detection status dict from the latest pipeline snapshot"""
+    snapshot = pipeline.latest()
     
     status = {
         "active": detection_active,
-        "faces_detected": len(detection_results),
+        "sequence": snapshot.seq,
+        "timestamp": snapshot.timestamp,
+        "faces_detected": len(snapshot.faces),
         "faces": []
     }
     
-    for i, face in enumerate(detection_results):
+    for i, face in enumerate(snapshot.faces):
         face_info = {
             "id": i + 1,
             "confidence": face['confidence'],
-            "box": face['box']
+            "box": face['box'],
+            "track_id": face.get('track_id')
         }
         
         # Check authorization status
-        if current_frame is not None:
-            is_authorized = face_recognition_sys.is_authorized_person(current_frame, face)
+        if snapshot.frame is not None:
+            is_authorized = is_face_authorized(snapshot.frame, face)
             face_info["authorized"] = is_authorized
         
         status["faces"].append(face_info)
     
-    return jsonify(status)
+    if face_recognition_sys is not None:
+        status["recognition_cache"] = face_recognition_sys.get_cache_stats()
+        quality = [face_recognition_sys.get_quality_stats()]
+        if worker_pool is not None:
+            quality.append(worker_pool.quality_stats())
+        status["face_quality"] = merge_quality_stats(quality)
+        if status["face_quality"] is not None and track_results is not None:
+            status["face_quality"]["deferred"] += track_results.deferred
+    
+    if detection_gate is not None:
+        status["detection_gate"] = detection_gate.get_stats()
+    
+    if multires_detector is not None:
+        status["coarse_to_fine"] = multires_detector.get_stats()
+    
+    if event_recorder is not None:
+        status["event_recorder"] = event_recorder.get_stats()
+    
+    if isinstance(camera, ThreadedCapture):
+        status["capture"] = camera.get_stats()
+    status["latency"] = {stage: window.summary() for stage, window in latency.items()}
+    
+    if overload is not None:
+        status["overload"] = overload.get_stats()
+    
+    status["overlay"] = dict(overlay_renderer.get_stats(), mode=app.config['OVERLAY_MODE'])
+    status["threads"] = get_thread_stats()
+    
+    return status
+
+@app.route('/overlay_data')
+def overlay_data():
+    """Boxes of the latest snapshot for drawing the overlay in the browser"""
+    snapshot = pipeline.latest()
+    faces = []
+    if snapshot.frame is not None:
+        for face in snapshot.faces:
+            faces.append({
+                "box": [int(v) for v in face['box']],
+                "confidence": float(face['confidence']),
+                "authorized": is_face_authorized(snapshot.frame, face),
+                "keypoints": {key: [int(kx), int(ky)] for key, (kx, ky) in face.get('keypoints', {}).items()},
+            })
+    height, width = snapshot.frame.shape[:2] if snapshot.frame is not None else (0, 0)
+    return jsonify({
+        "sequence": snapshot.seq,
+        "timestamp": snapshot.timestamp,
+        "width": width,
+        "height": height,
+        "faces": faces
+    })
+
+@app.route('/detection_status')
+def detection_status():
+    """Get current detection status"""
+    return jsonify(build_detection_status())
+
+@app.route('/enrollment_status/<job_id>')
+def enrollment_status(job_id):
+    """Status of a queued enrollment job"""
+    job = enrollment_queue.get(job_id) if enrollment_queue is not None else None
+    if job is None:
+        return jsonify({"status": "error", "message": "Unknown enrollment job"}), 404
+    return jsonify(job)
+
+def admin_denied():
+    """Error response unless ADMIN_TOKEN is configured and the request carries it"""
+    token = app.config['ADMIN_TOKEN']
+    if not token:
+        return jsonify({"status": "error", "message": "Admin endpoints are disabled (set ADMIN_TOKEN)"}), 403
+    if request.headers.get('X-Admin-Token', request.args.get('token')) != token:
+        return jsonify({"status": "error", "message": "Admin token required"}), 403
+    return None
+
+@app.route('/admin/trace/start', methods=['GET', 'POST'])
+def start_trace():
+    """Trace every pipeline stage for ?seconds=N, optionally with the sampling profiler (?profile=1)"""
+    denied = admin_denied()
+    if denied is not None:
+        return denied
+    try:
+        seconds = float(request.args.get('seconds', app.config['TRACE_DEFAULT_SECONDS']))
+    except ValueError:
+        return jsonify({"status": "error", "message": "seconds must be a number"}), 400
+    seconds = min(max(seconds, 0.1), app.config['TRACE_MAX_SECONDS'])
+    profile = request.args.get('profile', '0') == '1'
+    
+    tracer.start(seconds, profile=profile,
+                 max_events=app.config['TRACE_MAX_EVENTS'],
+                 profile_interval=app.config['TRACE_PROFILE_INTERVAL'])
+    return jsonify({"status": "started", "seconds": seconds, "profile": profile,
+                    "message": f"Tracing for {seconds:.1f} s; download from /admin/trace"})
+
+@app.route('/admin/trace/status')
+def trace_status():
+    """State of the current or last tracing window with per-stage totals"""
+    denied = admin_denied()
+    if denied is not None:
+        return denied
+    return jsonify(tracer.get_stats())
+
+@app.route('/admin/trace')
+def download_trace():
+    """Spans of the last window as Chrome trace-event JSON (chrome://tracing, Perfetto)"""
+    denied = admin_denied()
+    if denied is not None:
+        return denied
+    response = jsonify(tracer.chrome_trace())
+    response.headers['Content-Disposition'] = f"attachment; filename=trace_{int(time.time())}.json"
+    return response
+
+@app.route('/admin/trace/profile')
+def download_profile():
+    """Sampling profiler stacks of the last window in collapsed format (flamegraph.pl, speedscope)"""
+    denied = admin_denied()
+    if denied is not None:
+        return denied
+    return Response(tracer.collapsed_stacks(), mimetype='text/plain')
 
 @app.route('/add_user', methods=['POST'])
 def add_user():
@@ -327,10 +517,15 @@ def add_user():
         if file.filename == '':
             return jsonify({"status": "error", "message": "No image file selected"})
         
+        # Read the upload into memory; the enrollment worker decodes it with cv2.imdecode
+        image_bytes = file.read()
+        if not image_bytes:
+            return jsonify({"status": "error", "message": "Uploaded file is empty"})
+        
         # Create data directory if it doesn't exist
         os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
         
-        # Save uploaded file with safe filename
+        # The photo is kept under a safe filename once it has been enrolled
         timestamp = int(time.time())
         filename = f"{safe_name}_{timestamp}.jpg"
         filepath = os.path.join(app.config['UPLOAD_FOLDER'], filename)
@@ -338,29 +533,9 @@ def add_user():
         # Ensure the filepath uses forward slashes for cross-platform compatibility
         filepath = filepath.replace('\\', '/')
         
-        try:
-            file.save(filepath)
-            print(f"File saved to: {filepath}")
-        except Exception as save_error:
-            print(f"Error saving file: {save_error}")
-            return jsonify({"status": "error", "message": "Failed to save uploaded file"})
-        
-        # Verify file was saved and can be read
-        if not os.path.exists(filepath):
-            return jsonify({"status": "error", "message": "File was not saved properly"})
-        
-        # Add user to recognition system
-        success = face_recognition_sys.add_authorized_user(name, filepath)
-        
-        if success:
-            return jsonify({"status": "success", "message": f"User {name} added successfully"})
-        else:
-            # Clean up the file if face recognition failed
-            try:
-                os.remove(filepath)
-            except:
-                pass
-            return jsonify({"status": "error", "message": "Failed to process face in image"})
+        job_id = enrollment_queue.submit(name, image_bytes, save_path=filepath)
+        return jsonify({"status": "queued", "job_id": job_id,
+                        "message": f"Enrolling {name}..."}), 202
             
     except Exception as e:
         print(f"Error in add_user: {e}")
@@ -373,7 +548,8 @@ if __name__ == '__main__':
         print("🚀 Face Detection Flask Server")
         print("="*50)
         print(f"🌐 Server URL: http://{app.config['HOST']}:{app.config['PORT']}")
-        print(f"📷 Camera: Index {app.config['CAMERA_INDEX']} ({app.config['CAMERA_WIDTH']}x{app.config['CAMERA_HEIGHT']})")
+        print(f"📷 Camera: Index {app.config['CAMERA_INDEX']} ({app.config['CAMERA_WIDTH']}x{app.config['CAMERA_HEIGHT']})"
+              f" - source: {app.config['FRAME_SOURCE']}")
         print(f"🔍 Detection: MTCNN + OpenCV")
         print(f"💾 Data directory: {app.config['UPLOAD_FOLDER']}")
         print("="*50)
@@ -0,0 +1,232 @@
+#!/usr/bin/env python3
+"""
+Asyncio serving mode for the streaming endpoints.
+
+/video_feed, /detection_status and the /detection_events push stream are
+served by coroutines that wait on a shared frame-ready event instead of
+parking one Werkzeug thread per viewer. Overlay drawing and JPEG encoding
+run once per frame in an executor and the encoded chunk is shared by every
+viewer, so memory and CPU stay flat as viewers are added. All other routes
+are delegated to the Flask app through asgiref's WSGI adapter.
+
+Usage:
+    python asgi_app.py
+    uvicorn asgi_app:application --host 0.0.0.0 --port 5000
+"""
+
+import asyncio
+import json
+from concurrent.futures import ThreadPoolExecutor
+
+from asgiref.wsgi import WsgiToAsgi
+
+import app as flask_module
+from jpeg_encoder import create_jpeg_encoder
+
+MJPEG_HEADERS = [(b'content-type', b'multipart/x-mixed-replace; boundary=frame'),
+                 (b'cache-control', b'no-cache')]
+
+
+class FrameBroadcaster:
+    """Wake waiting coroutines when the pipeline publishes, and share one encode per frame"""
+
+    def __init__(self, publisher, config):
+        self.publisher = publisher
+        self.config = config
+        self.loop = None
+        self._event = None
+        # A single encode thread owns the encoder and its reusable buffer
+        self._encode_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='mjpeg-encode')
+        self._encoder = create_jpeg_encoder(config['JPEG_ENCODER'], config['JPEG_QUALITY'],
+                                            config['TURBOJPEG_LIB_PATH'])
+        self._encoded_seq = None
+        self._encoded_future = None
+        self._encoded_time = 0.0
+        self.viewers = 0
+
+    def start(self, loop):
+        """Attach to the running event loop and subscribe to the pipeline"""
+        self.loop = loop
+        self._event = asyncio.Event()
+        self.publisher.add_listener(self._on_publish)
+
+    def _on_publish(self, snapshot):
+        # Runs on the capture thread
+        self.loop.call_soon_threadsafe(self._frame_ready)
+
+    def _frame_ready(self):
+        event, self._event = self._event, asyncio.Event()
+        event.set()
+
+    async def wait_for_update(self, last_seq, timeout=1.0):
+        """Return the latest snapshot once its seq differs from last_seq (or after timeout)"""
+        event = self._event
+        snapshot = self.publisher.latest()
+        if snapshot.seq != last_seq:
+            return snapshot
+        try:
+            await asyncio.wait_for(event.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+        return self.publisher.latest()
+
+    def _render(self, snapshot):
+        chunk = flask_module.render_stream_chunk(snapshot, self._encoder)
+        # The encoder reuses its buffer, so freeze the chunk before sharing it
+        return bytes(chunk) if chunk is not None else None
+
+    def is_due(self, snapshot, overload):
+        """False for frames skipped by the overload frame rate cap (shared by all viewers)"""
+        if overload is None or snapshot.seq == self._encoded_seq:
+            return True
+        return snapshot.timestamp - self._encoded_time >= overload.stream_interval()
+
+    async def encoded_chunk(self, snapshot):
+        """Encode a snapshot once, no matter how many viewers ask for it"""
+        if self._encoded_seq != snapshot.seq:
+            self._encoded_seq = snapshot.seq
+            self._encoded_time = snapshot.timestamp
+            self._encoded_future = self.loop.run_in_executor(self._encode_executor, self._render, snapshot)
+        return await self._encoded_future
+
+
+async def _watch_disconnect(receive, disconnected):
+    while True:
+        message = await receive()
+        if message['type'] == 'http.disconnect':
+            disconnected.set()
+            return
+
+
+async def _send_json(send, payload, status=200):
+    body = json.dumps(payload).encode('utf-8')
+    await send({'type': 'http.response.start', 'status': status,
+                'headers': [(b'content-type', b'application/json'),
+                            (b'content-length', str(len(body)).encode())]})
+    await send({'type': 'http.response.body', 'body': body})
+
+
+class StreamingApplication:
+    """ASGI application: async streaming endpoints in front of the Flask app"""
+
+    def __init__(self, flask_app, publisher, executor_workers=4):
+        self.wsgi = WsgiToAsgi(flask_app)
+        self.config = flask_app.config
+        self.broadcaster = FrameBroadcaster(publisher, flask_app.config)
+        self.executor = ThreadPoolExecutor(max_workers=executor_workers, thread_name_prefix='asgi-cpu')
+        self._started = False
+
+    async def _startup(self):
+        if self._started:
+            return
+        self._started = True
+        loop = asyncio.get_running_loop()
+        self.broadcaster.start(loop)
+        if flask_module.detector is None:
+            await loop.run_in_executor(self.executor, flask_module.initialize_models)
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            await self._lifespan(receive, send)
+            return
+
+        await self._startup()
+        path = scope.get('path', '')
+        if scope['type'] == 'http' and path == '/video_feed':
+            await self.video_feed(receive, send)
+        elif scope['type'] == 'http' and path == '/detection_status':
+            await self.detection_status(send)
+        elif scope['type'] == 'http' and path == '/detection_events':
+            await self.detection_events(receive, send)
+        else:
+            await self.wsgi(scope, receive, send)
+
+    async def _lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await self._startup()
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    async def video_feed(self, receive, send):
+        """MJPEG stream: one coroutine per viewer, one encode per frame for all viewers"""
+        overload = flask_module.overload
+        if overload is not None and not overload.acquire_viewer():
+            await _send_json(send, {'status': 'error', 'message': 'Server overloaded, too many viewers'}, 503)
+            return
+        disconnected = asyncio.Event()
+        watcher = asyncio.create_task(_watch_disconnect(receive, disconnected))
+        self.broadcaster.viewers += 1
+        try:
+            await send({'type': 'http.response.start', 'status': 200, 'headers': MJPEG_HEADERS})
+            last_seq = None
+            while flask_module.detection_active and not disconnected.is_set():
+                snapshot = await self.broadcaster.wait_for_update(last_seq)
+                if snapshot.seq == last_seq or snapshot.frame is None:
+                    continue
+                last_seq = snapshot.seq
+                if not self.broadcaster.is_due(snapshot, overload):
+                    continue
+
+                chunk = await self.broadcaster.encoded_chunk(snapshot)
+                if chunk is not None:
+                    await send({'type': 'http.response.body', 'body': chunk, 'more_body': True})
+            await send({'type': 'http.response.body', 'body': b''})
+        finally:
+            self.broadcaster.viewers -= 1
+            if overload is not None:
+                overload.release_viewer()
+            watcher.cancel()
+
+    async def detection_status(self, send):
+        """Status JSON, computed off the event loop (recognition is CPU work)"""
+        loop = asyncio.get_running_loop()
+        status = await loop.run_in_executor(self.executor, flask_module.build_detection_status)
+        status['viewers'] = self.broadcaster.viewers
+        await _send_json(send, status)
+
+    async def detection_events(self, receive, send):
+        """Server-sent events: push the status whenever detection results change"""
+        disconnected = asyncio.Event()
+        watcher = asyncio.create_task(_watch_disconnect(receive, disconnected))
+        loop = asyncio.get_running_loop()
+        interval = self.config['STATUS_PUSH_INTERVAL']
+        try:
+            await send({'type': 'http.response.start', 'status': 200,
+                        'headers': [(b'content-type', b'text/event-stream'), (b'cache-control', b'no-cache')]})
+            last_seq = None
+            last_faces = None
+            while not disconnected.is_set():
+                snapshot = await self.broadcaster.wait_for_update(last_seq)
+                last_seq = snapshot.seq
+                # Frames change 30 times a second; only push when the detections change
+                if snapshot.faces != last_faces:
+                    last_faces = snapshot.faces
+                    status = await loop.run_in_executor(self.executor, flask_module.build_detection_status)
+                    payload = f"data: {json.dumps(status)}\n\n".encode('utf-8')
+                    await send({'type': 'http.response.body', 'body': payload, 'more_body': True})
+                await asyncio.sleep(interval)
+        finally:
+            watcher.cancel()
+
+
+application = StreamingApplication(flask_module.app, flask_module.pipeline,
+                                   executor_workers=flask_module.app.config['ASGI_EXECUTOR_WORKERS'])
+
+
+if __name__ == '__main__':
+    import uvicorn
+
+    config = flask_module.app.config
+    if flask_module.initialize_models():
+        print("=" * 50)
+        print("🚀 Face Detection ASGI Server")
+        print("=" * 50)
+        print(f"🌐 Server URL: http://{config['HOST']}:{config['PORT']}")
+        print("=" * 50)
+        uvicorn.run(application, host=config['HOST'], port=config['PORT'], log_level='warning')
+    else:
+        print("❌ Failed to initialize models. Please check your installation.")
@@ -0,0 +1,333 @@
+#!/usr/bin/env python3
+"""
+Headless batch processing of recorded footage for audits.
+
+Runs the same detect -> recognize path as the live server over video files
+and image directories, as fast as the machine allows. Decoding runs in its
+own process and detection/recognition is spread over a pool of worker
+processes, so the three stages overlap. Results are written as JSONL or CSV
+(one row per detected face).
+
+Usage:
+    python batch_process.py footage/door.mp4 snapshots/ -o results.jsonl
+"""
+
+import argparse
+import csv
+import heapq
+import json
+import multiprocessing as mp
+import os
+import queue
+import time
+
+IMAGE_EXTENSIONS = {'.jpg', '.jpeg', '.png', '.bmp', '.gif', '.tif', '.tiff', '.webp'}
+
+CSV_FIELDS = ['source', 'frame', 'timestamp_ms', 'x', 'y', 'width', 'height',
+              'confidence', 'name', 'score']
+
+# Worker process state (created once per worker by _init_worker)
+_detector = None
+_recognizer = None
+_max_width = None
+
+
+def iter_inputs(paths):
+    """
+    Expand input paths into (kind, path) entries
+
+    Args:
+        paths: Video files, image files or directories of images
+
+    Returns:
+        List of ('video' | 'image', path) tuples
+    """
+    inputs = []
+    for path in paths:
+        if os.path.isdir(path):
+            for filename in sorted(os.listdir(path)):
+                if os.path.splitext(filename)[1].lower() in IMAGE_EXTENSIONS:
+                    inputs.append(('image', os.path.join(path, filename)))
+        elif os.path.splitext(path)[1].lower() in IMAGE_EXTENSIONS:
+            inputs.append(('image', path))
+        elif os.path.isfile(path):
+            inputs.append(('video', path))
+        else:
+            print(f"Skipping missing input: {path}")
+    return inputs
+
+
+def _read_image(path):
+    """Decode an image file, handling Unicode paths like FaceRecognitionSystem does"""
+    import cv2
+    import numpy as np
+
+    image = cv2.imread(path)
+    if image is None:
+        with open(path, 'rb') as f:
+            image = cv2.imdecode(np.frombuffer(f.read(), np.uint8), cv2.IMREAD_COLOR)
+    return image
+
+
+def decode_frames(inputs, task_queue, every_n, num_workers):
+    """
+    Decode process: push (seq, source, frame_index, timestamp_ms, frame) tasks
+
+    A None sentinel per worker marks the end of the input.
+    """
+    import cv2
+
+    seq = 0
+    try:
+        for kind, path in inputs:
+            if kind == 'image':
+                frame = _read_image(path)
+                if frame is None:
+                    print(f"Could not decode image: {path}")
+                    continue
+                task_queue.put((seq, path, 0, 0.0, frame))
+                seq += 1
+                continue
+
+            capture = cv2.VideoCapture(path)
+            if not capture.isOpened():
+                print(f"Could not open video: {path}")
+                continue
+
+            frame_index = 0
+            while True:
+                # grab() skips decoding of frames we are not going to process
+                if frame_index % every_n != 0:
+                    if not capture.grab():
+                        break
+                    frame_index += 1
+                    continue
+
+                ret, frame = capture.read()
+                if not ret:
+                    break
+                timestamp_ms = capture.get(cv2.CAP_PROP_POS_MSEC)
+                task_queue.put((seq, path, frame_index, timestamp_ms, frame))
+                seq += 1
+                frame_index += 1
+
+            capture.release()
+    finally:
+        for _ in range(num_workers):
+            task_queue.put(None)
+
+
+def _init_worker(max_width):
+    """Create the detector and recognizer once per worker process"""
+    global _detector, _recognizer, _max_width
+    import tensorflow as tf
+    from mtcnn import MTCNN
+    from config import Config
+    from face_recognition_system import FaceRecognitionSystem, recognizer_options
+
+    tf.get_logger().setLevel('ERROR')
+    _detector = MTCNN()
+    # Map the server's gallery read-only: no shard processes, no reload thread
+    _recognizer = FaceRecognitionSystem(**dict(recognizer_options(vars(Config)),
+                                               shard_processes=False, reload_interval=0))
+    _max_width = max_width
+
+
+def process_frame(frame):
+    """
+    Detect and recognize faces in one frame (runs inside a worker)
+
+    Returns:
+        List of lightweight face dicts
+    """
+    from detection_pipeline import detect_faces_in_frame
+
+    faces = detect_faces_in_frame(_detector, frame, _max_width) or []
+    rows = []
+    for face in faces:
+        name, score = _recognizer.recognize_person(frame, face)
+        rows.append({
+            'box': [int(v) for v in face['box']],
+            'confidence': float(face.get('confidence', 0.0)),
+            'name': name,
+            'score': float(score),
+        })
+    return rows
+
+
+def detection_worker(task_queue, result_queue, max_width):
+    """Worker process: consume frames and emit (seq, source, frame, ts, faces)"""
+    _init_worker(max_width)
+    while True:
+        task = task_queue.get()
+        if task is None:
+            result_queue.put(None)
+            break
+
+        seq, source, frame_index, timestamp_ms, frame = task
+        try:
+            faces = process_frame(frame)
+        except Exception as e:
+            print(f"Error processing {source} frame {frame_index}: {e}")
+            faces = []
+        result_queue.put((seq, source, frame_index, timestamp_ms, faces))
+
+
+class ResultWriter:
+    """Write per-face rows as JSONL or CSV, chosen by file extension"""
+
+    def __init__(self, path):
+        self.path = path
+        self.format = 'csv' if path.lower().endswith('.csv') else 'jsonl'
+        self._file = open(path, 'w', newline='', encoding='utf-8')
+        self._csv = None
+        if self.format == 'csv':
+            self._csv = csv.DictWriter(self._file, fieldnames=CSV_FIELDS)
+            self._csv.writeheader()
+
+    def write(self, source, frame_index, timestamp_ms, faces):
+        for face in faces:
+            x, y, width, height = face['box']
+            row = {
+                'source': source,
+                'frame': frame_index,
+                'timestamp_ms': round(timestamp_ms, 1),
+                'x': x, 'y': y, 'width': width, 'height': height,
+                'confidence': round(face['confidence'], 4),
+                'name': face['name'],
+                'score': round(face['score'], 4),
+            }
+            if self._csv is not None:
+                self._csv.writerow(row)
+            else:
+                self._file.write(json.dumps(row, ensure_ascii=False) + '\n')
+
+    def close(self):
+        self._file.close()
+
+
+def run_batch(paths, output, workers=None, every_n=1, max_width=480, queue_size=32):
+    """
+    Process videos/images with a decode process and a pool of detection workers
+
+    Args:
+        paths: Input video files, images or image directories
+        output: Output .jsonl or .csv path
+        workers: Number of detection worker processes (default: CPU count - 1)
+        every_n: Process every Nth video frame
+        max_width: Maximum detector input width
+        queue_size: Maximum number of decoded frames waiting for a worker
+
+    Returns:
+        Dict with frame, face and throughput totals
+    """
+    inputs = iter_inputs(paths)
+    if not inputs:
+        print("No inputs found")
+        return {'frames': 0, 'faces': 0, 'seconds': 0.0, 'fps': 0.0}
+
+    workers = workers or max(1, (os.cpu_count() or 2) - 1)
+
+    # Spawn keeps TensorFlow state from leaking into the children via fork
+    ctx = mp.get_context('spawn')
+    task_queue = ctx.Queue(maxsize=queue_size)
+    result_queue = ctx.Queue()
+
+    decoder = ctx.Process(target=decode_frames, args=(inputs, task_queue, every_n, workers),
+                          daemon=True)
+    pool = [ctx.Process(target=detection_worker, args=(task_queue, result_queue, max_width),
+                        daemon=True) for _ in range(workers)]
+
+    print(f"🎞️  Processing {len(inputs)} input(s) with {workers} worker(s)")
+    writer = ResultWriter(output)
+    start_time = None
+    frames = 0
+    faces = 0
+    finished_workers = 0
+    pending = []
+    next_seq = 0
+    last_report = None
+
+    decoder.start()
+    for process in pool:
+        process.start()
+
+    try:
+        while finished_workers < workers:
+            try:
+                item = result_queue.get(timeout=1.0)
+            except queue.Empty:
+                if not any(p.is_alive() for p in pool):
+                    print("All workers exited unexpectedly")
+                    break
+                continue
+
+            if item is None:
+                finished_workers += 1
+                continue
+
+            # Model loading dominates the first seconds; time from the first result
+            if start_time is None:
+                start_time = last_report = time.perf_counter()
+
+            # Results arrive out of order; write them back in decode order
+            heapq.heappush(pending, item)
+            while pending and pending[0][0] == next_seq:
+                _, source, frame_index, timestamp_ms, frame_faces = heapq.heappop(pending)
+                writer.write(source, frame_index, timestamp_ms, frame_faces)
+                frames += 1
+                faces += len(frame_faces)
+                next_seq += 1
+
+            now = time.perf_counter()
+            if now - last_report >= 5.0:
+                elapsed = now - start_time
+                print(f"  {frames} frames, {faces} faces, {frames / max(elapsed, 1e-9):.1f} frames/s")
+                last_report = now
+
+        # Flush anything left behind a gap (e.g. a worker died mid-frame)
+        while pending:
+            _, source, frame_index, timestamp_ms, frame_faces = heapq.heappop(pending)
+            writer.write(source, frame_index, timestamp_ms, frame_faces)
+            frames += 1
+            faces += len(frame_faces)
+    finally:
+        writer.close()
+        decoder.join(timeout=5)
+        for process in pool:
+            process.join(timeout=5)
+
+    elapsed = time.perf_counter() - start_time if start_time else 0.0
+    fps = frames / elapsed if elapsed > 0 else 0.0
+    return {'frames': frames, 'faces': faces, 'seconds': elapsed, 'fps': fps}
+
+
+def main():
+    """Command line entry point"""
+    from config import Config
+
+    parser = argparse.ArgumentParser(description='Offline face detection/recognition over recorded footage')
+    parser.add_argument('inputs', nargs='+', help='Video files, images or image directories')
+    parser.add_argument('-o', '--output', default='batch_results.jsonl', help='Output .jsonl or .csv file')
+    parser.add_argument('-w', '--workers', type=int, default=None, help='Detection worker processes')
+    parser.add_argument('--every-n', type=int, default=1, help='Process every Nth video frame')
+    parser.add_argument('--max-width', type=int, default=Config.FRAME_RESIZE_MAX_WIDTH,
+                        help='Maximum detector input width')
+    parser.add_argument('--queue-size', type=int, default=32, help='Decoded frames buffered ahead of the workers')
+    args = parser.parse_args()
+
+    print("Batch Face Processing")
+    print("=" * 40)
+    stats = run_batch(args.inputs, args.output, workers=args.workers, every_n=max(1, args.every_n),
+                      max_width=args.max_width, queue_size=args.queue_size)
+
+    print("\n" + "=" * 40)
+    print(f"Frames processed: {stats['frames']}")
+    print(f"Faces found: {stats['faces']}")
+    print(f"Elapsed: {stats['seconds']:.1f}s")
+    print(f"Throughput: {stats['fps']:.1f} frames/s")
+    print(f"💾 Results written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
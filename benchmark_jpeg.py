@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+"""
+Benchmark the available JPEG encoders used by the video stream across
+resolutions and quality settings (CPU only, no camera required)
+"""
+
+import argparse
+import json
+import time
+
+import cv2
+import numpy as np
+
+from jpeg_encoder import available_encoders, create_jpeg_encoder
+
+RESOLUTIONS = [
+    (320, 240),
+    (640, 480),
+    (1280, 720),
+    (1920, 1080),
+]
+
+QUALITIES = [50, 80, 95]
+
+
+def make_test_frame(width, height, seed=0):
+    """
+    Create a deterministic camera-like frame (smooth gradients, shapes and sensor noise)
+
+    Args:
+        width: Frame width
+        height: Frame height
+        seed: Random seed for the noise
+
+    Returns:
+        BGR uint8 image
+    """
+    rng = np.random.default_rng(seed)
+    xs = np.linspace(0, 255, width, dtype=np.float32)
+    ys = np.linspace(0, 255, height, dtype=np.float32)
+    frame = np.empty((height, width, 3), dtype=np.float32)
+    frame[..., 0] = xs[None, :]
+    frame[..., 1] = ys[:, None]
+    frame[..., 2] = (xs[None, :] + ys[:, None]) / 2
+    frame += rng.normal(0, 6, frame.shape).astype(np.float32)
+    frame = np.clip(frame, 0, 255).astype(np.uint8)
+
+    # Add a few face-sized shapes so the encoder sees edges as well as gradients
+    for i in range(4):
+        center = (int(width * (i + 1) / 5), height // 2)
+        cv2.circle(frame, center, max(8, min(width, height) // 8), (200, 180, 160), -1)
+        cv2.rectangle(frame, (center[0] - 20, center[1] - 60), (center[0] + 20, center[1] - 40),
+                      (30, 30, 30), -1)
+    return frame
+
+
+def benchmark_encoder(encoder, frame, iterations):
+    """
+    Time repeated encodes of one frame
+
+    Returns:
+        Dict with mean/p95 latency in ms, frames per second and output size
+    """
+    # Warm-up (allocates the reusable output buffer)
+    data = encoder.encode(frame)
+
+    timings = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        data = encoder.encode(frame)
+        timings.append(time.perf_counter() - start)
+
+    timings = np.array(timings) * 1000
+    return {
+        'mean_ms': float(timings.mean()),
+        'p95_ms': float(np.percentile(timings, 95)),
+        'fps': float(1000 / timings.mean()),
+        'bytes': len(data) if data is not None else 0,
+    }
+
+
+def main():
+    """Run the encoder benchmark and print a table (optionally writing JSON)"""
+    parser = argparse.ArgumentParser(description='Benchmark JPEG encoders for the MJPEG stream')
+    parser.add_argument('--iterations', type=int, default=50, help='Encodes per configuration')
+    parser.add_argument('--encoders', nargs='*', help='Encoders to test (default: all available)')
+    parser.add_argument('--turbojpeg-lib', help='Path to libturbojpeg')
+    parser.add_argument('--json', help='Write results to this JSON file')
+    args = parser.parse_args()
+
+    encoders = args.encoders or available_encoders(args.turbojpeg_lib)
+    print("🧪 JPEG Encoder Benchmark")
+    print("=" * 72)
+    print(f"Encoders: {', '.join(encoders)}")
+    print(f"OpenCV threads: {cv2.getNumThreads()}")
+    print("=" * 72)
+    print(f"{'encoder':<12}{'resolution':<12}{'quality':>8}{'mean ms':>10}{'p95 ms':>10}{'fps':>9}{'KB':>9}")
+
+    results = []
+    for width, height in RESOLUTIONS:
+        frame = make_test_frame(width, height)
+        for quality in QUALITIES:
+            for name in encoders:
+                encoder = create_jpeg_encoder(name, quality, args.turbojpeg_lib)
+                if encoder.name != name:
+                    print(f"{name:<12}unavailable, skipped")
+                    continue
+
+                stats = benchmark_encoder(encoder, frame, args.iterations)
+                stats.update({'encoder': name, 'width': width, 'height': height, 'quality': quality})
+                results.append(stats)
+                print(f"{name:<12}{f'{width}x{height}':<12}{quality:>8}"
+                      f"{stats['mean_ms']:>10.2f}{stats['p95_ms']:>10.2f}"
+                      f"{stats['fps']:>9.1f}{stats['bytes'] / 1024:>9.1f}")
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2)
+        print(f"\n💾 Results written to {args.json}")
+
+    print("\n🏁 Benchmark completed!")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,363 @@
+#!/usr/bin/env python3
+"""
+Reproducible benchmark suite for the detect -> recognize hot path.
+
+Runs on a fixed corpus (seeded synthetic frames plus the images in data/),
+never opens a camera, and writes JSON so results can be compared across
+commits:
+
+    python benchmark_suite.py --output bench_before.json
+    python benchmark_suite.py --output bench_after.json --compare bench_before.json
+"""
+
+import argparse
+import glob
+import json
+import os
+import platform
+import subprocess
+import time
+
+import cv2
+import numpy as np
+
+DETECTOR_WIDTHS = [320, 480, 640, 960, 1280]
+SINGLE_SCALE_WIDTHS = [480, 720, 1080]  # Compared against coarse-to-fine on a 1920x1080 scene
+SCENE_FACE_HEIGHTS = [480, 240, 120, 60]  # Face image heights pasted into the multi-scale scene
+GALLERY_SIZES = [10, 100, 500, 2000]  # 10k-dim features: 2000 ids x 2 samples is ~160 MB
+FEATURE_DIM = 100 * 100  # extract_face_features output length
+SEED = 1234
+
+
+def summarize(timings):
+    """Reduce a list of durations (seconds) to millisecond statistics"""
+    ms = np.asarray(timings, dtype=np.float64) * 1000
+    return {
+        'runs': int(len(ms)),
+        'mean_ms': float(ms.mean()),
+        'median_ms': float(np.median(ms)),
+        'p95_ms': float(np.percentile(ms, 95)),
+        'min_ms': float(ms.min()),
+    }
+
+
+def time_call(func, repeats, warmup=1):
+    """Time func() repeatedly after a warm-up and return summarize() stats"""
+    for _ in range(warmup):
+        func()
+    timings = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+    return summarize(timings)
+
+
+def load_corpus(width=640, height=480, synthetic=4):
+    """
+    Build the fixed frame corpus: data/ images plus seeded synthetic frames
+
+    Returns:
+        List of BGR frames of the given size
+    """
+    frames = []
+    for path in sorted(glob.glob(os.path.join('data', '*.jpg'))):
+        with open(path, 'rb') as f:
+            image = cv2.imdecode(np.frombuffer(f.read(), np.uint8), cv2.IMREAD_COLOR)
+        if image is not None:
+            frames.append(cv2.resize(image, (width, height), interpolation=cv2.INTER_AREA))
+
+    rng = np.random.default_rng(SEED)
+    for i in range(synthetic):
+        frame = rng.integers(0, 255, (height, width, 3), dtype=np.uint8)
+        frame = cv2.GaussianBlur(frame, (9, 9), 0)
+        center = (width // 2 + (i - synthetic // 2) * 40, height // 2)
+        cv2.circle(frame, center, min(width, height) // 6, (200, 180, 160), -1)
+        frames.append(frame)
+    return frames
+
+
+def build_multiscale_scene(width=1920, height=1080):
+    """
+    Paste the data/ images at decreasing sizes into one 1080p frame
+
+    Returns:
+        Tuple of (frame, number of pasted images)
+    """
+    rng = np.random.default_rng(SEED)
+    scene = cv2.GaussianBlur(rng.integers(60, 120, (height, width, 3), dtype=np.uint8), (9, 9), 0)
+    images = []
+    for path in sorted(glob.glob(os.path.join('data', '*.jpg'))):
+        with open(path, 'rb') as f:
+            image = cv2.imdecode(np.frombuffer(f.read(), np.uint8), cv2.IMREAD_COLOR)
+        if image is not None:
+            images.append(image)
+    if not images:
+        return scene, 0
+
+    x = 20
+    for i, target_height in enumerate(SCENE_FACE_HEIGHTS):
+        image = images[i % len(images)]
+        target_width = int(image.shape[1] * target_height / image.shape[0])
+        if x + target_width > width:
+            break
+        y = (height - target_height) // 2
+        scene[y:y + target_height, x:x + target_width] = cv2.resize(image, (target_width, target_height),
+                                                                      interpolation=cv2.INTER_AREA)
+        x += target_width + 40
+    return scene, i + 1
+
+
+def environment_info():
+    """Machine and code version metadata recorded with each run"""
+    try:
+        commit = subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'],
+                                         stderr=subprocess.DEVNULL).decode().strip()
+    except Exception:
+        commit = None
+
+    info = {
+        'commit': commit,
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'opencv': cv2.__version__,
+        'opencv_threads': cv2.getNumThreads(),
+        'numpy': np.__version__,
+    }
+    try:
+        import tensorflow as tf
+        info['tensorflow'] = tf.__version__
+    except Exception:
+        info['tensorflow'] = None
+    return info
+
+
+def bench_detector(detector, corpus, repeats):
+    """Detector latency by input width"""
+    from detection_pipeline import detect_faces_in_frame
+
+    results = {}
+    base = corpus[0]
+    for width in DETECTOR_WIDTHS:
+        height = int(base.shape[0] * width / base.shape[1])
+        frame = cv2.resize(base, (width, height))
+        # max_width == width so the frame is detected at exactly this size
+        results[str(width)] = time_call(lambda: detect_faces_in_frame(detector, frame, width), repeats)
+    return results
+
+
+def bench_multiresolution(detector, repeats):
+    """Single-scale detection at several widths vs coarse-to-fine on a 1080p multi-size scene"""
+    from detection_pipeline import CoarseToFineDetector, detect_faces_in_frame
+
+    scene, pasted = build_multiscale_scene()
+    results = {'scene': {'width': scene.shape[1], 'height': scene.shape[0], 'pasted_faces': pasted}}
+
+    for width in SINGLE_SCALE_WIDTHS:
+        stats = time_call(lambda: detect_faces_in_frame(detector, scene, width), repeats)
+        stats['faces'] = len(detect_faces_in_frame(detector, scene, width) or [])
+        results[f'single_{width}'] = stats
+
+    multires = CoarseToFineDetector(detector)
+    stats = time_call(lambda: multires.detect(scene), repeats)
+    stats['faces'] = len(multires.detect(scene) or [])
+    results['coarse_to_fine'] = stats
+    return results
+
+
+def bench_features(recognizer, corpus, repeats):
+    """extract_face_features throughput on fixed face-sized crops"""
+    crops = [frame[100:300, 200:400] for frame in corpus]
+    stats = time_call(lambda: [recognizer.extract_face_features(crop) for crop in crops], repeats)
+    stats['per_face_ms'] = stats['mean_ms'] / len(crops)
+    stats['faces_per_s'] = 1000 / stats['per_face_ms']
+    return stats
+
+
+def bench_gallery(repeats, samples_per_identity=2):
+    """Gallery match latency by number of identities"""
+    from face_gallery import IdentityGallery
+
+    rng = np.random.default_rng(SEED)
+    query = rng.random(FEATURE_DIM, dtype=np.float32)
+    query /= np.linalg.norm(query)
+
+    results = {}
+    for size in GALLERY_SIZES:
+        gallery = IdentityGallery()
+        identities = {}
+        for i in range(size):
+            samples = rng.random((samples_per_identity, FEATURE_DIM), dtype=np.float32)
+            identities[f'person_{i}'] = samples / np.linalg.norm(samples, axis=1, keepdims=True)
+        gallery.load_dict(identities)
+        gallery.match(query)  # warm-up
+        results[str(size)] = time_call(lambda: gallery.match(query), repeats)
+    return results
+
+
+def bench_sharded_gallery(repeats, num_shards=None, samples_per_identity=2):
+    """Scatter/gather match latency of a process-sharded gallery by number of identities"""
+    import shutil
+    import tempfile
+    from sharded_gallery import ShardedGallery
+
+    num_shards = num_shards or max(2, min(4, os.cpu_count() or 1))
+    rng = np.random.default_rng(SEED)
+    query = rng.random(FEATURE_DIM, dtype=np.float32)
+    query /= np.linalg.norm(query)
+
+    results = {'shards': num_shards}
+    shard_dir = tempfile.mkdtemp(prefix='bench_shards_')
+    gallery = ShardedGallery(num_shards, shard_dir)
+    try:
+        for size in GALLERY_SIZES:
+            identities = {}
+            for i in range(size):
+                samples = rng.random((samples_per_identity, FEATURE_DIM), dtype=np.float32)
+                identities[f'person_{i}'] = samples / np.linalg.norm(samples, axis=1, keepdims=True)
+            gallery.load_dict(identities)
+            results[str(size)] = time_call(lambda: gallery.match(query), repeats)
+    finally:
+        gallery.close()
+        shutil.rmtree(shard_dir, ignore_errors=True)
+    return results
+
+
+def bench_overlay_and_encode(app_module, corpus, faces, repeats):
+    """visualize_faces and JPEG encode cost on a 640x480 frame"""
+    from jpeg_encoder import available_encoders, create_jpeg_encoder
+
+    frame = corpus[0]
+    results = {'overlay': time_call(lambda: app_module.visualize_faces(frame, faces), repeats)}
+
+    vis_frame = app_module.visualize_faces(frame, faces)
+    for name in available_encoders():
+        encoder = create_jpeg_encoder(name, app_module.app.config['JPEG_QUALITY'])
+        results[f'encode_{name}'] = time_call(lambda: encoder.encode(vis_frame), repeats)
+    return results
+
+
+def bench_end_to_end(app_module, detector, corpus, frames):
+    """Full detect -> recognize -> overlay -> encode loop over the corpus"""
+    from detection_pipeline import detect_faces_in_frame
+    from jpeg_encoder import create_jpeg_encoder
+
+    config = app_module.app.config
+    encoder = create_jpeg_encoder(config['JPEG_ENCODER'], config['JPEG_QUALITY'])
+    timings = []
+    for i in range(frames):
+        frame = corpus[i % len(corpus)]
+        start = time.perf_counter()
+        faces = detect_faces_in_frame(detector, frame, config['FRAME_RESIZE_MAX_WIDTH']) or []
+        vis_frame = app_module.visualize_faces(frame, faces)
+        encoder.encode(vis_frame)
+        timings.append(time.perf_counter() - start)
+
+    stats = summarize(timings)
+    stats['fps'] = 1000 / stats['mean_ms']
+    return stats
+
+
+def compare(current, baseline, tolerance=0.10):
+    """Print mean_ms changes between two result files, flagging regressions"""
+    print("\n📊 Comparison with baseline "
+          f"({baseline['environment'].get('commit')} -> {current['environment'].get('commit')})")
+
+    def walk(cur, base, path):
+        if isinstance(cur, dict) and 'mean_ms' in cur and isinstance(base, dict) and 'mean_ms' in base:
+            change = (cur['mean_ms'] - base['mean_ms']) / base['mean_ms'] if base['mean_ms'] else 0.0
+            flag = '⚠️ ' if change > tolerance else '   '
+            print(f"{flag}{path:<40}{base['mean_ms']:>10.2f} -> {cur['mean_ms']:>10.2f} ms ({change:+.1%})")
+        elif isinstance(cur, dict) and isinstance(base, dict):
+            for key in cur:
+                if key in base:
+                    walk(cur[key], base[key], f"{path}.{key}" if path else key)
+
+    walk(current['results'], baseline['results'], '')
+
+
+def main():
+    """Run the suite and write JSON results"""
+    parser = argparse.ArgumentParser(description='Benchmark the detect -> recognize hot path')
+    parser.add_argument('--output', default='benchmark_results.json', help='JSON results file')
+    parser.add_argument('--compare', help='Baseline JSON file to compare against')
+    parser.add_argument('--repeats', type=int, default=20, help='Timed repetitions per measurement')
+    parser.add_argument('--frames', type=int, default=50, help='Frames for the end-to-end run')
+    parser.add_argument('--quick', action='store_true', help='Fewer repetitions for a fast sanity run')
+    args = parser.parse_args()
+
+    repeats = 3 if args.quick else args.repeats
+    frames = 10 if args.quick else args.frames
+
+    # Heavy imports are deferred so --help stays fast
+    import tensorflow as tf
+    from mtcnn import MTCNN
+    import app as app_module
+    from config import Config
+    from face_recognition_system import FaceRecognitionSystem, recognizer_options
+
+    tf.get_logger().setLevel('ERROR')
+
+    print("🧪 Detect -> Recognize Benchmark Suite")
+    print("=" * 50)
+
+    corpus = load_corpus()
+    detector = MTCNN()
+    recognizer = FaceRecognitionSystem(**dict(recognizer_options(vars(Config)),
+                                              shard_processes=False, reload_interval=0))
+    app_module.detector = detector
+    app_module.face_recognition_sys = recognizer
+
+    sample_faces = detector.detect_faces(cv2.cvtColor(corpus[0], cv2.COLOR_BGR2RGB)) or []
+
+    results = {}
+    print("⏱️  Detector latency by resolution...")
+    results['detector'] = bench_detector(detector, corpus, repeats)
+    print("⏱️  Single-scale vs coarse-to-fine detection...")
+    results['multiresolution'] = bench_multiresolution(detector, repeats)
+    print("⏱️  Feature extraction throughput...")
+    results['features'] = bench_features(recognizer, corpus, repeats)
+    print("⏱️  Gallery match latency by size...")
+    results['gallery_match'] = bench_gallery(repeats)
+    print("⏱️  Sharded gallery match latency by size...")
+    results['gallery_match_sharded'] = bench_sharded_gallery(repeats)
+    print("⏱️  Overlay and JPEG encode...")
+    results['overlay_encode'] = bench_overlay_and_encode(app_module, corpus, sample_faces, repeats)
+    print("⏱️  End-to-end pipeline...")
+    results['end_to_end'] = bench_end_to_end(app_module, detector, corpus, frames)
+
+    report = {
+        'environment': environment_info(),
+        'settings': {'repeats': repeats, 'frames': frames, 'corpus_size': len(corpus), 'seed': SEED},
+        'results': results,
+    }
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=2)
+
+    print("\n" + "=" * 50)
+    for width, stats in results['detector'].items():
+        print(f"Detector @{width:>5}px: {stats['mean_ms']:8.1f} ms")
+    for name, stats in results['multiresolution'].items():
+        if name != 'scene':
+            print(f"{name:<16}: {stats['mean_ms']:8.1f} ms, {stats['faces']} faces "
+                  f"(of {results['multiresolution']['scene']['pasted_faces']})")
+    print(f"Features: {results['features']['faces_per_s']:.0f} faces/s")
+    for size, stats in results['gallery_match'].items():
+        print(f"Gallery match ({size:>5} ids): {stats['mean_ms']:8.3f} ms")
+    sharded = results['gallery_match_sharded']
+    for size in GALLERY_SIZES:
+        print(f"Sharded match ({size:>5} ids, {sharded['shards']} shards): {sharded[str(size)]['mean_ms']:8.3f} ms")
+    for name, stats in results['overlay_encode'].items():
+        print(f"{name}: {stats['mean_ms']:.2f} ms")
+    print(f"End-to-end: {results['end_to_end']['fps']:.1f} FPS")
+    print(f"💾 Results written to {args.output}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            compare(report, json.load(f))
+
+
+if __name__ == "__main__":
+    main()
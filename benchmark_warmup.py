@@ -0,0 +1,134 @@
+#!/usr/bin/env python3
+"""
+Benchmark first-frame detector latency with and without input shape buckets.
+
+Every trial starts a fresh process (TensorFlow state is per process), warms
+the detector up the way the server does, then feeds frames at a series of
+camera resolutions. The first frame of a trial and the first frame after
+each resolution change are where shape-dependent setup cost shows up, so
+their p99 is reported next to the steady-state latency:
+
+    python benchmark_warmup.py --trials 5 --json warmup.json
+"""
+
+import argparse
+import json
+import multiprocessing as mp
+import time
+
+import numpy as np
+
+# Camera resolutions the simulated stream switches through
+RESOLUTIONS = [(640, 480), (1280, 720), (1366, 768), (720, 576), (1280, 1024), (320, 240)]
+SEED = 1234
+
+
+def _frames(width, height, count):
+    import cv2
+
+    rng = np.random.default_rng(SEED)
+    frames = []
+    for i in range(count):
+        frame = cv2.GaussianBlur(rng.integers(0, 255, (height, width, 3), dtype=np.uint8), (9, 9), 0)
+        cv2.circle(frame, (width // 2 + i * 8, height // 2), min(width, height) // 6, (200, 180, 160), -1)
+        frames.append(frame)
+    return frames
+
+
+def _trial(mode, max_width, buckets, frames_per_resolution, results):
+    """One fresh-process run: warm up, then time every frame of the resolution sequence"""
+    import tensorflow as tf
+    from mtcnn import MTCNN
+    from detection_pipeline import detect_faces_in_frame, warm_up_detector
+
+    tf.get_logger().setLevel('ERROR')
+    detector = MTCNN()
+    start = time.perf_counter()
+    if mode == 'bucketed':
+        warm_up_detector(detector, buckets)
+    else:
+        # What the server did before buckets: a single 48x48 test image
+        warm_up_detector(detector, [(48, 48)])
+        buckets = None
+    warmup_ms = (time.perf_counter() - start) * 1000
+
+    timings = []
+    for width, height in RESOLUTIONS:
+        resolution = []
+        for frame in _frames(width, height, frames_per_resolution):
+            start = time.perf_counter()
+            detect_faces_in_frame(detector, frame, max_width, buckets)
+            resolution.append((time.perf_counter() - start) * 1000)
+        timings.append(resolution)
+    results.put({'warmup_ms': warmup_ms, 'timings': timings})
+
+
+def _stats(samples):
+    samples = np.asarray(samples, dtype=np.float64)
+    return {
+        'runs': int(len(samples)),
+        'median_ms': float(np.median(samples)),
+        'p99_ms': float(np.percentile(samples, 99)),
+        'max_ms': float(samples.max()),
+    }
+
+
+def run_mode(mode, trials, max_width, buckets, frames_per_resolution):
+    """Run the trials of one mode and summarize first-frame, switch and steady-state latency"""
+    ctx = mp.get_context('spawn')
+    first, switches, steady, warmups = [], [], [], []
+    for _ in range(trials):
+        results = ctx.Queue()
+        process = ctx.Process(target=_trial, args=(mode, max_width, buckets, frames_per_resolution, results))
+        process.start()
+        trial = results.get()
+        process.join()
+
+        warmups.append(trial['warmup_ms'])
+        first.append(trial['timings'][0][0])
+        for resolution in trial['timings']:
+            switches.append(resolution[0])
+            steady.extend(resolution[1:])
+
+    return {
+        'warmup': _stats(warmups),
+        'first_frame': _stats(first),
+        'resolution_switch': _stats(switches),
+        'steady_state': _stats(steady),
+    }
+
+
+def main():
+    """Compare the legacy warm-up with bucketed input shapes"""
+    parser = argparse.ArgumentParser(description='Benchmark first-frame detector latency')
+    parser.add_argument('--trials', type=int, default=5, help='Fresh processes per mode')
+    parser.add_argument('--frames', type=int, default=5, help='Frames per resolution')
+    parser.add_argument('--max-width', type=int, default=480, help='Detector input width')
+    parser.add_argument('--json', help='Write results to this JSON file')
+    args = parser.parse_args()
+
+    from config import Config
+    buckets = Config.DETECTOR_INPUT_BUCKETS
+
+    print("🧪 Detector First-Frame Latency Benchmark")
+    print("=" * 72)
+    print(f"Trials: {args.trials}, resolutions: {len(RESOLUTIONS)}, buckets: {buckets}")
+    print("=" * 72)
+
+    results = {}
+    for mode in ('legacy', 'bucketed'):
+        results[mode] = run_mode(mode, args.trials, args.max_width, buckets, args.frames)
+        for name, stats in results[mode].items():
+            print(f"{mode:<10}{name:<20}median {stats['median_ms']:8.1f} ms   "
+                  f"p99 {stats['p99_ms']:8.1f} ms   max {stats['max_ms']:8.1f} ms")
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump({'buckets': buckets, 'resolutions': RESOLUTIONS, 'results': results}, f, indent=2)
+        print(f"\n💾 Results written to {args.json}")
+
+    print("\n🏁 Benchmark completed!")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,128 @@
+#!/usr/bin/env python3
+"""
+Benchmark detection + recognition throughput of DetectionWorkerPool across
+worker counts, compared with running both in the calling process
+"""
+
+import argparse
+import glob
+import json
+import os
+import time
+
+import cv2
+import numpy as np
+
+from worker_pool import DetectionWorkerPool
+
+
+def load_frames(width, height, count):
+    """
+    Build a list of test frames from data/ images (or synthetic frames if none)
+
+    Returns:
+        List of BGR uint8 frames of the requested size
+    """
+    images = []
+    for path in sorted(glob.glob(os.path.join('data', '*.jpg'))):
+        with open(path, 'rb') as f:
+            image = cv2.imdecode(np.frombuffer(f.read(), np.uint8), cv2.IMREAD_COLOR)
+        if image is not None:
+            images.append(cv2.resize(image, (width, height), interpolation=cv2.INTER_AREA))
+
+    if not images:
+        rng = np.random.default_rng(0)
+        images = [rng.integers(0, 255, (height, width, 3), dtype=np.uint8)]
+
+    return [images[i % len(images)] for i in range(count)]
+
+
+def benchmark_in_process(frames, max_width):
+    """Detect and recognize every frame in this process (the threaded server path)"""
+    import tensorflow as tf
+    from mtcnn import MTCNN
+    from detection_pipeline import detect_faces_in_frame
+    from config import Config
+    from face_recognition_system import FaceRecognitionSystem, recognizer_options
+
+    tf.get_logger().setLevel('ERROR')
+    detector = MTCNN()
+    recognizer = FaceRecognitionSystem(**dict(recognizer_options(vars(Config)),
+                                              shard_processes=False, reload_interval=0))
+    detect_faces_in_frame(detector, frames[0], max_width)
+
+    start = time.perf_counter()
+    for frame in frames:
+        for face in detect_faces_in_frame(detector, frame, max_width) or []:
+            recognizer.recognize_person(frame, face)
+    return time.perf_counter() - start
+
+
+def benchmark_pool(frames, workers, max_width):
+    """Push all frames through a pool with the given worker count"""
+    pool = DetectionWorkerPool(workers, max_width=max_width, slot_bytes=frames[0].nbytes)
+    try:
+        pool.wait_ready()
+        # One warm-up round per worker
+        for seq in [pool.submit(frames[0], block=True) for _ in range(workers)]:
+            pool.get_result(seq)
+
+        start = time.perf_counter()
+        pending = [pool.submit(frame, block=True) for frame in frames]
+        for seq in pending:
+            pool.get_result(seq)
+        return time.perf_counter() - start
+    finally:
+        pool.close()
+
+
+def main():
+    """Run the scaling benchmark"""
+    parser = argparse.ArgumentParser(description='Benchmark detection worker process scaling')
+    parser.add_argument('--frames', type=int, default=60, help='Frames per run')
+    parser.add_argument('--width', type=int, default=640)
+    parser.add_argument('--height', type=int, default=480)
+    parser.add_argument('--max-width', type=int, default=480, help='Detector input width')
+    parser.add_argument('--workers', type=int, nargs='*',
+                        help='Worker counts to test (default: 1, 2, 4, ... up to CPU count)')
+    parser.add_argument('--json', help='Write results to this JSON file')
+    args = parser.parse_args()
+
+    cpu_count = os.cpu_count() or 1
+    worker_counts = args.workers
+    if not worker_counts:
+        worker_counts = []
+        count = 1
+        while count <= cpu_count:
+            worker_counts.append(count)
+            count *= 2
+
+    frames = load_frames(args.width, args.height, args.frames)
+
+    print("🧪 Detection Worker Scaling Benchmark")
+    print("=" * 56)
+    print(f"CPUs: {cpu_count}, frames: {len(frames)} at {args.width}x{args.height}")
+    print("=" * 56)
+
+    results = []
+    elapsed = benchmark_in_process(frames, args.max_width)
+    baseline_fps = len(frames) / elapsed
+    results.append({'mode': 'in-process', 'workers': 0, 'fps': baseline_fps, 'speedup': 1.0})
+    print(f"{'in-process':<14}{baseline_fps:>10.1f} frames/s")
+
+    for workers in worker_counts:
+        elapsed = benchmark_pool(frames, workers, args.max_width)
+        fps = len(frames) / elapsed
+        results.append({'mode': 'pool', 'workers': workers, 'fps': fps, 'speedup': fps / baseline_fps})
+        print(f"{f'{workers} worker(s)':<14}{fps:>10.1f} frames/s   x{fps / baseline_fps:.2f}")
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2)
+        print(f"\n💾 Results written to {args.json}")
+
+    print("\n🏁 Benchmark completed!")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,197 @@
+#!/usr/bin/env python3
+"""
+Offline calibration of the face recognition similarity threshold.
+
+Scores every pair of enrolled samples in one vectorized pass: pairs of the
+same identity are genuine, pairs of different identities are impostors.
+From the two score distributions it reports the false-accept / false-reject
+rates of the configured threshold, the equal error rate, and the threshold
+to use for each target false-accept rate:
+
+    python calibrate_threshold.py --far 0.01 0.001
+    FACE_RECOGNITION_SIMILARITY_THRESHOLD=0.93 python app.py
+
+Needs at least two identities (impostors) and one identity with two or more
+samples (genuine pairs).
+"""
+
+import argparse
+import json
+
+import numpy as np
+
+from config import Config
+from face_recognition_system import FaceRecognitionSystem
+
+
+def pair_scores(identities, block_size=1024):
+    """
+    Cosine similarity of every unordered pair of samples
+
+    Args:
+        identities: {name: (n, d) L2-normalized samples}
+        block_size: Rows scored per matrix product (bounds peak memory)
+
+    Returns:
+        Tuple of (genuine scores, impostor scores) as float32 arrays
+    """
+    names = list(identities)
+    if not names:
+        return np.zeros(0, np.float32), np.zeros(0, np.float32)
+
+    samples = np.vstack([np.atleast_2d(identities[name]) for name in names]).astype(np.float32)
+    labels = np.concatenate([np.full(len(np.atleast_2d(identities[name])), i) for i, name in enumerate(names)])
+
+    genuine = []
+    impostor = []
+    columns = np.arange(len(samples))
+    for start in range(0, len(samples), block_size):
+        rows = np.arange(start, min(start + block_size, len(samples)))
+        scores = samples[rows] @ samples.T
+        # Upper triangle only: each pair once, no self-pairs
+        upper = columns[None, :] > rows[:, None]
+        same = labels[rows][:, None] == labels[None, :]
+        genuine.append(scores[upper & same])
+        impostor.append(scores[upper & ~same])
+    return np.concatenate(genuine), np.concatenate(impostor)
+
+
+def error_rates(genuine, impostor, thresholds):
+    """
+    False-accept and false-reject rates (a match is accepted if score > threshold)
+
+    Returns:
+        Tuple of (far, frr) arrays, one entry per threshold
+    """
+    thresholds = np.asarray(thresholds, dtype=np.float64)
+    impostor = np.sort(impostor)
+    genuine = np.sort(genuine)
+    far = 1.0 - np.searchsorted(impostor, thresholds, side='right') / max(1, len(impostor))
+    frr = np.searchsorted(genuine, thresholds, side='right') / max(1, len(genuine))
+    if not len(impostor):
+        far[:] = np.nan
+    if not len(genuine):
+        frr[:] = np.nan
+    return far, frr
+
+
+def calibrate(genuine, impostor, target_fars, check_thresholds=()):
+    """
+    Recommend thresholds from genuine/impostor score distributions
+
+    Args:
+        genuine: Same-identity pair scores
+        impostor: Different-identity pair scores
+        target_fars: False-accept rates to compute thresholds for
+        check_thresholds: Extra thresholds to report FAR/FRR for
+
+    Returns:
+        Report dict
+    """
+    report = {
+        'genuine_pairs': int(len(genuine)),
+        'impostor_pairs': int(len(impostor)),
+        'targets': [],
+        'checks': [],
+    }
+    for label, scores in (('genuine', genuine), ('impostor', impostor)):
+        if len(scores):
+            report[label] = {
+                'mean': float(scores.mean()),
+                'std': float(scores.std()),
+                'min': float(scores.min()),
+                'max': float(scores.max()),
+            }
+
+    if len(impostor):
+        for far in target_fars:
+            # Smallest impostor quantile with at most `far` impostors strictly above it
+            threshold = float(np.quantile(impostor, 1.0 - far, method='higher'))
+            achieved_far, frr = error_rates(genuine, impostor, [threshold])
+            report['targets'].append({
+                'target_far': far,
+                'threshold': threshold,
+                'far': float(achieved_far[0]),
+                'frr': None if np.isnan(frr[0]) else float(frr[0]),
+            })
+
+    if len(genuine) and len(impostor):
+        grid = np.linspace(min(genuine.min(), impostor.min()), max(genuine.max(), impostor.max()), 2001)
+        far, frr = error_rates(genuine, impostor, grid)
+        best = int(np.argmin(np.abs(far - frr)))
+        report['eer'] = {'threshold': float(grid[best]), 'rate': float((far[best] + frr[best]) / 2)}
+
+    if check_thresholds:
+        far, frr = error_rates(genuine, impostor, check_thresholds)
+        for threshold, a, r in zip(check_thresholds, far, frr):
+            report['checks'].append({
+                'threshold': float(threshold),
+                'far': None if np.isnan(a) else float(a),
+                'frr': None if np.isnan(r) else float(r),
+            })
+    return report
+
+
+def main():
+    """Command line entry point"""
+    parser = argparse.ArgumentParser(description='Calibrate the recognition threshold from the enrolled gallery')
+    parser.add_argument('--far', type=float, nargs='+', default=[0.01, 0.001, 0.0001],
+                        help='Target false-accept rates')
+    parser.add_argument('--thresholds', type=float, nargs='*', default=[],
+                        help='Extra thresholds to report FAR/FRR for')
+    parser.add_argument('--json', help='Write the report to this JSON file')
+    args = parser.parse_args()
+
+    print("🎯 Recognition Threshold Calibration")
+    print("=" * 50)
+
+    recognizer = FaceRecognitionSystem(prototypes_per_identity=Config.GALLERY_PROTOTYPES_PER_IDENTITY,
+                                       rerank_candidates=Config.GALLERY_RERANK_CANDIDATES,
+                                       gallery_shards=Config.GALLERY_SHARDS,
+                                       shard_dir=Config.GALLERY_SHARD_DIR,
+                                       shard_processes=False,
+                                       threshold=Config.FACE_RECOGNITION_SIMILARITY_THRESHOLD)
+    identities = recognizer.gallery.to_dict()
+    genuine, impostor = pair_scores(identities)
+
+    current = recognizer.threshold
+    report = calibrate(genuine, impostor, args.far, sorted(set(args.thresholds) | {current}))
+    report['identities'] = len(identities)
+    report['samples'] = int(sum(len(np.atleast_2d(samples)) for samples in identities.values()))
+    report['current_threshold'] = current
+
+    print(f"Identities: {report['identities']}  samples: {report['samples']}")
+    print(f"Genuine pairs: {report['genuine_pairs']}  impostor pairs: {report['impostor_pairs']}")
+    if not report['genuine_pairs']:
+        print("⚠️  No identity has two samples: FRR cannot be estimated")
+    if not report['impostor_pairs']:
+        print("⚠️  Fewer than two identities: FAR cannot be estimated, no thresholds recommended")
+
+    for label in ('genuine', 'impostor'):
+        if label in report:
+            stats = report[label]
+            print(f"{label:>9} scores: mean {stats['mean']:.4f}  std {stats['std']:.4f}  "
+                  f"range [{stats['min']:.4f}, {stats['max']:.4f}]")
+
+    def rate(value):
+        return '   n/a' if value is None else f"{value:6.2%}"
+
+    if report['targets']:
+        print("\nTarget FAR    threshold      FAR      FRR")
+        for target in report['targets']:
+            print(f"{target['target_far']:>10g}    {target['threshold']:.4f}    "
+                  f"{rate(target['far'])}   {rate(target['frr'])}")
+    if 'eer' in report:
+        print(f"\nEER: {report['eer']['rate']:.2%} at threshold {report['eer']['threshold']:.4f}")
+    for check in report['checks']:
+        marker = ' (configured)' if check['threshold'] == current else ''
+        print(f"Threshold {check['threshold']:.4f}{marker}: FAR {rate(check['far'])}  FRR {rate(check['frr'])}")
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"💾 Report written to {args.json}")
+
+
+if __name__ == "__main__":
+    main()
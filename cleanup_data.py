@@ -4,12 +4,19 @@ Utility script to clean up problematic Unicode filenames in the data directory
 and fix file encoding issues for the face detection system.
 """
 
+import argparse
+import json
 import os
 import re
 import shutil
+import time
 import unicodedata
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 
+AUDIT_CACHE_VERSION = 1
+MIN_FACE_IMAGE_SIZE = 50  # Haar cascade minSize used at enrollment
+
 def sanitize_filename(filename):
     """
     Sanitize filename to remove problematic Unicode characters
@@ -175,20 +182,175 @@ def test_file_access(data_dir='data'):
     
     return accessible_files, inaccessible_files
 
+def probe_image(file_path):
+    """
+    Read an image's header (format and dimensions) without decoding pixels
+    
+    Args:
+        file_path: Path to the file
+        
+    Returns:
+        Dict with status ('ok', 'not_image' or 'unreadable'), format, width,
+        height, mode and a list of warnings
+    """
+    from PIL import Image, UnidentifiedImageError
+    
+    result = {'status': 'ok', 'format': None, 'width': None, 'height': None, 'mode': None, 'warnings': []}
+    try:
+        # Image.open only parses the header; pixel data is never decoded here
+        with Image.open(file_path) as image:
+            result['format'] = image.format
+            result['width'], result['height'] = image.size
+            result['mode'] = image.mode
+        
+        if min(result['width'], result['height']) < MIN_FACE_IMAGE_SIZE:
+            result['warnings'].append('too_small')
+        
+        if result['format'] == 'JPEG':
+            # A missing end-of-image marker means the upload was cut short
+            with open(file_path, 'rb') as f:
+                f.seek(-2, os.SEEK_END)
+                if f.read(2) != b'\xff\xd9':
+                    result['warnings'].append('truncated')
+    except UnidentifiedImageError:
+        result['status'] = 'not_image'
+    except Exception as e:
+        result['status'] = 'unreadable'
+        result['error'] = str(e)
+    return result
+
+def _load_audit_cache(cache_path):
+    try:
+        with open(cache_path, 'r', encoding='utf-8') as f:
+            cache = json.load(f)
+        if cache.get('version') == AUDIT_CACHE_VERSION:
+            return cache.get('entries', {})
+    except (OSError, ValueError):
+        pass
+    return {}
+
+def _save_audit_cache(cache_path, entries):
+    tmp_path = cache_path + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump({'version': AUDIT_CACHE_VERSION, 'entries': entries}, f, ensure_ascii=False)
+    os.replace(tmp_path, cache_path)
+
+def audit_data_directory(data_dir='data', workers=8, cache_path='.data_audit_cache.json', report_path=None):
+    """
+    Incremental, parallel audit of the data directory (read-only)
+    
+    Only image headers are read, in a thread pool. Results are cached by
+    (path, size, mtime), so a re-run only probes new or changed files.
+    
+    Args:
+        data_dir: Path to the data directory
+        workers: Probe threads
+        cache_path: JSON cache file (None disables caching)
+        report_path: Write the JSON report here (None = do not write)
+        
+    Returns:
+        Report dict with a summary and one entry per file
+    """
+    start = time.perf_counter()
+    if not os.path.exists(data_dir):
+        print(f"Data directory '{data_dir}' does not exist.")
+        return None
+    
+    cache = _load_audit_cache(cache_path) if cache_path else {}
+    
+    # scandir returns size and mtime with the listing, no extra stat per file
+    files = []
+    for entry in os.scandir(data_dir):
+        if entry.is_file():
+            stat = entry.stat()
+            files.append((entry.name, entry.path, stat.st_size, stat.st_mtime_ns))
+    
+    entries = {}
+    to_probe = []
+    for filename, file_path, size, mtime in files:
+        cached = cache.get(file_path)
+        if cached is not None and cached['size'] == size and cached['mtime'] == mtime:
+            entries[file_path] = cached
+        else:
+            to_probe.append((filename, file_path, size, mtime))
+    
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        probed = pool.map(lambda item: (item, probe_image(item[1])), to_probe)
+        for (filename, file_path, size, mtime), result in probed:
+            entries[file_path] = {'size': size, 'mtime': mtime, 'result': result}
+    
+    report_files = []
+    summary = {'files': len(files), 'ok': 0, 'not_image': 0, 'unreadable': 0,
+               'warnings': 0, 'rename_suggested': 0}
+    for filename, file_path, size, mtime in sorted(files):
+        result = entries[file_path]['result']
+        item = dict(result, file=filename, path=file_path, size=size)
+        sanitized_name = sanitize_filename(filename)
+        if sanitized_name != filename:
+            item['suggested_name'] = sanitized_name
+            summary['rename_suggested'] += 1
+        summary[result['status']] += 1
+        if result['warnings']:
+            summary['warnings'] += 1
+        report_files.append(item)
+    
+    summary['probed'] = len(to_probe)
+    summary['cached'] = len(files) - len(to_probe)
+    summary['elapsed_s'] = round(time.perf_counter() - start, 3)
+    report = {
+        'generated': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'data_dir': data_dir,
+        'summary': summary,
+        'files': report_files,
+    }
+    
+    if cache_path:
+        # Entries for deleted files are dropped because only current files are kept
+        _save_audit_cache(cache_path, entries)
+    if report_path:
+        with open(report_path, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
+    
+    print(f"Audited {summary['files']} files in {data_dir} "
+          f"({summary['probed']} probed, {summary['cached']} cached) in {summary['elapsed_s']}s")
+    print(f"OK: {summary['ok']}  not images: {summary['not_image']}  unreadable: {summary['unreadable']}  "
+          f"with warnings: {summary['warnings']}  rename suggested: {summary['rename_suggested']}")
+    for item in report_files:
+        if item['status'] == 'unreadable' or item['warnings']:
+            print(f"  '{item['file']}': {item['status']} {', '.join(item['warnings'])} {item.get('error', '')}")
+    
+    return report
+
 def main():
     """
     Main function to run cleanup and testing
     """
+    parser = argparse.ArgumentParser(description='Clean up and audit the data directory')
+    parser.add_argument('--audit', action='store_true',
+                        help='Read-only, incremental header audit instead of renaming and decoding')
+    parser.add_argument('--data-dir', default='data', help='Data directory')
+    parser.add_argument('--workers', type=int, default=8, help='Audit threads')
+    parser.add_argument('--cache', default='.data_audit_cache.json', help='Audit cache file')
+    parser.add_argument('--no-cache', action='store_true', help='Probe every file again')
+    parser.add_argument('--report', help='Write the audit report to this JSON file')
+    args = parser.parse_args()
+    
+    if args.audit:
+        audit_data_directory(args.data_dir, workers=args.workers,
+                             cache_path=None if args.no_cache else args.cache,
+                             report_path=args.report)
+        return
+    
     print("Data Directory Cleanup Utility")
     print("=" * 40)
     
     # Cleanup filenames
-    renamed, problems = cleanup_data_directory()
+    renamed, problems = cleanup_data_directory(args.data_dir)
     
     print("\n" + "=" * 40)
     
     # Test file access
-    accessible, inaccessible = test_file_access()
+    accessible, inaccessible = test_file_access(args.data_dir)
     
     print("\nCleanup completed!")
     
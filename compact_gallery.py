@@ -0,0 +1,75 @@
+#!/usr/bin/env python3
+"""
+Shrink an existing gallery by collapsing near-duplicate enrollment samples.
+
+Each identity's samples are compared with one vectorized similarity matrix;
+groups at or above the cutoff are reduced to their first sample (or, with
+--merge, to their normalized mean):
+
+    python compact_gallery.py --dry-run
+    python compact_gallery.py --threshold 0.97 --merge
+
+--reshard redistributes the identities over a new number of shard files
+instead (stop the server first; then set GALLERY_SHARDS to the same count):
+
+    python compact_gallery.py --reshard 4
+"""
+
+import argparse
+
+from config import Config
+from face_recognition_system import FaceRecognitionSystem
+from sharded_gallery import ShardedGallery
+
+
+def reshard(num_shards):
+    """Redistribute the gallery over num_shards shard files"""
+    print("🔀 Gallery Resharding")
+    print("=" * 50)
+    gallery = ShardedGallery(max(1, num_shards), Config.GALLERY_SHARD_DIR,
+                             prototypes_per_identity=Config.GALLERY_PROTOTYPES_PER_IDENTITY,
+                             rerank_candidates=Config.GALLERY_RERANK_CANDIDATES,
+                             use_processes=False, reshard=True)
+    print("=" * 50)
+    print(f"{len(gallery)} identities in {gallery.num_shards} shard(s) under {Config.GALLERY_SHARD_DIR}; "
+          f"set GALLERY_SHARDS={num_shards} before starting the server")
+
+
+def main():
+    """Command line entry point"""
+    parser = argparse.ArgumentParser(description='Remove near-duplicate samples from the face gallery')
+    parser.add_argument('--threshold', type=float, default=Config.ENROLLMENT_DEDUP_THRESHOLD or 0.98,
+                        help='Cosine similarity at which two samples are duplicates')
+    parser.add_argument('--merge', action='store_true', help='Average duplicates instead of keeping the first')
+    parser.add_argument('--dry-run', action='store_true', help='Only report what would be removed')
+    parser.add_argument('--reshard', type=int, metavar='SHARDS',
+                        help='Redistribute the gallery over this many shards instead of compacting')
+    args = parser.parse_args()
+
+    if args.reshard is not None:
+        reshard(args.reshard)
+        return
+
+    print("🗜️  Gallery Compaction")
+    print("=" * 50)
+
+    recognizer = FaceRecognitionSystem(prototypes_per_identity=Config.GALLERY_PROTOTYPES_PER_IDENTITY,
+                                       rerank_candidates=Config.GALLERY_RERANK_CANDIDATES,
+                                       gallery_shards=Config.GALLERY_SHARDS,
+                                       shard_dir=Config.GALLERY_SHARD_DIR,
+                                       shard_processes=False)
+    before = recognizer.gallery.num_samples()
+    changes = recognizer.compact_gallery(threshold=args.threshold, merge=args.merge, dry_run=args.dry_run)
+
+    for name, (old, new) in sorted(changes.items()):
+        print(f"  {name}: {old} -> {new} samples")
+
+    removed = sum(old - new for old, new in changes.values())
+    verb = "Would remove" if args.dry_run else "Removed"
+    print("=" * 50)
+    print(f"{verb} {removed} of {before} samples from {len(changes)} identities "
+          f"(threshold {args.threshold}, {'merge' if args.merge else 'keep first'})")
+
+
+if __name__ == "__main__":
+    main()
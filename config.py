@@ -10,16 +10,123 @@ class Config:
     CAMERA_HEIGHT = 480
     CAMERA_FPS = 30
     
+    # Frame source settings (camera, file, images or synthetic)
+    FRAME_SOURCE = os.environ.get('FRAME_SOURCE', 'camera')
+    FRAME_SOURCE_PATH = os.environ.get('FRAME_SOURCE_PATH')  # Video file or image directory
+    FRAME_SOURCE_FPS = None  # Replay rate, defaults to CAMERA_FPS
+    FRAME_SOURCE_LOOP = True  # Restart file/image sources when they run out
+    CAPTURE_THREADED = True  # Grab on a dedicated thread and decode only the newest frame
+    CAPTURE_MAX_FAILURES = 5  # Consecutive failed grabs before the source is reopened
+    CAPTURE_RECONNECT_DELAY = 0.5  # First reconnect wait in seconds, doubled per failed attempt
+    CAPTURE_MAX_RECONNECT_DELAY = 10.0  # Upper bound of the reconnect wait
+    
     # Face detection settings
     FACE_DETECTION_CONFIDENCE_THRESHOLD = 0.9
-    FACE_RECOGNITION_SIMILARITY_THRESHOLD = 0.8
+    FACE_RECOGNITION_SIMILARITY_THRESHOLD = float(os.environ.get('FACE_RECOGNITION_SIMILARITY_THRESHOLD', 0.8))  # See calibrate_threshold.py
     PROCESS_EVERY_N_FRAMES = 5  # Process every 5th frame for better performance
     
+    # Gallery settings
+    GALLERY_PROTOTYPES_PER_IDENTITY = 1  # 1 = mean vector, more = k-medoids prototypes
+    GALLERY_RERANK_CANDIDATES = 3  # Best identities re-ranked against all their samples (0 = off)
+    GALLERY_SHARDS = int(os.environ.get('GALLERY_SHARDS', 0))  # Shard processes (0 = one shard mapped in-process)
+    GALLERY_SHARD_DIR = 'data/gallery_shards'  # Memory-mapped gallery files shared by all processes
+    GALLERY_RELOAD_INTERVAL = 0.5  # Seconds between checks for enrollments made by other processes (0 = off)
+    ENROLLMENT_DEDUP_THRESHOLD = 0.98  # New samples this similar to an existing one are duplicates (None = off)
+    ENROLLMENT_DEDUP_MODE = 'reject'  # 'reject' skips duplicates, 'merge' averages them into the closest sample
+    
+    # Face quality gate (skip recognition of faces that will not match)
+    FACE_QUALITY_MODE = os.environ.get('FACE_QUALITY_MODE', 'off')  # 'off', 'skip' (unknown) or 'defer' (keep track result)
+    FACE_QUALITY_MIN_CONFIDENCE = 0.95  # Minimum MTCNN confidence
+    FACE_QUALITY_MIN_SIZE = 40  # Minimum face width/height in frame pixels
+    FACE_QUALITY_MAX_YAW = 0.3  # Max nose offset from the face midline, in inter-eye distances
+    FACE_QUALITY_PITCH_RANGE = (0.3, 0.8)  # Accepted nose position between eye line (0) and mouth line (1)
+    FACE_QUALITY_MAX_ROLL = 25.0  # Max eye line tilt in degrees
+    FACE_QUALITY_MIN_SHARPNESS = 50.0  # Min Laplacian variance of the 64x64 face crop (None = no blur check)
+    
+    # Recognition cache settings (reuse matches while a face's appearance is unchanged)
+    RECOGNITION_CACHE_SIZE = 256  # Max cached results, least recently used are evicted
+    RECOGNITION_CACHE_TTL = 2.0  # Seconds before a cached match is re-checked
+    RECOGNITION_CACHE_MAX_HASH_DISTANCE = 6  # Max differing bits of the 64-bit appearance hash
+    TRACKER_IOU_THRESHOLD = 0.3  # Min box overlap to keep the same track ID
+    TRACKER_MAX_MISSED = 3  # Detection passes a track survives without a match
+    
+    # Worker process settings
+    DETECTION_WORKERS = int(os.environ.get('DETECTION_WORKERS', 0))  # 0 = detect in the capture thread
+    WORKER_SLOTS_PER_WORKER = 2  # Frames in flight per worker
+    WORKER_SLOT_BYTES = 1920 * 1080 * 3  # Largest frame a worker slot can hold
+    
+    # CPU thread budget per stage (see thread_budget.py); None keeps the library default
+    OPENCV_THREADS = None  # cv2.setNumThreads in the server process
+    TF_INTRA_OP_THREADS = None  # TensorFlow threads per op in the server process
+    TF_INTER_OP_THREADS = None  # TensorFlow ops run in parallel in the server process
+    CPU_AFFINITY = None  # CPU ids the server process is pinned to (Linux)
+    WORKER_OPENCV_THREADS = 1  # Per detection worker; workers already run in parallel
+    WORKER_TF_INTRA_OP_THREADS = None  # None = cores split evenly between the workers
+    WORKER_TF_INTER_OP_THREADS = 1
+    WORKER_CPU_AFFINITY = False  # Pin each worker to its own slice of the CPUs
+    THREAD_PROFILE_PATH = os.environ.get('THREAD_PROFILE_PATH', 'data/thread_profile.json')  # From tune_threads.py; overrides the above
+    
     # Frame processing settings
     MIN_FRAME_WIDTH = 48
     MIN_FRAME_HEIGHT = 48
     FRAME_RESIZE_MAX_WIDTH = 480  # Reduced for better performance
     FRAME_INTERPOLATION = 'INTER_AREA'  # Better for downsampling
+    # Fixed (width, height) detector input shapes; frames are letterboxed into the smallest that fits
+    # so every shape can be warmed up at startup (empty = detect at the frame's own scaled size)
+    DETECTOR_INPUT_BUCKETS = [(480, 360), (480, 272), (320, 240), (160, 120)]
+    
+    # Multi-resolution detection
+    DETECTION_MODE = os.environ.get('DETECTION_MODE', 'single')  # 'single' or 'coarse_to_fine'
+    COARSE_DETECTION_WIDTH = 320  # Full-frame width of the coarse pass
+    FINE_DETECTION_WIDTH = 1280  # Full-frame width used when refining candidates
+    COARSE_MIN_FACE_SIZE = 12  # Smallest face proposed by the coarse pass (coarse pixels)
+    FINE_MIN_FACE_SIZE = 20  # Smallest face accepted by the refinement pass (fine pixels)
+    COARSE_CANDIDATE_CONFIDENCE = 0.6  # Relaxed final threshold for coarse candidates
+    COARSE_ACCEPT_CONFIDENCE = 0.9  # Coarse faces above this confidence...
+    COARSE_REFINE_BELOW = 24  # ...and at least this size (coarse pixels) skip refinement
+    REFINE_PADDING = 0.5  # Fraction of the box size added around candidates before refinement
+    REFINE_FACE_SIZE = 48  # Candidate width (pixels) refinement crops are scaled to
+    
+    # Region-of-interest and motion gating
+    DETECTION_ROIS = {}  # {camera index: [(x, y, w, h), ...]} as fractions of the frame
+    ROI_PADDING = 0.2  # Fraction added around active regions before detection
+    MOTION_GATING = False  # Skip detection while nothing moves inside the ROIs
+    MOTION_METHOD = 'diff'  # 'diff' (frame differencing) or 'mog2' (background subtraction)
+    MOTION_DOWNSCALE_WIDTH = 160  # Width of the motion analysis image
+    MOTION_THRESHOLD = 25  # Pixel difference treated as motion
+    MOTION_MIN_AREA = 0.002  # Minimum moving area as a fraction of the frame
+    MOTION_FORCE_DETECT_EVERY = 30  # Full detection pass every N passes even without motion
+    
+    # Event clip recording (unauthorized / unknown faces)
+    EVENT_RECORDING = os.environ.get('EVENT_RECORDING', '0') == '1'  # Also runs recognition on every detection pass
+    EVENT_CLIP_DIR = 'data/events'
+    EVENT_PRE_ROLL = 3.0  # Seconds kept in memory before an event
+    EVENT_POST_ROLL = 5.0  # Seconds recorded after the last event
+    EVENT_MAX_CLIP_SECONDS = 60.0  # Longest clip; continuing events start a new one
+    EVENT_RECORD_FPS = 10  # Frames per second buffered and recorded (0 = every frame)
+    EVENT_JPEG_QUALITY = 70
+    
+    # Stream encoding settings
+    JPEG_ENCODER = os.environ.get('JPEG_ENCODER', 'auto')  # auto, turbojpeg, simplejpeg or opencv
+    JPEG_QUALITY = 80  # Lower quality is noticeably cheaper to encode
+    TURBOJPEG_LIB_PATH = os.environ.get('TURBOJPEG_LIB_PATH')  # Optional libturbojpeg location
+    OVERLAY_MODE = os.environ.get('OVERLAY_MODE', 'server')  # 'server' draws boxes into the stream, 'client' in the browser
+    OVERLAY_SPRITE_CACHE_SIZE = 256  # Pre-rasterized overlay labels kept in memory
+    
+    # Load shedding when the pipeline falls behind (see overload_control.py)
+    OVERLOAD_CONTROL = os.environ.get('OVERLOAD_CONTROL', '1') == '1'
+    OVERLOAD_MAX_LAG_MS = 300.0  # p95 grab-to-publish lag that counts as overloaded
+    OVERLOAD_RECOVER_LAG_MS = 150.0  # p95 lag that counts as healthy again
+    OVERLOAD_MAX_CPU = 0.9  # Process CPU share of the available cores that counts as overloaded
+    OVERLOAD_RECOVER_CPU = 0.6
+    OVERLOAD_CHECK_INTERVAL = 1.0  # Seconds between checks
+    OVERLOAD_ESCALATE_AFTER = 2  # Overloaded checks in a row before degrading one level
+    OVERLOAD_RECOVER_AFTER = 5  # Healthy checks in a row before recovering one level
+    OVERLOAD_STREAM_FPS = 10  # Level 1+: stream frame rate cap
+    OVERLOAD_JPEG_QUALITY = 60  # Level 1+: stream JPEG quality
+    OVERLOAD_DETECTION_INTERVAL_SCALE = 2  # Level 2+: PROCESS_EVERY_N_FRAMES multiplier
+    OVERLOAD_TRACK_RESULT_MAX_AGE = 10.0  # Level 3+: seconds a track's last result is reused
+    OVERLOAD_MAX_VIEWERS = 2  # Level 4: new stream viewers beyond this get 503
     
     # File upload settings
     MAX_CONTENT_LENGTH = 16 * 1024 * 1024  # 16MB max file size
@@ -32,6 +139,17 @@ class Config:
     DEBUG = True
     THREADED = True
     
+    # Async serving mode (asgi_app.py)
+    ASGI_EXECUTOR_WORKERS = 4  # Threads for status/recognition work off the event loop
+    STATUS_PUSH_INTERVAL = 0.5  # Minimum seconds between /detection_events pushes
+    
+    # On-demand tracing (see frame_tracer.py and /admin/trace/start)
+    ADMIN_TOKEN = os.environ.get('ADMIN_TOKEN')  # Required by /admin endpoints (unset = disabled)
+    TRACE_DEFAULT_SECONDS = 10
+    TRACE_MAX_SECONDS = 60
+    TRACE_MAX_EVENTS = 200000  # Spans kept per window (about 100 bytes each)
+    TRACE_PROFILE_INTERVAL = 0.005  # Seconds between sampling profiler snapshots
+    
     # Performance settings
     GPU_MEMORY_GROWTH = True
     TENSORFLOW_LOG_LEVEL = 'ERROR'
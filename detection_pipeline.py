@@ -0,0 +1,457 @@
+"""
+Shared MTCNN detection path used by the live server and offline tools
+
+The first detector call for every new input shape is slow (TensorFlow
+builds kernels, and older mtcnn releases retrace model.predict). Passing
+`buckets` fits every frame into one of a few fixed input shapes, padding
+the bottom and right edges (letterbox), so warm_up_detector() can pay that
+cost for all of them at startup.
+"""
+
+import time
+
+import cv2
+import numpy as np
+
+from face_tracker import box_iou
+from frame_tracer import tracer
+from motion_gate import expand_region
+
+MIN_DETECTOR_SIZE = 48
+
+
+def choose_bucket(width, height, max_width, buckets):
+    """
+    Pick the fixed detector input shape for a frame
+
+    The frame keeps its usual max_width scale if some bucket can hold it
+    (the smallest such bucket wins); otherwise it is scaled down to fit the
+    bucket that needs the least extra downscaling.
+
+    Args:
+        width, height: Frame size
+        max_width: Maximum width passed to the detector
+        buckets: List of (width, height) input shapes
+
+    Returns:
+        Tuple of ((bucket_width, bucket_height), scale)
+    """
+    scale = min(1.0, max_width / width)
+    fitting = [bucket for bucket in buckets
+               if int(width * scale) <= bucket[0] and int(height * scale) <= bucket[1]]
+    if fitting:
+        return min(fitting, key=lambda bucket: bucket[0] * bucket[1]), scale
+
+    def fit_scale(bucket):
+        return min(bucket[0] / width, bucket[1] / height)
+    bucket = max(buckets, key=lambda bucket: (fit_scale(bucket), -bucket[0] * bucket[1]))
+    return bucket, fit_scale(bucket)
+
+
+def letterbox(image, bucket_width, bucket_height):
+    """Pad an image with black on the right and bottom to the bucket size (top-left stays at 0, 0)"""
+    height, width = image.shape[:2]
+    return cv2.copyMakeBorder(image, 0, bucket_height - height, 0, bucket_width - width,
+                              cv2.BORDER_CONSTANT, value=0)
+
+
+def _prepare_bucketed_input(frame, max_width, buckets):
+    height, width = frame.shape[:2]
+    (bucket_width, bucket_height), scale = choose_bucket(width, height, max_width, buckets)
+    if scale < 1.0:
+        new_width = min(bucket_width, max(1, int(width * scale)))
+        new_height = min(bucket_height, max(1, int(height * scale)))
+        frame = cv2.resize(frame, (new_width, new_height), interpolation=cv2.INTER_AREA)
+        # Use the exact per-axis factor of the resize for the coordinate mapping
+        scale = new_width / width
+    rgb_frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+    return letterbox(rgb_frame, bucket_width, bucket_height), scale
+
+
+def prepare_detector_input(frame, max_width, buckets=None):
+    """
+    Downscale a BGR frame and convert it to the RGB layout MTCNN expects
+
+    Args:
+        frame: BGR image
+        max_width: Maximum width passed to the detector
+        buckets: Optional list of (width, height) fixed input shapes, see choose_bucket
+
+    Returns:
+        Tuple of (rgb_frame, scale), rgb_frame is None if the frame is unusable
+    """
+    if frame is None or frame.size == 0:
+        print("Invalid frame detected, skipping...")
+        return None, 1.0
+
+    height, width = frame.shape[:2]
+
+    # Ensure minimum frame size
+    if height < 24 or width < 24:
+        print(f"Frame too small ({width}x{height}), skipping...")
+        return None, 1.0
+
+    if buckets:
+        return _prepare_bucketed_input(frame, max_width, buckets)
+
+    # Resize frame for optimal processing
+    target_width = min(width, max_width)
+    if width > target_width:
+        scale = target_width / width
+        new_width = int(width * scale)
+        new_height = int(height * scale)
+
+        # Ensure dimensions are even numbers and minimum size
+        new_width = max(MIN_DETECTOR_SIZE, new_width - (new_width % 2))
+        new_height = max(MIN_DETECTOR_SIZE, new_height - (new_height % 2))
+
+        frame_resized = cv2.resize(frame, (new_width, new_height), interpolation=cv2.INTER_AREA)
+    else:
+        frame_resized = frame
+        scale = 1.0
+
+    # Additional validation after resize
+    if frame_resized.shape[0] < MIN_DETECTOR_SIZE or frame_resized.shape[1] < MIN_DETECTOR_SIZE:
+        print("Resized frame too small, skipping...")
+        return None, scale
+
+    # Convert BGR to RGB for MTCNN (cvtColor returns a new contiguous array)
+    rgb_frame = np.ascontiguousarray(cv2.cvtColor(frame_resized, cv2.COLOR_BGR2RGB))
+    return rgb_frame, scale
+
+
+def scale_detections(result, scale, frame_size=None):
+    """
+    Map detections from detector coordinates back to frame coordinates
+
+    Args:
+        result: MTCNN detection results
+        scale: Scale factor that was applied to the frame
+        frame_size: Optional (width, height); boxes are clipped to it, which
+                    removes any part that was in the letterbox padding
+
+    Returns:
+        New list of face dicts; the input dicts are left untouched
+    """
+    faces = []
+    for face in result:
+        face = dict(face)
+        if 'box' in face and len(face['box']) >= 4:
+            face['box'] = [int(v / scale) for v in face['box'][:4]]
+            if frame_size is not None:
+                x, y, width, height = face['box']
+                x2 = min(x + width, frame_size[0])
+                y2 = min(y + height, frame_size[1])
+                if x >= frame_size[0] or y >= frame_size[1] or x2 <= 0 or y2 <= 0:
+                    continue  # Found in the padding only
+                face['box'] = [x, y, x2 - x, y2 - y]
+
+            if 'keypoints' in face:
+                face['keypoints'] = {key: (int(x / scale), int(y / scale))
+                                     for key, (x, y) in face['keypoints'].items()}
+        faces.append(face)
+    return faces
+
+
+def detect_faces_in_frame(detector, frame, max_width, buckets=None, **detect_kwargs):
+    """
+    Run MTCNN on a BGR frame and return boxes in frame coordinates
+
+    Args:
+        detector: MTCNN detector
+        frame: BGR image
+        max_width: Maximum width passed to the detector
+        buckets: Optional list of (width, height) fixed input shapes (letterboxed)
+        **detect_kwargs: Extra detect_faces options (min_face_size, threshold_onet, ...; mtcnn>=1.0)
+
+    Returns:
+        List of face dicts, or None if the frame could not be processed
+    """
+    with tracer.span('resize'):
+        rgb_frame, scale = prepare_detector_input(frame, max_width, buckets)
+    if rgb_frame is None:
+        return None
+
+    with tracer.span('detect'):
+        result = detector.detect_faces(rgb_frame, **detect_kwargs)
+
+    # Validate detection results
+    if result is None:
+        result = []
+
+    frame_size = (frame.shape[1], frame.shape[0]) if buckets else None
+    return scale_detections(result, scale, frame_size)
+
+
+def warm_up_detector(detector, shapes, **detect_kwargs):
+    """
+    Run one detection per input shape so live frames do not pay the first-call cost
+
+    A blurred noise image is used rather than a flat one, so PNet usually
+    proposes a few candidates and the RNet/ONet stages run as well.
+
+    Args:
+        detector: MTCNN detector
+        shapes: List of (width, height) detector input shapes, e.g. the buckets
+        **detect_kwargs: detect_faces options the live path uses
+
+    Returns:
+        Dict of 'WxH' -> warm-up milliseconds
+    """
+    rng = np.random.default_rng(0)
+    timings = {}
+    for width, height in shapes:
+        image = cv2.GaussianBlur(rng.integers(0, 255, (height, width, 3), dtype=np.uint8), (9, 9), 0)
+        start = time.perf_counter()
+        detector.detect_faces(image, **detect_kwargs)
+        timings[f'{width}x{height}'] = (time.perf_counter() - start) * 1000
+    return timings
+
+
+def detector_input_shapes(config):
+    """
+    Input shapes the live detector will see, for warm-up
+
+    Args:
+        config: Flask config (or dict) with DETECTOR_INPUT_BUCKETS, CAMERA_* and FRAME_RESIZE_MAX_WIDTH
+
+    Returns:
+        The buckets, or without bucketing the single shape of a camera frame
+    """
+    if config['DETECTOR_INPUT_BUCKETS']:
+        return list(config['DETECTOR_INPUT_BUCKETS'])
+    frame = np.zeros((config['CAMERA_HEIGHT'], config['CAMERA_WIDTH'], 3), dtype=np.uint8)
+    rgb_frame, _ = prepare_detector_input(frame, config['FRAME_RESIZE_MAX_WIDTH'])
+    return [(rgb_frame.shape[1], rgb_frame.shape[0])] if rgb_frame is not None else []
+
+
+def offset_detections(faces, dx, dy):
+    """Shift face boxes and keypoints found in a crop back into frame coordinates"""
+    shifted = []
+    for face in faces:
+        face = dict(face)
+        x, y, width, height = face['box'][:4]
+        face['box'] = [x + dx, y + dy, width, height]
+        if 'keypoints' in face:
+            face['keypoints'] = {key: (kx + dx, ky + dy) for key, (kx, ky) in face['keypoints'].items()}
+        shifted.append(face)
+    return shifted
+
+
+def merge_detections(faces, iou_threshold=0.5):
+    """Drop duplicate faces found in overlapping crops, keeping the most confident"""
+    kept = []
+    for face in sorted(faces, key=lambda f: f.get('confidence', 0.0), reverse=True):
+        if all(box_iou(face['box'], other['box']) < iou_threshold for other in kept):
+            kept.append(face)
+    return kept
+
+
+def detect_faces_in_regions(detector, frame, regions, max_width, buckets=None):
+    """
+    Run MTCNN on crops of a frame and return boxes in frame coordinates
+
+    Args:
+        detector: MTCNN detector
+        frame: BGR image
+        regions: List of (x, y, w, h) crops
+        max_width: Maximum width passed to the detector per crop
+        buckets: Optional list of (width, height) fixed input shapes (letterboxed)
+
+    Returns:
+        List of face dicts, or None if no crop could be processed
+    """
+    faces = []
+    processed = False
+    for x, y, width, height in regions:
+        result = detect_faces_in_frame(detector, frame[y:y + height, x:x + width], max_width, buckets)
+        if result is None:
+            continue
+        processed = True
+        faces.extend(offset_detections(result, x, y))
+
+    if not processed:
+        return None
+    return merge_detections(faces) if len(regions) > 1 else faces
+
+
+class CoarseToFineDetector:
+    """
+    Two-pass detection that keeps small faces without detecting whole frames at full size
+
+    A coarse pass over a small downscale (with a low minimum face size and a
+    relaxed final threshold) proposes candidates. Confident, large candidates
+    are accepted as they are; the rest are re-detected at the fine scale
+    inside an expanded box around them.
+    """
+
+    def __init__(self, detector, coarse_width=320, fine_width=1280, coarse_min_face_size=12,
+                 fine_min_face_size=20, candidate_confidence=0.6, accept_confidence=0.9,
+                 refine_below=24, padding=0.5, refine_face_size=48, buckets=None):
+        """
+        Args:
+            detector: MTCNN detector
+            coarse_width: Full-frame width of the coarse pass
+            fine_width: Full-frame width of the refinement pass
+            coarse_min_face_size: Smallest face (coarse detector pixels) proposed by the coarse pass
+            fine_min_face_size: Smallest face (fine detector pixels) accepted by the refinement pass
+            candidate_confidence: Final-stage threshold for coarse candidates
+            accept_confidence: Coarse faces at least this confident are not refined...
+            refine_below: ...unless they are smaller than this many coarse detector pixels
+            padding: Fraction of the box size added around a candidate before refinement
+            refine_face_size: Candidate width (pixels) the refinement crops are scaled to
+            buckets: Optional fixed input shapes for the coarse pass (refinement crops are
+                     batched, and mtcnn pads a batch to its largest crop anyway)
+        """
+        self.detector = detector
+        self.coarse_width = coarse_width
+        self.fine_width = fine_width
+        self.coarse_min_face_size = coarse_min_face_size
+        self.fine_min_face_size = fine_min_face_size
+        self.candidate_confidence = candidate_confidence
+        self.accept_confidence = accept_confidence
+        self.refine_below = refine_below
+        self.padding = padding
+        self.refine_face_size = refine_face_size
+        self.buckets = buckets
+        self.passes = 0
+        self.candidates = 0
+        self.accepted = 0
+        self.refined = 0
+
+    def detect(self, frame, regions=None):
+        """
+        Detect faces in a BGR frame
+
+        Args:
+            frame: BGR image
+            regions: Optional (x, y, w, h) crops (e.g. from DetectionGate) the coarse pass is limited to
+
+        Returns:
+            List of face dicts in frame coordinates, or None if the frame could not be processed
+        """
+        height, width = frame.shape[:2]
+        coarse_scale = min(1.0, self.coarse_width / width)
+        fine_scale = min(1.0, self.fine_width / width)
+        self.passes += 1
+
+        # Coarse pass: small downscale, relaxed thresholds
+        candidates = []
+        processed = False
+        for x, y, w, h in regions or [(0, 0, width, height)]:
+            result = detect_faces_in_frame(self.detector, frame[y:y + h, x:x + w],
+                                           max(MIN_DETECTOR_SIZE, int(w * coarse_scale)),
+                                           buckets=self.buckets,
+                                           min_face_size=self.coarse_min_face_size,
+                                           threshold_onet=self.candidate_confidence)
+            if result is None:
+                continue
+            processed = True
+            candidates.extend(offset_detections(result, x, y))
+        if not processed:
+            return None
+        candidates = merge_detections(candidates)
+        self.candidates += len(candidates)
+
+        # Fine pass: re-detect small or uncertain candidates at the higher scale
+        faces = []
+        crops = []
+        for face in candidates:
+            if face['confidence'] >= self.accept_confidence and face['box'][2] * coarse_scale >= self.refine_below:
+                self.accepted += 1
+                faces.append(face)
+                continue
+
+            # Shrink the crop so the candidate is about refine_face_size pixels wide
+            # (never sampled finer than the fine pass scale); this keeps MTCNN's pyramid short
+            crop_scale = min(fine_scale, self.refine_face_size / max(1, face['box'][2]))
+            region = expand_region(face['box'][:4], self.padding, MIN_DETECTOR_SIZE / crop_scale,
+                                   width, height)
+            if region is None:
+                continue
+            x, y, w, h = region
+            with tracer.span('resize'):
+                rgb_crop, scale = prepare_detector_input(frame[y:y + h, x:x + w],
+                                                         max(MIN_DETECTOR_SIZE, int(w * crop_scale)))
+            if rgb_crop is not None:
+                crops.append((rgb_crop, scale, x, y))
+
+        if crops:
+            self.refined += len(crops)
+            # One batched call: MTCNN's per-call overhead dominates on small crops
+            with tracer.span('detect', crops=len(crops)):
+                results = self.detector.detect_faces([crop for crop, _, _, _ in crops],
+                                                     min_face_size=self.fine_min_face_size)
+            for (_, scale, x, y), result in zip(crops, results):
+                faces.extend(offset_detections(scale_detections(result or [], scale), x, y))
+
+        return merge_detections(faces)
+
+    def warm_up(self, frame_size):
+        """
+        Run both passes once with their detector options so live frames do not pay the first-call cost
+
+        A blank frame gives the coarse pass no candidates, so the fine pass
+        is warmed up with a batched call on its own.
+
+        Args:
+            frame_size: (width, height) of the camera frames
+
+        Returns:
+            Dict of 'coarse WxH' / 'fine WxH' -> warm-up milliseconds
+        """
+        width, height = frame_size
+        if self.buckets:
+            shapes = list(self.buckets)
+        else:
+            # The size detect() scales a whole frame to for the coarse pass
+            coarse_width = max(MIN_DETECTOR_SIZE, int(width * min(1.0, self.coarse_width / width)))
+            rgb_frame, _ = prepare_detector_input(np.zeros((height, width, 3), dtype=np.uint8), coarse_width)
+            shapes = [(rgb_frame.shape[1], rgb_frame.shape[0])] if rgb_frame is not None else []
+        timings = {f'coarse {shape}': ms for shape, ms in
+                   warm_up_detector(self.detector, shapes, min_face_size=self.coarse_min_face_size,
+                                    threshold_onet=self.candidate_confidence).items()}
+
+        # A refinement crop: a refine_face_size candidate plus padding on both sides
+        side = max(MIN_DETECTOR_SIZE, int(self.refine_face_size * (1 + 2 * self.padding)))
+        rng = np.random.default_rng(0)
+        crop = cv2.GaussianBlur(rng.integers(0, 255, (side, side, 3), dtype=np.uint8), (9, 9), 0)
+        start = time.perf_counter()
+        self.detector.detect_faces([crop], min_face_size=self.fine_min_face_size)
+        timings[f'fine {side}x{side}'] = (time.perf_counter() - start) * 1000
+        return timings
+
+    def get_stats(self):
+        """Candidate counters for the two passes"""
+        return {
+            'passes': self.passes,
+            'candidates': self.candidates,
+            'accepted_coarse': self.accepted,
+            'refined': self.refined,
+        }
+
+
+def create_coarse_to_fine_detector(detector, config):
+    """
+    Build the CoarseToFineDetector described by the configuration
+
+    Args:
+        detector: MTCNN detector
+        config: Flask config with the COARSE_* and FINE_* settings
+
+    Returns:
+        CoarseToFineDetector, or None unless DETECTION_MODE is 'coarse_to_fine'
+    """
+    if config['DETECTION_MODE'] != 'coarse_to_fine':
+        return None
+    return CoarseToFineDetector(detector,
+                                coarse_width=config['COARSE_DETECTION_WIDTH'],
+                                fine_width=config['FINE_DETECTION_WIDTH'],
+                                coarse_min_face_size=config['COARSE_MIN_FACE_SIZE'],
+                                fine_min_face_size=config['FINE_MIN_FACE_SIZE'],
+                                candidate_confidence=config['COARSE_CANDIDATE_CONFIDENCE'],
+                                accept_confidence=config['COARSE_ACCEPT_CONFIDENCE'],
+                                refine_below=config['COARSE_REFINE_BELOW'],
+                                padding=config['REFINE_PADDING'],
+                                refine_face_size=config['REFINE_FACE_SIZE'],
+                                buckets=config['DETECTOR_INPUT_BUCKETS'])
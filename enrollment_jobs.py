@@ -0,0 +1,116 @@
+"""
+Background enrollment queue.
+
+/add_user only reads the upload into memory and queues a job; a single
+worker thread decodes it with cv2.imdecode, runs face detection and feature
+extraction, and applies the gallery update. One worker keeps enrollments
+serialized while the live recognizer keeps matching against the previous
+gallery snapshot until the new one is swapped in.
+"""
+
+import queue
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+import cv2
+import numpy as np
+
+
+class EnrollmentQueue:
+    """Run enrollments on a background thread and track their status by job id"""
+
+    def __init__(self, recognizer, max_jobs=200):
+        """
+        Args:
+            recognizer: FaceRecognitionSystem the samples are enrolled into
+            max_jobs: Finished jobs kept for status queries (oldest are dropped)
+        """
+        self.recognizer = recognizer
+        self.max_jobs = max_jobs
+        self._jobs = OrderedDict()
+        self._lock = threading.Lock()
+        self._queue = queue.Queue()
+        self._worker = threading.Thread(target=self._run, daemon=True)
+        self._worker.start()
+
+    def submit(self, name, image_bytes, save_path=None):
+        """
+        Queue an enrollment
+
+        Args:
+            name: User's name
+            image_bytes: Encoded image as uploaded
+            save_path: Keep a copy of the photo here once it is enrolled (None = do not keep)
+
+        Returns:
+            Job id
+        """
+        job_id = uuid.uuid4().hex
+        job = {
+            'id': job_id,
+            'name': name,
+            'status': 'queued',
+            'message': 'Waiting for enrollment worker',
+            'submitted': time.time(),
+            'finished': None,
+        }
+        with self._lock:
+            self._jobs[job_id] = job
+            # Drop the oldest finished jobs; queued and running jobs are always kept
+            for old_id in [key for key, old in self._jobs.items() if old['finished'] is not None]:
+                if len(self._jobs) <= self.max_jobs:
+                    break
+                del self._jobs[old_id]
+        self._queue.put((job_id, name, image_bytes, save_path))
+        return job_id
+
+    def get(self, job_id):
+        """Copy of a job's status dict (None if unknown)"""
+        with self._lock:
+            job = self._jobs.get(job_id)
+            return dict(job) if job is not None else None
+
+    def pending(self):
+        """Number of jobs waiting or running"""
+        with self._lock:
+            return sum(1 for job in self._jobs.values() if job['finished'] is None)
+
+    def _update(self, job_id, **fields):
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is not None:
+                job.update(fields)
+
+    def _run(self):
+        while True:
+            job_id, name, image_bytes, save_path = self._queue.get()
+            self._update(job_id, status='running', message='Processing photo')
+            try:
+                status, message = self._enroll(name, image_bytes, save_path)
+            except Exception as e:
+                print(f"❌ Enrollment job {job_id} failed: {e}")
+                status, message = 'failed', 'Failed to process face in image'
+            self._update(job_id, status=status, message=message, finished=time.time())
+
+    def _enroll(self, name, image_bytes, save_path):
+        # Decode straight from the uploaded bytes; nothing is read back from disk
+        image = cv2.imdecode(np.frombuffer(image_bytes, np.uint8), cv2.IMREAD_COLOR)
+        if image is None:
+            return 'failed', 'Could not decode the uploaded image'
+
+        result = self.recognizer.enroll_image(name, image)
+        if result['status'] == 'failed':
+            return 'failed', 'Failed to process face in image'
+        if result['status'] == 'duplicate':
+            return 'done', (f"{name} is already enrolled with a near-identical photo "
+                            f"(similarity {result['similarity']:.3f}); sample skipped")
+
+        if save_path:
+            try:
+                with open(save_path, 'wb') as f:
+                    f.write(image_bytes)
+            except OSError as e:
+                print(f"Error saving enrollment photo {save_path}: {e}")
+        return 'done', f"User {name} added successfully"
@@ -0,0 +1,289 @@
+"""
+Evidence clips for unauthorized / unknown face events.
+
+Recording continuously is too expensive, so the recorder keeps only a short
+ring buffer of recent JPEG-encoded frames in memory. When an event fires,
+the buffered frames become the clip's pre-roll and recording continues
+until post_roll seconds after the last event (capped at max_clip_seconds).
+
+The capture thread only hands over frame references (snapshots are
+immutable) and never waits: frames are encoded on an encoder thread and
+clips are written by a separate writer thread, so disk I/O can never stall
+capture or detection. Each clip is a multipart MJPEG file (playable with
+ffplay/VLC) plus a JSON sidecar with per-frame timestamps and the events.
+"""
+
+import json
+import os
+import queue
+import threading
+import time
+from collections import deque
+from datetime import datetime
+
+from jpeg_encoder import create_jpeg_encoder
+
+
+class EventClipRecorder:
+    """Pre-roll ring buffer of encoded frames with asynchronous clip writing"""
+
+    def __init__(self, output_dir='data/events', camera_id=0, pre_roll=3.0, post_roll=5.0,
+                 max_clip_seconds=60.0, fps=10, jpeg_quality=70, encoder_backend='auto',
+                 lib_path=None, max_pending_writes=512):
+        """
+        Args:
+            output_dir: Directory the clips are written to
+            camera_id: Camera the frames come from (part of the clip name)
+            pre_roll: Seconds of frames kept before an event
+            post_roll: Seconds recorded after the last event
+            max_clip_seconds: A clip is closed after this long even if events continue
+            fps: Frames per second buffered and recorded (0 = every frame)
+            jpeg_quality: JPEG quality of the buffered frames
+            encoder_backend: JPEG encoder backend (see jpeg_encoder)
+            lib_path: Optional libturbojpeg location
+            max_pending_writes: Frames queued for the writer before new ones are dropped
+        """
+        self.output_dir = output_dir
+        self.camera_id = camera_id
+        self.pre_roll = pre_roll
+        self.post_roll = post_roll
+        self.max_clip_seconds = max_clip_seconds
+        self._interval = 1.0 / fps if fps and fps > 0 else 0.0
+        self._encoder = create_jpeg_encoder(encoder_backend, jpeg_quality, lib_path)
+        self._ring = deque()  # (captured, jpeg bytes, faces), owned by the encoder thread
+        self._frames = queue.Queue(maxsize=4)  # frames waiting to be encoded
+        self._writes = queue.Queue(maxsize=max_pending_writes)  # writer messages
+        self._lock = threading.Lock()
+        self._clip = None  # Active clip, see trigger()
+        self._retired = []  # Clips replaced by trigger(), closed by the encoder thread
+        self._last_frame_time = None
+        self._running = True
+
+        self.frames_encoded = 0
+        self.frames_dropped = 0  # encoder busy
+        self.writes_dropped = 0  # writer behind
+        self.events = 0
+        self.clips_started = 0
+        self.clips_written = 0
+        self.bytes_written = 0
+
+        self._encode_thread = threading.Thread(target=self._encode_loop, daemon=True)
+        self._writer_thread = threading.Thread(target=self._write_loop, daemon=True)
+        self._encode_thread.start()
+        self._writer_thread.start()
+
+    def add_frame(self, snapshot):
+        """
+        Offer a published frame to the ring buffer (capture thread, never blocks)
+
+        Args:
+            snapshot: FrameSnapshot; its frame is read-only, so no copy is made
+        """
+        if snapshot.frame is None:
+            return
+        captured = snapshot.captured or snapshot.timestamp
+        if self._last_frame_time is not None and captured - self._last_frame_time < self._interval:
+            return
+        self._last_frame_time = captured
+        try:
+            self._frames.put_nowait((captured, snapshot.frame, snapshot.faces))
+        except queue.Full:
+            self.frames_dropped += 1
+
+    def trigger(self, reason, faces=()):
+        """
+        Report an event: start a clip or extend the active one
+
+        Args:
+            reason: Short event label, e.g. 'unauthorized'
+            faces: Face dicts involved in the event
+        """
+        now = time.time()
+        event = {
+            'time': now,
+            'reason': reason,
+            'faces': [_face_summary(face) for face in faces],
+        }
+        with self._lock:
+            self.events += 1
+            if self._clip is not None and now < self._clip['deadline']:
+                self._clip['until'] = min(self._clip['deadline'], now + self.post_roll)
+                self._clip['events'].append(event)
+                return
+            if self._clip is not None:
+                # Past max_clip_seconds: the encoder thread closes it after its last frame
+                self._retired.append(self._clip)
+            stamp = datetime.fromtimestamp(now).strftime('%Y%m%d_%H%M%S_%f')[:-3]
+            self._clip = {
+                'id': f"cam{self.camera_id}_{stamp}_{reason}",
+                'reason': reason,
+                'until': now + self.post_roll,
+                'deadline': now + self.max_clip_seconds,
+                'events': [event],
+                'opened': False,
+            }
+            self.clips_started += 1
+
+    def _encode_loop(self):
+        while self._running or not self._frames.empty():
+            try:
+                captured, frame, faces = self._frames.get(timeout=0.5)
+            except queue.Empty:
+                self._close_expired(time.time())
+                continue
+
+            data = self._encoder.encode(frame)
+            if data is None:
+                continue
+            # Encoders may reuse their output buffer, so keep a copy
+            item = (captured, bytes(data), [_face_summary(face) for face in faces])
+            self.frames_encoded += 1
+
+            self._ring.append(item)
+            while self._ring and captured - self._ring[0][0] > self.pre_roll:
+                self._ring.popleft()
+
+            with self._lock:
+                clip = self._clip
+                opening = clip is not None and not clip['opened']
+                if opening:
+                    clip['opened'] = True
+            if opening:
+                # The ring (including this frame) is the pre-roll
+                self._writes.put(('open', clip['id'], list(self._ring)))
+            elif clip is not None:
+                try:
+                    self._writes.put_nowait(('frame', clip['id'], item))
+                except queue.Full:
+                    self.writes_dropped += 1
+            self._close_expired(captured)
+
+    def _close_expired(self, now):
+        """Close retired clips, and the active clip once its post-roll has passed"""
+        with self._lock:
+            expired, self._retired = self._retired, []
+            if self._clip is not None and now >= self._clip['until']:
+                expired.append(self._clip)
+                self._clip = None
+        # Only this thread queues clip messages, so a close always follows its open and frames
+        for clip in expired:
+            if clip['opened']:
+                self._writes.put(('close', clip['id'], clip))
+
+    def _write_loop(self):
+        files = {}
+        while True:
+            message = self._writes.get()
+            if message is None:
+                break
+            kind, clip_id, payload = message
+            try:
+                if kind == 'open':
+                    os.makedirs(self.output_dir, exist_ok=True)
+                    path = os.path.join(self.output_dir, clip_id + '.mjpeg.part')
+                    files[clip_id] = (open(path, 'wb'), [])
+                    for item in payload:
+                        self._write_frame(files[clip_id], item)
+                elif kind == 'frame' and clip_id in files:
+                    self._write_frame(files[clip_id], payload)
+                elif kind == 'close' and clip_id in files:
+                    self._finish_clip(clip_id, files.pop(clip_id), payload)
+            except OSError as e:
+                print(f"❌ Error writing event clip {clip_id}: {e}")
+                handle = files.pop(clip_id, None)
+                if handle is not None:
+                    handle[0].close()
+
+        for clip_id, handle in files.items():
+            handle[0].close()
+
+    def _write_frame(self, handle, item):
+        f, frames = handle
+        captured, data, faces = item
+        f.write(b'--frame\r\nContent-Type: image/jpeg\r\n\r\n')
+        f.write(data)
+        f.write(b'\r\n')
+        frames.append({'captured': captured, 'faces': faces})
+        self.bytes_written += len(data)
+
+    def _finish_clip(self, clip_id, handle, clip):
+        f, frames = handle
+        f.close()
+        path = os.path.join(self.output_dir, clip_id + '.mjpeg')
+        os.replace(path + '.part', path)
+
+        metadata = {
+            'camera': self.camera_id,
+            'reason': clip['reason'],
+            'pre_roll': self.pre_roll,
+            'post_roll': self.post_roll,
+            'events': clip['events'],
+            'frames': frames,
+        }
+        with open(os.path.join(self.output_dir, clip_id + '.json'), 'w', encoding='utf-8') as meta:
+            json.dump(metadata, meta, ensure_ascii=False, indent=2)
+        self.clips_written += 1
+        print(f"🎬 Event clip saved: {path} ({len(frames)} frames)")
+
+    def get_stats(self):
+        """Return buffer and clip counters"""
+        with self._lock:
+            recording = self._clip['id'] if self._clip is not None else None
+        return {
+            'buffered_frames': len(self._ring),
+            'frames_encoded': self.frames_encoded,
+            'frames_dropped': self.frames_dropped,
+            'writes_pending': self._writes.qsize(),
+            'writes_dropped': self.writes_dropped,
+            'events': self.events,
+            'clips_started': self.clips_started,
+            'clips_written': self.clips_written,
+            'bytes_written': self.bytes_written,
+            'recording': recording,
+        }
+
+    def close(self, timeout=5.0):
+        """Finish the active clip with what was recorded so far and stop the threads"""
+        self._running = False
+        self._encode_thread.join(timeout=timeout)
+        with self._lock:
+            if self._clip is not None:
+                self._clip['until'] = 0.0
+        self._close_expired(time.time())
+        self._writes.put(None)
+        self._writer_thread.join(timeout=timeout)
+
+
+def _face_summary(face):
+    """JSON-friendly subset of a face dict"""
+    summary = {
+        'box': [int(v) for v in face.get('box', ())],
+        'confidence': float(face.get('confidence', 0.0)),
+    }
+    for key in ('track_id', 'name', 'authorized'):
+        if face.get(key) is not None:
+            summary[key] = face[key]
+    return summary
+
+
+def create_event_recorder(config):
+    """
+    Build the EventClipRecorder described by the configuration
+
+    Args:
+        config: Flask config with EVENT_* settings
+
+    Returns:
+        EventClipRecorder, or None when EVENT_RECORDING is off
+    """
+    if not config['EVENT_RECORDING']:
+        return None
+    return EventClipRecorder(output_dir=config['EVENT_CLIP_DIR'],
+                             camera_id=config['CAMERA_INDEX'],
+                             pre_roll=config['EVENT_PRE_ROLL'],
+                             post_roll=config['EVENT_POST_ROLL'],
+                             max_clip_seconds=config['EVENT_MAX_CLIP_SECONDS'],
+                             fps=config['EVENT_RECORD_FPS'],
+                             jpeg_quality=config['EVENT_JPEG_QUALITY'],
+                             encoder_backend=config['JPEG_ENCODER'],
+                             lib_path=config['TURBOJPEG_LIB_PATH'])
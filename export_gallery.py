@@ -0,0 +1,43 @@
+#!/usr/bin/env python3
+"""
+Export the face gallery from its shard files to a single pickle.
+
+The memory-mapped shard files are the live store. The pickle is a portable
+copy (backups, moving the gallery to another machine); the server imports
+data/face_encodings.pkl only when it creates a new shard directory:
+
+    python export_gallery.py
+    python export_gallery.py --output backups/gallery.pkl
+"""
+
+import argparse
+
+from config import Config
+from face_recognition_system import FaceRecognitionSystem
+
+
+def main():
+    """Command line entry point"""
+    parser = argparse.ArgumentParser(description='Export the face gallery to a pickle file')
+    parser.add_argument('--output', default='data/face_encodings.pkl',
+                        help='Pickle to write (data/face_encodings.pkl seeds a new shard directory)')
+    args = parser.parse_args()
+
+    print("📦 Gallery Export")
+    print("=" * 50)
+
+    recognizer = FaceRecognitionSystem(prototypes_per_identity=Config.GALLERY_PROTOTYPES_PER_IDENTITY,
+                                       rerank_candidates=Config.GALLERY_RERANK_CANDIDATES,
+                                       gallery_shards=Config.GALLERY_SHARDS,
+                                       shard_dir=Config.GALLERY_SHARD_DIR,
+                                       shard_processes=False)
+    if not recognizer.save_encodings(args.output):
+        raise SystemExit(1)
+
+    print("=" * 50)
+    print(f"Exported {len(recognizer.gallery)} identities "
+          f"({recognizer.gallery.num_samples()} samples) to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
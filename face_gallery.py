@@ -0,0 +1,312 @@
+"""
+Identity gallery for face recognition.
+
+Each identity keeps all of its enrolled sample vectors plus one or a few
+prototype vectors (the normalized mean, or k-medoids for several
+prototypes). Matching scans the prototype matrix first and optionally
+re-ranks the best candidates against their individual samples, so the
+scan size grows with the number of people rather than the number of photos.
+"""
+
+import threading
+
+import numpy as np
+
+
+def _normalize_rows(matrix):
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+
+def compute_prototypes(samples, num_prototypes=1, iterations=10):
+    """
+    Aggregate an identity's samples into prototype vectors
+
+    Args:
+        samples: (n, d) matrix of L2-normalized feature vectors
+        num_prototypes: 1 for the mean vector, more for k-medoids
+        iterations: Maximum k-medoids refinement passes
+
+    Returns:
+        (p, d) matrix of L2-normalized prototypes
+    """
+    if num_prototypes <= 1:
+        return _normalize_rows(samples.mean(axis=0, keepdims=True))
+    if len(samples) <= num_prototypes:
+        return samples.copy()
+
+    similarity = samples @ samples.T
+
+    # Farthest-first initialization, starting from the most central sample
+    medoids = [int(np.argmax(similarity.sum(axis=1)))]
+    while len(medoids) < num_prototypes:
+        closest = similarity[:, medoids].max(axis=1)
+        medoids.append(int(np.argmin(closest)))
+
+    for _ in range(iterations):
+        assignment = np.argmax(similarity[:, medoids], axis=1)
+        updated = []
+        for cluster in range(num_prototypes):
+            members = np.flatnonzero(assignment == cluster)
+            if len(members) == 0:
+                updated.append(medoids[cluster])
+                continue
+            # The medoid is the member most similar to the rest of its cluster
+            within = similarity[np.ix_(members, members)].sum(axis=1)
+            updated.append(int(members[np.argmax(within)]))
+        if updated == medoids:
+            break
+        medoids = updated
+
+    return samples[medoids].copy()
+
+
+def dedupe_samples(samples, threshold, merge=False):
+    """
+    Collapse near-identical samples of one identity
+
+    Samples are visited in enrollment order; each one that is not yet
+    assigned starts a group with every unassigned sample at least
+    `threshold` similar to it.
+
+    Args:
+        samples: (n, d) matrix of L2-normalized feature vectors
+        threshold: Cosine similarity at which two samples are duplicates
+        merge: Replace each group by its normalized mean instead of its first sample
+
+    Returns:
+        (m, d) matrix of the remaining samples, m <= n
+    """
+    samples = np.asarray(samples, dtype=np.float32)
+    if len(samples) < 2:
+        return samples
+
+    similarity = samples @ samples.T
+    assignment = np.full(len(samples), -1)
+    groups = []
+    for i in range(len(samples)):
+        if assignment[i] >= 0:
+            continue
+        members = np.flatnonzero((similarity[i] >= threshold) & (assignment < 0))
+        members = np.union1d(members, [i])
+        assignment[members] = len(groups)
+        groups.append(members)
+
+    if merge:
+        return _normalize_rows(np.vstack([samples[members].mean(axis=0) for members in groups]))
+    return samples[[members[0] for members in groups]]
+
+
+class IdentityGallery:
+    """
+    Per-identity samples and prototypes with vectorized matching
+
+    The gallery state is an immutable snapshot replaced by a single reference
+    assignment on every change (copy-on-write). Matching reads the current
+    snapshot without locking, so it never blocks on an enrollment and never
+    sees a half-applied update; writers are serialized by a lock.
+    """
+
+    def __init__(self, prototypes_per_identity=1, rerank_candidates=3):
+        """
+        Args:
+            prototypes_per_identity: Prototype vectors kept per identity
+            rerank_candidates: Identities re-ranked against their samples (0 = prototypes only)
+        """
+        self.prototypes_per_identity = prototypes_per_identity
+        self.rerank_candidates = rerank_candidates
+        self._write_lock = threading.Lock()
+        # (samples {name: (n, d)}, prototypes {name: (p, d)}, prototype matrix, owner name per row)
+        self._state = ({}, {}, np.zeros((0, 0), dtype=np.float32), [])
+
+    def _publish(self, samples, prototypes):
+        """Build the prototype index for new dicts and swap the snapshot in"""
+        owners = []
+        blocks = []
+        for name, identity_prototypes in prototypes.items():
+            owners.extend([name] * len(identity_prototypes))
+            blocks.append(identity_prototypes)
+        matrix = np.vstack(blocks) if blocks else np.zeros((0, 0), dtype=np.float32)
+        self._state = (samples, prototypes, matrix, owners)
+
+    def __len__(self):
+        return len(self._state[0])
+
+    def __contains__(self, name):
+        return name in self._state[0]
+
+    def is_empty(self):
+        """True if no identities are enrolled"""
+        return not self._state[0]
+
+    def names(self):
+        """List of enrolled identity names (one entry per person)"""
+        return list(self._state[0])
+
+    def samples(self, name):
+        """Sample matrix of one identity (None if unknown)"""
+        return self._state[0].get(name)
+
+    def sample_counts(self):
+        """Number of enrolled samples per identity"""
+        return {name: len(samples) for name, samples in self._state[0].items()}
+
+    def num_samples(self):
+        """Total number of enrolled samples"""
+        return sum(len(samples) for samples in self._state[0].values())
+
+    def _prepare(self, samples):
+        samples = np.asarray(samples, dtype=np.float32)
+        if samples.ndim == 1:
+            samples = samples[None, :]
+        return samples, compute_prototypes(samples, self.prototypes_per_identity)
+
+    def set_samples(self, name, samples):
+        """Replace all samples of an identity and refresh its prototypes"""
+        samples, identity_prototypes = self._prepare(samples)
+        with self._write_lock:
+            current_samples, current_prototypes = self._state[:2]
+            self._publish(dict(current_samples, **{name: samples}),
+                          dict(current_prototypes, **{name: identity_prototypes}))
+
+    def add_sample(self, name, features):
+        """Add one feature vector to an identity (creating it if needed)"""
+        features = np.asarray(features, dtype=np.float32)[None, :]
+        with self._write_lock:
+            current_samples, current_prototypes = self._state[:2]
+            existing = current_samples.get(name)
+            samples = features if existing is None else np.vstack([existing, features])
+            samples, identity_prototypes = self._prepare(samples)
+            self._publish(dict(current_samples, **{name: samples}),
+                          dict(current_prototypes, **{name: identity_prototypes}))
+
+    def remove_identity(self, name):
+        """Remove an identity and all of its samples"""
+        with self._write_lock:
+            current_samples, current_prototypes = self._state[:2]
+            if name not in current_samples:
+                return False
+            self._publish({key: value for key, value in current_samples.items() if key != name},
+                          {key: value for key, value in current_prototypes.items() if key != name})
+            return True
+
+    def clear(self):
+        """Remove all identities"""
+        with self._write_lock:
+            self._publish({}, {})
+
+    def _rank(self, scores, features, owners, samples, k):
+        """Top-k identities for one query from its prototype scores"""
+        # Each identity owns at most prototypes_per_identity rows, so this many
+        # top rows always contain the wanted number of distinct identities
+        wanted = max(k, self.rerank_candidates)
+        limit = min(len(owners), wanted * max(1, self.prototypes_per_identity))
+        rows = np.argpartition(-scores, limit - 1)[:limit]
+        rows = rows[np.argsort(-scores[rows])]
+
+        candidates = {}
+        for row in rows:
+            name = owners[row]
+            if name not in candidates:
+                candidates[name] = float(scores[row])
+                if len(candidates) >= wanted:
+                    break
+
+        if self.rerank_candidates > 0:
+            # Re-rank the best prototype hits against each candidate's own samples
+            for name in candidates:
+                identity_samples = samples.get(name)
+                if identity_samples is not None:
+                    candidates[name] = float(np.max(identity_samples @ features))
+
+        ranked = sorted(candidates.items(), key=lambda item: item[1], reverse=True)
+        return ranked[:k]
+
+    def search_batch(self, features, k=1):
+        """
+        Rank enrolled identities for a batch of feature vectors
+
+        Args:
+            features: (n, d) matrix (or one d vector) of L2-normalized features
+            k: Identities returned per query
+
+        Returns:
+            List (one per query) of up to k (name, similarity) tuples, best first
+        """
+        features = np.asarray(features, dtype=np.float32)
+        if features.ndim == 1:
+            features = features[None, :]
+
+        # One snapshot for the whole batch, however the gallery changes meanwhile
+        samples, _, matrix, owners = self._state
+        if len(owners) == 0:
+            return [[] for _ in range(len(features))]
+
+        # One matrix product scores every query against every prototype
+        scores = features @ matrix.T
+        return [self._rank(scores[i], features[i], owners, samples, k) for i in range(len(features))]
+
+    def top_k(self, features, k=1):
+        """
+        Rank enrolled identities against a feature vector
+
+        Args:
+            features: L2-normalized feature vector
+            k: Number of identities to return
+
+        Returns:
+            List of up to k (name, similarity) tuples, best first
+        """
+        return self.search_batch(features, k)[0]
+
+    def match(self, features):
+        """
+        Find the best matching identity for a feature vector
+
+        Args:
+            features: L2-normalized feature vector
+
+        Returns:
+            Tuple of (name, similarity), or (None, 0.0) if the gallery is empty
+        """
+        ranked = self.top_k(features, 1)
+        if not ranked:
+            return None, 0.0
+        return ranked[0]
+
+    def to_dict(self):
+        """Serializable {name: samples} mapping"""
+        return dict(self._state[0])
+
+    def prototypes(self):
+        """{name: prototypes} mapping matching to_dict()"""
+        return dict(self._state[1])
+
+    def load_dict(self, identities, prototypes=None):
+        """
+        Replace the gallery with a {name: samples} mapping
+
+        Args:
+            identities: {name: (n, d) samples}
+            prototypes: Optional {name: (p, d) prototypes} computed earlier with the same
+                        prototypes_per_identity; identities missing from it are recomputed
+        """
+        known = prototypes or {}
+        samples = {}
+        prototypes = {}
+        for name, identity_samples in identities.items():
+            if name in known:
+                samples[name] = np.atleast_2d(identity_samples)
+                prototypes[name] = known[name]
+            else:
+                samples[name], prototypes[name] = self._prepare(identity_samples)
+        with self._write_lock:
+            self._publish(samples, prototypes)
+
+    def load_legacy(self, faces, names):
+        """Build the gallery from the old parallel faces/names lists"""
+        grouped = {}
+        for features, name in zip(faces, names):
+            grouped.setdefault(name, []).append(np.asarray(features, dtype=np.float32))
+        self.load_dict({name: np.vstack(samples) for name, samples in grouped.items()})
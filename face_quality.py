@@ -0,0 +1,254 @@
+"""
+Face quality gate run before recognition.
+
+Recognition crops, extracts features and scans the gallery for every
+detected face, even ones that will never match. The gate scores each face
+with cheap checks, in order of cost: MTCNN confidence, box size, pose from
+the five keypoints, then Laplacian-variance sharpness of a small grayscale
+crop. Faces that fail are skipped (reported as unknown) or deferred (the
+track keeps its last recognition result), and the counters show how much
+work is saved per reason so the thresholds can be tuned against missed
+matches.
+"""
+
+import math
+import threading
+import time
+
+import cv2
+import numpy as np
+
+# Checks in the order they run; each rejection is counted under its name
+QUALITY_CHECKS = ('confidence', 'size', 'pose', 'blur')
+
+
+def estimate_pose(keypoints):
+    """
+    Rough head pose from the MTCNN keypoints
+
+    Args:
+        keypoints: Dict with left_eye, right_eye, nose, mouth_left and mouth_right points
+
+    Returns:
+        Tuple of (yaw, pitch, roll): yaw is the nose offset from the face midline
+        in inter-eye distances (0 = frontal), pitch is the nose position between
+        the eye line (0) and the mouth line (1), roll is the eye line angle in degrees.
+        None if keypoints are missing or degenerate.
+    """
+    try:
+        left_eye, right_eye, nose, mouth_left, mouth_right = (
+            np.asarray(keypoints[key], dtype=np.float64)
+            for key in ('left_eye', 'right_eye', 'nose', 'mouth_left', 'mouth_right'))
+    except (KeyError, TypeError):
+        return None
+
+    eye_center = (left_eye + right_eye) / 2
+    mouth_center = (mouth_left + mouth_right) / 2
+    eye_distance = np.linalg.norm(right_eye - left_eye)
+    axis = mouth_center - eye_center
+    axis_length = np.dot(axis, axis)
+    if eye_distance < 1 or axis_length < 1:
+        return None
+
+    roll = math.degrees(math.atan2(right_eye[1] - left_eye[1], right_eye[0] - left_eye[0]))
+    yaw = (nose[0] - (eye_center[0] + mouth_center[0]) / 2) / eye_distance
+    pitch = np.dot(nose - eye_center, axis) / axis_length
+    return float(yaw), float(pitch), float(roll)
+
+
+def sharpness(face_img, size=64):
+    """
+    Laplacian variance of a face crop scaled to a fixed size
+
+    Scaling first makes the score depend on blur relative to the face, not on
+    how many pixels the face covers, and keeps the cost constant. Bilinear
+    scaling only reads the pixels it samples, so a large face costs no more
+    than a small one (area averaging would read the whole crop).
+
+    Args:
+        face_img: BGR or grayscale face crop
+        size: Side of the square the crop is resized to
+
+    Returns:
+        Sharpness score (higher is sharper)
+    """
+    small = cv2.resize(face_img, (size, size), interpolation=cv2.INTER_LINEAR)
+    if small.ndim == 3:
+        small = cv2.cvtColor(small, cv2.COLOR_BGR2GRAY)
+    return float(cv2.Laplacian(small, cv2.CV_64F).var())
+
+
+class FaceQualityGate:
+    """Decide whether a detected face is worth recognizing"""
+
+    def __init__(self, mode='skip', min_confidence=0.95, min_face_size=40, max_yaw=0.3,
+                 pitch_range=(0.3, 0.8), max_roll=25.0, min_sharpness=50.0):
+        """
+        Args:
+            mode: 'skip' reports low-quality faces as unknown, 'defer' keeps the
+                  track's last recognition result while its quality is low
+            min_confidence: Minimum MTCNN confidence
+            min_face_size: Minimum box width and height in frame pixels
+            max_yaw: Maximum nose offset from the face midline (inter-eye distances)
+            pitch_range: Accepted (min, max) nose position between eye and mouth lines
+            max_roll: Maximum eye line tilt in degrees
+            min_sharpness: Minimum Laplacian variance of the 64x64 crop (None = no blur check)
+        """
+        self.mode = mode
+        self.min_confidence = min_confidence
+        self.min_face_size = min_face_size
+        self.max_yaw = max_yaw
+        self.pitch_range = pitch_range
+        self.max_roll = max_roll
+        self.min_sharpness = min_sharpness
+        self._lock = threading.Lock()
+        self.assessed = 0
+        self.passed = 0
+        self.deferred = 0
+        self.rejected = {check: 0 for check in QUALITY_CHECKS}
+
+    def _failed_check(self, frame, face_info):
+        if face_info.get('confidence', 1.0) < self.min_confidence:
+            return 'confidence'
+
+        x, y, width, height = face_info['box']
+        if min(width, height) < self.min_face_size:
+            return 'size'
+
+        pose = estimate_pose(face_info.get('keypoints'))
+        if pose is not None:
+            yaw, pitch, roll = pose
+            if (abs(yaw) > self.max_yaw or abs(roll) > self.max_roll
+                    or not self.pitch_range[0] <= pitch <= self.pitch_range[1]):
+                return 'pose'
+
+        if self.min_sharpness is not None:
+            x1, y1 = max(0, x), max(0, y)
+            face_img = frame[y1:y + height, x1:x + width]
+            if face_img.size == 0 or sharpness(face_img) < self.min_sharpness:
+                return 'blur'
+        return None
+
+    def check(self, frame, face_info):
+        """
+        Run the quality checks on a detected face
+
+        Args:
+            frame: Image the face was detected in
+            face_info: Face detection result from MTCNN
+
+        Returns:
+            Name of the first failed check, or None if the face should be recognized
+        """
+        failed = self._failed_check(frame, face_info)
+        with self._lock:
+            self.assessed += 1
+            if failed is None:
+                self.passed += 1
+            else:
+                self.rejected[failed] += 1
+        return failed
+
+    def record_deferred(self):
+        """Count a rejected face that reused its track's previous result"""
+        with self._lock:
+            self.deferred += 1
+
+    def get_stats(self):
+        """Return pass/reject counters"""
+        with self._lock:
+            return {
+                'mode': self.mode,
+                'assessed': self.assessed,
+                'passed': self.passed,
+                'rejected': dict(self.rejected),
+                'deferred': self.deferred,
+                'skip_rate': (self.assessed - self.passed) / self.assessed if self.assessed else 0.0,
+            }
+
+
+class TrackResultMemory:
+    """
+    Last good recognition result of each track, for 'defer' mode with detection workers
+
+    Workers recognize before the server assigns track IDs and keep no
+    recognition cache, so they cannot defer on their own. They tag faces
+    that failed the gate with 'quality_failed', and after tracking the
+    server gives those faces their track's previous result.
+    """
+
+    RESULT_KEYS = ('name', 'score', 'authorized')
+
+    def __init__(self, max_age=2.0):
+        """
+        Args:
+            max_age: Seconds a track's result is reused while its faces keep failing the gate
+        """
+        self.max_age = max_age
+        self._results = {}  # track_id -> (result fields, time recognized)
+        self.deferred = 0
+
+    def apply(self, faces):
+        """
+        Remember passing faces' results and fill them in for rejected faces
+
+        Args:
+            faces: Tracked face dicts from the workers
+
+        Returns:
+            New list of face dicts
+        """
+        now = time.time()
+        updated = []
+        for face in faces:
+            track_id = face.get('track_id')
+            if track_id is not None and 'quality_failed' not in face:
+                self._results[track_id] = ({key: face.get(key) for key in self.RESULT_KEYS}, now)
+            elif track_id is not None and track_id in self._results:
+                result, recognized = self._results[track_id]
+                if now - recognized <= self.max_age:
+                    face = dict(face, **result)
+                    self.deferred += 1
+            updated.append(face)
+
+        for track_id in [track_id for track_id, (_, recognized) in self._results.items()
+                         if now - recognized > self.max_age]:
+            del self._results[track_id]
+        return updated
+
+
+def merge_quality_stats(stats_list):
+    """Sum the counters of several gates (e.g. one per detection worker)"""
+    stats_list = [stats for stats in stats_list if stats]
+    if not stats_list:
+        return None
+    merged = {
+        'mode': stats_list[0]['mode'],
+        'assessed': sum(stats['assessed'] for stats in stats_list),
+        'passed': sum(stats['passed'] for stats in stats_list),
+        'rejected': {check: sum(stats['rejected'][check] for stats in stats_list) for check in QUALITY_CHECKS},
+        'deferred': sum(stats['deferred'] for stats in stats_list),
+    }
+    merged['skip_rate'] = (merged['assessed'] - merged['passed']) / merged['assessed'] if merged['assessed'] else 0.0
+    return merged
+
+
+def create_quality_gate(config):
+    """
+    Build the FaceQualityGate described by the configuration
+
+    Args:
+        config: Flask config (or dict) with FACE_QUALITY_* settings
+
+    Returns:
+        FaceQualityGate, or None when FACE_QUALITY_MODE is 'off'
+    """
+    if config['FACE_QUALITY_MODE'] == 'off':
+        return None
+    return FaceQualityGate(mode=config['FACE_QUALITY_MODE'],
+                           min_confidence=config['FACE_QUALITY_MIN_CONFIDENCE'],
+                           min_face_size=config['FACE_QUALITY_MIN_SIZE'],
+                           max_yaw=config['FACE_QUALITY_MAX_YAW'],
+                           pitch_range=config['FACE_QUALITY_PITCH_RANGE'],
+                           max_roll=config['FACE_QUALITY_MAX_ROLL'],
+                           min_sharpness=config['FACE_QUALITY_MIN_SHARPNESS'])
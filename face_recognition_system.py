@@ -2,19 +2,81 @@ import cv2
 import numpy as np
 import os
 import pickle
-from sklearn.metrics.pairwise import cosine_similarity
+import threading
+import time
+from face_gallery import dedupe_samples
+from sharded_gallery import ShardedGallery
+from recognition_cache import appearance_hash
+from frame_tracer import tracer
+
+def recognizer_options(config):
+    """
+    FaceRecognitionSystem keyword arguments described by the configuration
+    
+    Args:
+        config: Flask config (or dict, e.g. vars(Config)) with FACE_RECOGNITION_*,
+                GALLERY_* and ENROLLMENT_DEDUP_* settings
+        
+    Returns:
+        Dict of keyword arguments (the gallery is served the way the server serves it)
+    """
+    return {
+        'threshold': config['FACE_RECOGNITION_SIMILARITY_THRESHOLD'],
+        'prototypes_per_identity': config['GALLERY_PROTOTYPES_PER_IDENTITY'],
+        'rerank_candidates': config['GALLERY_RERANK_CANDIDATES'],
+        'gallery_shards': config['GALLERY_SHARDS'],
+        'shard_dir': config['GALLERY_SHARD_DIR'],
+        'dedup_threshold': config['ENROLLMENT_DEDUP_THRESHOLD'],
+        'dedup_mode': config['ENROLLMENT_DEDUP_MODE'],
+        'reload_interval': config['GALLERY_RELOAD_INTERVAL'],
+    }
 
 class FaceRecognitionSystem:
-    def __init__(self):
-        """Initialize face recognition system using OpenCV"""
+    def __init__(self, recognition_cache=None, prototypes_per_identity=1, rerank_candidates=3,
+                 gallery_shards=0, shard_dir='data/gallery_shards', shard_processes=True, threshold=0.8,
+                 dedup_threshold=None, dedup_mode='reject', reload_interval=0, quality_gate=None,
+                 encodings_file='data/face_encodings.pkl'):
+        """
+        Initialize face recognition system using OpenCV
+        
+        Args:
+            recognition_cache: Optional RecognitionCache for repeated matches of the same face
+            prototypes_per_identity: Prototype vectors kept per person (1 = mean, more = k-medoids)
+            rerank_candidates: Best prototype matches re-ranked against their samples (0 = off)
+            gallery_shards: Split the gallery into this many shard processes (0 = one shard in this process);
+                            must match the shard count on disk (see compact_gallery.py --reshard)
+            shard_dir: Directory holding the memory-mapped gallery files
+            shard_processes: Serve each shard from its own process (False = map all shards in this process)
+            threshold: Similarity a match must exceed to be accepted (see calibrate_threshold.py)
+            dedup_threshold: New samples at least this similar to one of the person's samples are
+                             near-duplicates (None = always add)
+            dedup_mode: 'reject' skips near-duplicates, 'merge' averages them into the closest sample
+            reload_interval: Seconds between checks for gallery changes made by other
+                             processes (0 = never reload)
+            quality_gate: Optional FaceQualityGate that filters faces before feature extraction
+            encodings_file: Legacy pickle imported once into a new gallery (and export_gallery.py's default)
+        """
         self.face_cascade = cv2.CascadeClassifier(cv2.data.haarcascades + 'haarcascade_frontalface_default.xml')
-        self.authorized_faces = []
-        self.authorized_names = []
-        self.encodings_file = 'data/face_encodings.pkl'
-        self.threshold = 0.8  # Similarity threshold for recognition
+        # The gallery lives in memory-mapped shard files every process can map and reload
+        self.gallery = ShardedGallery(max(1, gallery_shards), shard_dir,
+                                      prototypes_per_identity=prototypes_per_identity,
+                                      rerank_candidates=rerank_candidates,
+                                      use_processes=shard_processes and gallery_shards > 0)
+        self.encodings_file = encodings_file
+        self.threshold = threshold  # Similarity threshold for recognition
+        self.dedup_threshold = dedup_threshold
+        self.dedup_mode = dedup_mode
+        # Serializes read-modify-write gallery updates (enrollment, removal, compaction)
+        self._write_lock = threading.RLock()
+        self.recognition_cache = recognition_cache
+        self.quality_gate = quality_gate
+        self.track_reuses = 0  # Recognitions skipped by reusing a track's result
         
         # Load existing encodings if available
         self.load_encodings()
+        
+        if reload_interval > 0:
+            threading.Thread(target=self._reload_loop, args=(reload_interval,), daemon=True).start()
     
     def extract_face_features(self, face_img):
         """
@@ -61,7 +123,21 @@ class FaceRecognitionSystem:
             image_path: Path to user's photo
             
         Returns:
-            Boolean indicating success
+            Boolean indicating success (a rejected duplicate photo counts as success)
+        """
+        return self.enroll(name, image_path)['status'] != 'failed'
+    
+    def enroll(self, name, image_path):
+        """
+        Enroll a photo as another sample of a person
+        
+        Args:
+            name: User's name
+            image_path: Path to user's photo
+            
+        Returns:
+            Dict with 'status' ('added', 'merged', 'duplicate' or 'failed') and,
+            unless failed, 'similarity' to the closest existing sample
         """
         try:
             print(f"Attempting to load image: {image_path}")
@@ -86,14 +162,36 @@ class FaceRecognitionSystem:
                 if image is None:
                     print(f"Could not load image: {image_path}")
                     print("Possible issues: file corruption, unsupported format, or encoding problems")
-                    return False
+                    return {'status': 'failed'}
                     
             except Exception as load_error:
                 print(f"Error loading image {image_path}: {load_error}")
-                return False
+                return {'status': 'failed'}
             
             print(f"Image loaded successfully: {image.shape}")
             
+            return self.enroll_image(name, image, source=image_path)
+            
+        except Exception as e:
+            print(f"❌ Error adding authorized user {name}: {e}")
+            import traceback
+            traceback.print_exc()
+            return {'status': 'failed'}
+    
+    def enroll_image(self, name, image, source='uploaded image'):
+        """
+        Enroll an already decoded BGR image as another sample of a person
+        
+        Args:
+            name: User's name
+            image: BGR image (e.g. from cv2.imdecode of an upload)
+            source: Description used in log messages
+            
+        Returns:
+            Dict with 'status' ('added', 'merged', 'duplicate' or 'failed') and,
+            unless failed, 'similarity' to the closest existing sample
+        """
+        try:
             # Convert to grayscale for face detection
             gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
             
@@ -101,11 +199,11 @@ class FaceRecognitionSystem:
             faces = self.face_cascade.detectMultiScale(gray, 1.1, 4, minSize=(50, 50))
             
             if len(faces) == 0:
-                print(f"No face found in image: {image_path}")
-                return False
+                print(f"No face found in image: {source}")
+                return {'status': 'failed'}
             
             if len(faces) > 1:
-                print(f"Multiple faces found in image: {image_path}. Using the largest one.")
+                print(f"Multiple faces found in image: {source}. Using the largest one.")
             
             # Use the largest face detected
             largest_face = max(faces, key=lambda x: x[2] * x[3])
@@ -124,87 +222,193 @@ class FaceRecognitionSystem:
             
             if face_img.size == 0:
                 print(f"Extracted face image is empty")
-                return False
+                return {'status': 'failed'}
             
             # Extract features
             features = self.extract_face_features(face_img)
             if features is None:
-                print(f"Could not extract features from face in: {image_path}")
-                return False
-            
-            # Add to authorized list
-            self.authorized_faces.append(features)
-            self.authorized_names.append(name)
+                print(f"Could not extract features from face in: {source}")
+                return {'status': 'failed'}
             
-            # Save encodings
-            self.save_encodings()
-            
-            print(f"✅ Added authorized user: {name}")
-            return True
+            return self.enroll_features(name, features)
             
         except Exception as e:
             print(f"❌ Error adding authorized user {name}: {e}")
             import traceback
             traceback.print_exc()
-            return False
+            return {'status': 'failed'}
+    
+    def enroll_features(self, name, features):
+        """
+        Add a feature vector to a person, skipping or merging near-duplicates
+        
+        Args:
+            name: User's name
+            features: L2-normalized feature vector
+            
+        Returns:
+            Dict with 'status' ('added', 'merged' or 'duplicate') and 'similarity'
+            to the closest existing sample of this person (0.0 if none)
+        """
+        with self._write_lock:
+            # Check for duplicates against the newest samples, including other processes' enrollments
+            self.gallery.refresh()
+            status = 'added'
+            similarity = 0.0
+            existing = self.gallery.samples(name)
+            if existing is not None and len(existing):
+                # One vectorized check against every sample of this identity
+                scores = np.asarray(existing) @ features
+                closest = int(np.argmax(scores))
+                similarity = float(scores[closest])
+                if self.dedup_threshold is not None and similarity >= self.dedup_threshold:
+                    status = 'merged' if self.dedup_mode == 'merge' else 'duplicate'
+            
+            if status == 'duplicate':
+                print(f"⚠️ Skipped near-duplicate sample for {name} (similarity: {similarity:.3f})")
+                return {'status': status, 'similarity': similarity}
+            
+            if status == 'merged':
+                samples = np.array(existing, dtype=np.float32)
+                merged = samples[closest] + features
+                samples[closest] = merged / np.linalg.norm(merged)
+                self.gallery.set_samples(name, samples)
+                print(f"✅ Merged near-duplicate sample into {name} (similarity: {similarity:.3f})")
+            else:
+                # Add as another sample of this identity
+                self.gallery.add_sample(name, features)
+                print(f"✅ Added authorized user: {name}")
+            
+            self._invalidate_cache()
+            return {'status': status, 'similarity': similarity}
+    
+    def _crop_face(self, frame, face_info, padding=20):
+        """Crop a detected face with padding, clamped to the frame bounds"""
+        x, y, width, height = face_info['box']
+        
+        x1 = max(0, x - padding)
+        y1 = max(0, y - padding)
+        x2 = min(frame.shape[1], x + width + padding)
+        y2 = min(frame.shape[0], y + height + padding)
+        
+        return frame[y1:y2, x1:x2]
+    
+    def _match_face(self, frame, face_info, reuse_track_age=None):
+        """
+        Match a detected face against the gallery, reusing cached results
+        
+        Args:
+            frame: Input image frame
+            face_info: Face detection result from MTCNN
+            reuse_track_age: Reuse the track's last result up to this many seconds old,
+                             whatever the face looks like now (None = normal matching)
+            
+        Returns:
+            Tuple of (name or None, max_similarity), or None if no features could be extracted
+        """
+        # Under overload a known track keeps its result instead of being recognized again
+        if reuse_track_age is not None and self.recognition_cache is not None \
+                and face_info.get('track_id') is not None:
+            result = self.recognition_cache.peek(self.recognition_cache.make_key(face_info, None),
+                                                 max_age=reuse_track_age)
+            if result is not None:
+                self.track_reuses += 1
+                return result
+        
+        with tracer.span('align'):
+            face_img = self._crop_face(frame, face_info)
+        if face_img.size == 0:
+            return None
+        
+        # A steady face with the same track/appearance reuses the previous match
+        if self.recognition_cache is not None:
+            face_hash = appearance_hash(face_img)
+            cache_key = self.recognition_cache.make_key(face_info, face_hash)
+            cached = self.recognition_cache.get(cache_key, face_hash)
+            if cached is not None:
+                return cached
+        
+        # Only faces about to be recognized go through (and are counted by) the quality gate:
+        # tiny, blurry or turned faces are not worth a feature extraction and gallery scan
+        if self.quality_gate is not None and self.quality_gate.check(frame, face_info) is not None:
+            return self._deferred_match(face_info)
+        
+        with tracer.span('extract'):
+            features = self.extract_face_features(face_img)
+        if features is None:
+            return None
+        
+        with tracer.span('match'):
+            best = self.search(features)[0]
+        result = (best['name'], best['score'])
+        
+        if self.recognition_cache is not None:
+            self.recognition_cache.put(cache_key, face_hash, result)
+        
+        return result
+    
+    def _deferred_match(self, face_info):
+        """Result for a face that failed the quality gate (None = not recognized)"""
+        track_id = face_info.get('track_id')
+        if self.quality_gate.mode != 'defer' or self.recognition_cache is None or track_id is None:
+            return None
+        # Keep the track's last result until a good enough frame comes along
+        result = self.recognition_cache.peek(self.recognition_cache.make_key(face_info, None))
+        if result is not None:
+            self.quality_gate.record_deferred()
+        return result
     
-    def is_authorized_person(self, frame, face_info):
+    def search(self, features, k=1, threshold=None):
+        """
+        Open-set search: rank identities for a batch of feature vectors
+        
+        Args:
+            features: (n, d) matrix (or one d vector) of L2-normalized features
+            k: Candidate identities returned per query
+            threshold: Acceptance threshold for this call (defaults to self.threshold)
+            
+        Returns:
+            List (one per query) of dicts with 'name' (best identity above the
+            threshold, else None), 'score' (best similarity) and 'candidates'
+            (up to k (name, similarity) tuples, best first)
+        """
+        threshold = self.threshold if threshold is None else threshold
+        results = []
+        for candidates in self.gallery.search_batch(features, k):
+            best_name, best_score = candidates[0] if candidates else (None, 0.0)
+            results.append({
+                'name': best_name if best_score > threshold else None,
+                'score': best_score,
+                'candidates': candidates,
+            })
+        return results
+    
+    def is_authorized_person(self, frame, face_info, reuse_track_age=None):
         """
         Check if detected face belongs to an authorized person
         
         Args:
             frame: Input image frame
             face_info: Face detection result from MTCNN
+            reuse_track_age: See _match_face
             
         Returns:
             Boolean indicating if person is authorized
         """
         try:
-            if len(self.authorized_faces) == 0:
+            if self.gallery.is_empty():
                 return False  # No authorized users registered
             
-            # Extract face region
-            x, y, width, height = face_info['box']
-            
-            # Add padding and ensure bounds
-            padding = 20
-            x1 = max(0, x - padding)
-            y1 = max(0, y - padding)
-            x2 = min(frame.shape[1], x + width + padding)
-            y2 = min(frame.shape[0], y + height + padding)
-            
-            face_img = frame[y1:y2, x1:x2]
-            
-            if face_img.size == 0:
-                return False
-            
-            # Extract features from detected face
-            features = self.extract_face_features(face_img)
-            if features is None:
+            result = self._match_face(frame, face_info, reuse_track_age)
+            if result is None:
                 return False
             
-            # Compare with authorized faces using cosine similarity
-            similarities = []
-            for auth_features in self.authorized_faces:
-                try:
-                    similarity = cosine_similarity([features], [auth_features])[0][0]
-                    similarities.append(similarity)
-                except:
-                    similarities.append(0.0)
-            
-            # Check if any similarity is above threshold
-            if len(similarities) > 0:
-                max_similarity = np.max(similarities)
-                
-                if max_similarity > self.threshold:
-                    best_match_index = np.argmax(similarities)
-                    recognized_name = self.authorized_names[best_match_index]
-                    print(f"Authorized person detected: {recognized_name} (similarity: {max_similarity:.3f})")
-                    return True
-                else:
-                    print(f"Unauthorized person detected (max similarity: {max_similarity:.3f})")
-                    return False
+            recognized_name, max_similarity = result
+            if recognized_name is not None:
+                print(f"Authorized person detected: {recognized_name} (similarity: {max_similarity:.3f})")
+                return True
             else:
+                print(f"Unauthorized person detected (max similarity: {max_similarity:.3f})")
                 return False
                 
         except Exception as e:
@@ -223,92 +427,125 @@ class FaceRecognitionSystem:
             Tuple of (name, confidence) or (None, 0) if not recognized
         """
         try:
-            if len(self.authorized_faces) == 0:
+            if self.gallery.is_empty():
                 return None, 0
             
-            # Extract face region
-            x, y, width, height = face_info['box']
-            
-            padding = 20
-            x1 = max(0, x - padding)
-            y1 = max(0, y - padding)
-            x2 = min(frame.shape[1], x + width + padding)
-            y2 = min(frame.shape[0], y + height + padding)
-            
-            face_img = frame[y1:y2, x1:x2]
-            
-            if face_img.size == 0:
-                return None, 0
-            
-            # Extract features
-            features = self.extract_face_features(face_img)
-            if features is None:
+            result = self._match_face(frame, face_info)
+            if result is None or result[0] is None:
                 return None, 0
             
-            # Compare with authorized faces
-            similarities = []
-            for auth_features in self.authorized_faces:
-                try:
-                    similarity = cosine_similarity([features], [auth_features])[0][0]
-                    similarities.append(similarity)
-                except:
-                    similarities.append(0.0)
-            
-            # Find best match
-            if len(similarities) > 0:
-                max_similarity = np.max(similarities)
-                best_match_index = np.argmax(similarities)
-                
-                if max_similarity > self.threshold:
-                    name = self.authorized_names[best_match_index]
-                    return name, max_similarity
-                else:
-                    return None, 0
-            else:
-                return None, 0
+            return result
                 
         except Exception as e:
             print(f"Error in person recognition: {e}")
             return None, 0
     
-    def save_encodings(self):
-        """Save face encodings to file"""
+    def get_cache_stats(self):
+        """Get recognition cache counters (None if caching is disabled)"""
+        if self.recognition_cache is None:
+            return None
+        stats = self.recognition_cache.get_stats()
+        stats['track_reuses'] = self.track_reuses
+        return stats
+    
+    def get_quality_stats(self):
+        """Get quality gate counters (None if the gate is disabled)"""
+        if self.quality_gate is None:
+            return None
+        return self.quality_gate.get_stats()
+    
+    def _invalidate_cache(self):
+        """Drop cached matches after the gallery changed"""
+        if self.recognition_cache is not None:
+            self.recognition_cache.clear()
+    
+    def _reload_loop(self, interval):
+        """Poll the shard files and swap in changes written by other processes"""
+        while True:
+            time.sleep(interval)
+            try:
+                if self.gallery.refresh():
+                    self._invalidate_cache()
+                    print(f"🔄 Gallery reloaded: {len(self.gallery)} authorized users")
+            except Exception as e:
+                print(f"Error reloading gallery: {e}")
+    
+    def save_encodings(self, path=None):
+        """
+        Export the gallery to a pickle file (see export_gallery.py)
+        
+        The shard files are the live store and are written on every change;
+        the pickle is only a portable copy, imported only into a new shard directory.
+        
+        Args:
+            path: Output file (defaults to the legacy data/face_encodings.pkl)
+            
+        Returns:
+            True if the file was written
+        """
+        path = path or self.encodings_file
         try:
-            os.makedirs('data', exist_ok=True)
-            data = {
-                'faces': self.authorized_faces,
-                'names': self.authorized_names
-            }
-            with open(self.encodings_file, 'wb') as f:
-                pickle.dump(data, f)
-            print("Face encodings saved successfully")
+            output_dir = os.path.dirname(path)
+            if output_dir:
+                os.makedirs(output_dir, exist_ok=True)
+            # Under the write lock so an older snapshot can never overwrite a newer one
+            with self._write_lock:
+                data = {
+                    'version': 2,
+                    'identities': self.gallery.to_dict()
+                }
+                # Write a temporary file and swap it in so readers never see a partial pickle
+                tmp_file = path + '.tmp'
+                with open(tmp_file, 'wb') as f:
+                    pickle.dump(data, f)
+                os.replace(tmp_file, path)
+            print(f"Face encodings saved to {path}")
+            return True
         except Exception as e:
             print(f"Error saving encodings: {e}")
+            return False
     
     def load_encodings(self):
-        """Load face encodings from file"""
+        """
+        Load the gallery, importing the legacy pickle once into a new shard directory
+        
+        Once the shards are in use the pickle is never read again, so users
+        removed or cleared later cannot come back from a stale copy.
+        """
         try:
+            if not self.gallery.is_empty():
+                print(f"Loaded {len(self.gallery)} authorized users from {self.gallery.num_shards} gallery shards")
+                if not self.gallery.is_migrated():
+                    self.gallery.mark_migrated()
+                return
+            if self.gallery.is_migrated():
+                print("No authorized users enrolled")
+                return
+            
+            # A new gallery is seeded from the pickle (one-time migration)
             if os.path.exists(self.encodings_file):
                 with open(self.encodings_file, 'rb') as f:
                     data = pickle.load(f)
-                self.authorized_faces = data.get('faces', [])
-                self.authorized_names = data.get('names', [])
-                print(f"Loaded {len(self.authorized_faces)} authorized users")
+                if 'identities' in data:
+                    self.gallery.load_dict(data['identities'])
+                else:
+                    # Old format: parallel lists with one entry per photo
+                    self.gallery.load_legacy(data.get('faces', []), data.get('names', []))
+                print(f"Loaded {len(self.gallery)} authorized users ({self.gallery.num_samples()} samples)")
             else:
                 print("No existing encodings file found")
+            self.gallery.mark_migrated()
         except Exception as e:
             print(f"Error loading encodings: {e}")
-            self.authorized_faces = []
-            self.authorized_names = []
+            self.gallery.clear()
     
     def remove_authorized_user(self, name):
-        """Remove an authorized user from the system"""
+        """Remove an authorized user and all of their samples from the system"""
         try:
-            if name in self.authorized_names:
-                index = self.authorized_names.index(name)
-                del self.authorized_names[index]
-                del self.authorized_faces[index]
-                self.save_encodings()
+            with self._write_lock:
+                removed = self.gallery.remove_identity(name)
+            if removed:
+                self._invalidate_cache()
                 print(f"Removed authorized user: {name}")
                 return True
             else:
@@ -318,13 +555,45 @@ class FaceRecognitionSystem:
             print(f"Error removing user {name}: {e}")
             return False
     
+    def compact_gallery(self, threshold=None, merge=None, dry_run=False):
+        """
+        Remove near-duplicate samples from every identity
+        
+        Args:
+            threshold: Duplicate similarity (defaults to dedup_threshold)
+            merge: Average duplicates instead of keeping the first (defaults to dedup_mode == 'merge')
+            dry_run: Only report what would change
+            
+        Returns:
+            Dict of {name: (samples before, samples after)} for identities that shrink
+        """
+        threshold = self.dedup_threshold if threshold is None else threshold
+        if threshold is None:
+            raise ValueError("No duplicate threshold given")
+        merge = self.dedup_mode == 'merge' if merge is None else merge
+        
+        changes = {}
+        with self._write_lock:
+            self.gallery.refresh()
+            for name in self.gallery.names():
+                samples = self.gallery.samples(name)
+                compacted = dedupe_samples(samples, threshold, merge=merge)
+                if len(compacted) < len(samples):
+                    changes[name] = (len(samples), len(compacted))
+                    if not dry_run:
+                        self.gallery.set_samples(name, compacted)
+            
+            if changes and not dry_run:
+                self._invalidate_cache()
+        return changes
+    
     def get_authorized_users(self):
-        """Get list of authorized users"""
-        return self.authorized_names.copy()
+        """Get list of authorized users (one entry per person)"""
+        return self.gallery.names()
     
     def clear_all_users(self):
         """Clear all authorized users"""
-        self.authorized_faces = []
-        self.authorized_names = []
-        self.save_encodings()
+        with self._write_lock:
+            self.gallery.clear()
+        self._invalidate_cache()
         print("All authorized users cleared")
\ No newline at end of file
@@ -0,0 +1,83 @@
+"""
+Minimal IoU tracker that gives detections a stable track_id across frames
+"""
+
+
+def box_iou(box_a, box_b):
+    """Intersection over union of two (x, y, width, height) boxes"""
+    ax, ay, aw, ah = box_a[:4]
+    bx, by, bw, bh = box_b[:4]
+    ix = max(0, min(ax + aw, bx + bw) - max(ax, bx))
+    iy = max(0, min(ay + ah, by + bh) - max(ay, by))
+    intersection = ix * iy
+    union = aw * ah + bw * bh - intersection
+    return intersection / union if union > 0 else 0.0
+
+
+class FaceTracker:
+    """Greedy IoU matching of detections to the previous frame's tracks"""
+
+    def __init__(self, iou_threshold=0.3, max_missed=3):
+        """
+        Args:
+            iou_threshold: Minimum IoU to continue an existing track
+            max_missed: Detection passes a track survives without a match
+        """
+        self.iou_threshold = iou_threshold
+        self.max_missed = max_missed
+        self._tracks = {}  # track_id -> (box, missed)
+        self._next_id = 1
+
+    def update(self, faces):
+        """
+        Assign track IDs to a new set of detections
+
+        Args:
+            faces: List of face dicts with a 'box'
+
+        Returns:
+            New list of face dicts with a 'track_id' key added
+        """
+        candidates = []
+        for track_id, (track_box, _) in self._tracks.items():
+            for index, face in enumerate(faces):
+                iou = box_iou(track_box, face['box'])
+                if iou >= self.iou_threshold:
+                    candidates.append((iou, track_id, index))
+        candidates.sort(reverse=True)
+
+        assigned = {}
+        used_tracks = set()
+        for iou, track_id, index in candidates:
+            if index in assigned or track_id in used_tracks:
+                continue
+            assigned[index] = track_id
+            used_tracks.add(track_id)
+
+        tracked = []
+        for index, face in enumerate(faces):
+            track_id = assigned.get(index)
+            if track_id is None:
+                track_id = self._next_id
+                self._next_id += 1
+            self._tracks[track_id] = (face['box'], 0)
+            face = dict(face)
+            face['track_id'] = track_id
+            tracked.append(face)
+
+        # Age out tracks that were not matched this pass
+        matched = {face['track_id'] for face in tracked}
+        for track_id in list(self._tracks):
+            if track_id in matched:
+                continue
+            box, missed = self._tracks[track_id]
+            if missed + 1 > self.max_missed:
+                del self._tracks[track_id]
+            else:
+                self._tracks[track_id] = (box, missed + 1)
+
+        return tracked
+
+    def reset(self):
+        """Forget all tracks"""
+        self._tracks = {}
@@ -0,0 +1,440 @@
+"""
+Pluggable frame sources.
+
+Every source exposes the subset of the cv2.VideoCapture API that the server
+uses (isOpened, read, release), so a recorded video, a generated test
+pattern or a folder of images can stand in for the webcam on machines
+without camera hardware.
+
+ThreadedCapture wraps any source with a dedicated grab thread: frames are
+grabbed as fast as the source delivers them, so the driver queue never
+fills up with stale frames, and only the newest one is decoded when the
+pipeline asks for it.
+"""
+
+import os
+import threading
+import time
+from collections import deque
+
+import cv2
+import numpy as np
+
+IMAGE_EXTENSIONS = {'.jpg', '.jpeg', '.png', '.bmp'}
+
+
+class CameraSource:
+    """Live camera through cv2.VideoCapture"""
+
+    def __init__(self, index=0, width=640, height=480, fps=30):
+        self.capture = cv2.VideoCapture(index)
+        self.capture.set(cv2.CAP_PROP_FRAME_WIDTH, width)
+        self.capture.set(cv2.CAP_PROP_FRAME_HEIGHT, height)
+        self.capture.set(cv2.CAP_PROP_FPS, fps)
+        # Keep the driver queue short where the backend supports it (V4L2, DirectShow)
+        self.capture.set(cv2.CAP_PROP_BUFFERSIZE, 1)
+
+    def isOpened(self):
+        return self.capture.isOpened()
+
+    def read(self):
+        return self.capture.read()
+
+    def grab(self):
+        return self.capture.grab()
+
+    def retrieve(self):
+        return self.capture.retrieve()
+
+    def release(self):
+        self.capture.release()
+
+
+class _PacedSource:
+    """Base class for sources that emit frames at a fixed rate like a camera would"""
+
+    def __init__(self, fps):
+        self.fps = fps
+        self._interval = 1.0 / fps if fps and fps > 0 else 0.0
+        self._next_time = None
+        self._opened = True
+        self._last_frame = None
+
+    def _wait_for_next_frame(self):
+        """Sleep until the next frame is due (no-op when fps is 0 = unthrottled)"""
+        if self._interval <= 0:
+            return
+        now = time.perf_counter()
+        if self._next_time is None or now - self._next_time > self._interval:
+            # First frame, or we fell behind: restart the schedule instead of bursting
+            self._next_time = now
+        elif self._next_time > now:
+            time.sleep(self._next_time - now)
+        self._next_time += self._interval
+
+    def _next_frame(self):
+        raise NotImplementedError
+
+    def isOpened(self):
+        return self._opened
+
+    def read(self):
+        if not self._opened:
+            return False, None
+        self._wait_for_next_frame()
+        frame = self._next_frame()
+        if frame is None:
+            # End of a non-looping input: report it as closed, not as a failed grab
+            self._opened = False
+            return False, None
+        self._last_frame = frame
+        return True, frame
+
+    def grab(self):
+        if not self._opened:
+            return False
+        self._wait_for_next_frame()
+        self._last_frame = self._next_frame()
+        if self._last_frame is None:
+            self._opened = False
+            return False
+        return True
+
+    def retrieve(self):
+        if self._last_frame is None:
+            return False, None
+        return True, self._last_frame
+
+    def release(self):
+        self._opened = False
+
+
+class FileReplaySource(_PacedSource):
+    """Replay a video file at a configurable rate, optionally looping"""
+
+    def __init__(self, path, fps=None, width=None, height=None, loop=True):
+        self.path = path
+        self.capture = cv2.VideoCapture(path)
+        file_fps = self.capture.get(cv2.CAP_PROP_FPS) or 30
+        super().__init__(fps or file_fps)
+        self.size = (width, height) if width and height else None
+        self.loop = loop
+        self._opened = self.capture.isOpened()
+
+    def _next_frame(self):
+        ret, frame = self.capture.read()
+        if not ret and self.loop:
+            self.capture.set(cv2.CAP_PROP_POS_FRAMES, 0)
+            ret, frame = self.capture.read()
+        if not ret:
+            return None
+        if self.size is not None and (frame.shape[1], frame.shape[0]) != self.size:
+            frame = cv2.resize(frame, self.size, interpolation=cv2.INTER_AREA)
+        return frame
+
+    def release(self):
+        super().release()
+        self.capture.release()
+
+
+class ImageDirectorySource(_PacedSource):
+    """Loop over the images of a directory (decoded once, up front)"""
+
+    def __init__(self, directory, fps=30, width=640, height=480, loop=True):
+        super().__init__(fps)
+        self.loop = loop
+        self.images = []
+        for filename in sorted(os.listdir(directory)):
+            if os.path.splitext(filename)[1].lower() not in IMAGE_EXTENSIONS:
+                continue
+            with open(os.path.join(directory, filename), 'rb') as f:
+                image = cv2.imdecode(np.frombuffer(f.read(), np.uint8), cv2.IMREAD_COLOR)
+            if image is not None:
+                self.images.append(cv2.resize(image, (width, height), interpolation=cv2.INTER_AREA))
+        self._index = 0
+        self._opened = len(self.images) > 0
+        if not self.images:
+            print(f"No readable images found in {directory}")
+
+    def _next_frame(self):
+        if self._index >= len(self.images):
+            if not self.loop:
+                return None
+            self._index = 0
+        frame = self.images[self._index]
+        self._index += 1
+        # Consumers may draw on frames, so never hand out the cached image itself
+        return frame.copy()
+
+
+class SyntheticSource(_PacedSource):
+    """Generated test pattern with a moving face-like blob"""
+
+    def __init__(self, fps=30, width=640, height=480, seed=0):
+        super().__init__(fps)
+        self.width = width
+        self.height = height
+        rng = np.random.default_rng(seed)
+        background = rng.integers(40, 200, (height, width, 3), dtype=np.uint8)
+        self.background = cv2.GaussianBlur(background, (15, 15), 0)
+        self._frame_number = 0
+
+    def _next_frame(self):
+        frame = self.background.copy()
+        t = self._frame_number / max(self.fps, 1)
+        radius = min(self.width, self.height) // 8
+        cx = int(self.width / 2 + self.width / 4 * np.sin(t))
+        cy = int(self.height / 2 + self.height / 8 * np.cos(t * 0.7))
+        cv2.circle(frame, (cx, cy), radius, (160, 180, 210), -1)
+        cv2.circle(frame, (cx - radius // 3, cy - radius // 4), radius // 8, (40, 40, 40), -1)
+        cv2.circle(frame, (cx + radius // 3, cy - radius // 4), radius // 8, (40, 40, 40), -1)
+        cv2.ellipse(frame, (cx, cy + radius // 3), (radius // 3, radius // 8), 0, 0, 180, (60, 60, 120), -1)
+        cv2.putText(frame, f'#{self._frame_number}', (10, self.height - 10),
+                    cv2.FONT_HERSHEY_SIMPLEX, 0.6, (255, 255, 255), 1)
+        self._frame_number += 1
+        return frame
+
+
+class LatencyWindow:
+    """Sliding window of latency samples in milliseconds"""
+
+    def __init__(self, size=300):
+        self._samples = deque(maxlen=size)
+        self._lock = threading.Lock()
+
+    def add(self, ms):
+        with self._lock:
+            self._samples.append(ms)
+
+    def summary(self):
+        """avg/p50/p95/max of the window (None if empty)"""
+        with self._lock:
+            samples = np.array(self._samples)
+        if not len(samples):
+            return None
+        return {
+            'count': int(len(samples)),
+            'avg_ms': float(samples.mean()),
+            'p50_ms': float(np.percentile(samples, 50)),
+            'p95_ms': float(np.percentile(samples, 95)),
+            'max_ms': float(samples.max()),
+        }
+
+
+class ThreadedCapture:
+    """
+    Grab frames on a background thread and decode only the newest one
+
+    The grab thread calls grab() in a loop, which dequeues frames as soon as
+    the driver has them but skips decoding. read() asks the thread to
+    retrieve() the next grabbed frame, so the caller always gets the
+    freshest frame and frames nobody asked for are never decoded. The
+    wrapped source is only touched from the grab thread.
+
+    If grabbing keeps failing the source is released and reopened with
+    exponential backoff. Every frame handed out carries the time it was
+    grabbed (captured_at), which downstream stages use to measure
+    glass-to-glass latency.
+    """
+
+    def __init__(self, source, reopen=None, max_failures=5, reconnect_delay=0.5, max_reconnect_delay=10.0,
+                 read_timeout=1.0):
+        """
+        Args:
+            source: Opened frame source with grab/retrieve/isOpened/release
+            reopen: Callable returning a new source after a failure (None = never reconnect)
+            max_failures: Consecutive failed grabs before reconnecting
+            reconnect_delay: First wait before reopening, doubled after every failed attempt
+            max_reconnect_delay: Upper bound of the reconnect wait
+            read_timeout: Seconds read() waits for a new frame
+        """
+        self.source = source
+        self.reopen = reopen
+        self.max_failures = max_failures
+        self.reconnect_delay = reconnect_delay
+        self.max_reconnect_delay = max_reconnect_delay
+        self.read_timeout = read_timeout
+        self.captured_at = None  # time.time() the last frame returned by read() was grabbed
+        self.age = LatencyWindow()  # grab -> read() return
+        self._condition = threading.Condition()
+        self._wanted = False
+        self._frame = None
+        self._frame_time = None
+        self._frame_seq = 0
+        self._last_read_seq = 0
+        self._stopped = threading.Event()
+        self.grabbed = 0
+        self.retrieved = 0
+        self.failures = 0
+        self.reconnects = 0
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        failures = 0
+        delay = self.reconnect_delay
+        while not self._stopped.is_set():
+            source = self.source
+            if source is None or not source.isOpened() or failures >= self.max_failures:
+                if self.reopen is None:
+                    break
+                if not self._reconnect(delay):
+                    delay = min(delay * 2, self.max_reconnect_delay)
+                    continue
+                failures = 0
+                delay = self.reconnect_delay
+                continue
+
+            if not source.grab():
+                failures += 1
+                self.failures += 1
+                time.sleep(0.01)
+                continue
+            failures = 0
+            grabbed_at = time.time()
+            self.grabbed += 1
+
+            with self._condition:
+                if not self._wanted:
+                    continue
+            # Decode outside the lock; the source is only used by this thread
+            ret, frame = source.retrieve()
+            if not ret:
+                continue
+            with self._condition:
+                self._frame = frame
+                self._frame_time = grabbed_at
+                self._frame_seq += 1
+                self._wanted = False
+                self.retrieved += 1
+                self._condition.notify_all()
+
+        with self._condition:
+            self._condition.notify_all()
+
+    def _reconnect(self, delay):
+        """Release the current source and open a new one after `delay` seconds"""
+        print(f"📷 Frame source failed, reconnecting in {delay:.1f}s...")
+        if self.source is not None:
+            try:
+                self.source.release()
+            except Exception as e:
+                print(f"Error releasing frame source: {e}")
+            self.source = None
+        if self._stopped.wait(delay):
+            return False
+        try:
+            source = self.reopen()
+        except Exception as e:
+            print(f"Error reopening frame source: {e}")
+            return False
+        if not source.isOpened():
+            source.release()
+            return False
+        self.source = source
+        self.reconnects += 1
+        print("📷 Frame source reconnected")
+        return True
+
+    def isOpened(self):
+        """True until released (frames may pause while reconnecting)"""
+        return not self._stopped.is_set() and (self._thread.is_alive() or self._frame_seq > self._last_read_seq)
+
+    def read(self):
+        """
+        Return the next frame grabbed after this call
+
+        Returns:
+            Tuple of (ret, frame) like cv2.VideoCapture.read; (False, None) if no
+            frame arrived within read_timeout
+        """
+        with self._condition:
+            self._wanted = True
+            if not self._condition.wait_for(
+                    lambda: self._frame_seq > self._last_read_seq or not self._thread.is_alive(),
+                    self.read_timeout):
+                return False, None
+            if self._frame_seq == self._last_read_seq:
+                return False, None
+            frame, self._frame = self._frame, None
+            self._last_read_seq = self._frame_seq
+            self.captured_at = self._frame_time
+        self.age.add((time.time() - self.captured_at) * 1000)
+        return True, frame
+
+    def get_stats(self):
+        """Grab/decode counters and frame age at read()"""
+        return {
+            'grabbed': self.grabbed,
+            'retrieved': self.retrieved,
+            # Frames dequeued from the driver without ever being decoded
+            'skipped': self.grabbed - self.retrieved,
+            'failures': self.failures,
+            'reconnects': self.reconnects,
+            'connected': self.source is not None,
+            'frame_age': self.age.summary(),
+        }
+
+    def release(self):
+        """Stop the grab thread and release the source"""
+        self._stopped.set()
+        self._thread.join(timeout=2)
+        if self.source is not None:
+            self.source.release()
+            self.source = None
+
+
+def open_frame_source(config):
+    """
+    Open the frame source selected in the configuration
+
+    Args:
+        config: Flask config (or dict) with FRAME_SOURCE* and CAMERA_* settings
+
+    Returns:
+        Frame source with isOpened/read/grab/retrieve/release
+    """
+    kind = config.get('FRAME_SOURCE', 'camera')
+    width = config['CAMERA_WIDTH']
+    height = config['CAMERA_HEIGHT']
+    fps = config.get('FRAME_SOURCE_FPS') or config['CAMERA_FPS']
+    path = config.get('FRAME_SOURCE_PATH')
+    loop = config.get('FRAME_SOURCE_LOOP', True)
+
+    if kind == 'camera':
+        return CameraSource(config['CAMERA_INDEX'], width, height, config['CAMERA_FPS'])
+    if kind == 'file':
+        return FileReplaySource(path, fps=fps, width=width, height=height, loop=loop)
+    if kind == 'images':
+        return ImageDirectorySource(path or config['UPLOAD_FOLDER'], fps=fps, width=width,
+                                    height=height, loop=loop)
+    if kind == 'synthetic':
+        return SyntheticSource(fps=fps, width=width, height=height)
+
+    raise ValueError(f"Unknown frame source: {kind}")
+
+
+def create_frame_source(config):
+    """
+    Create the frame source selected in the configuration
+
+    With CAPTURE_THREADED the source is wrapped in a ThreadedCapture. Cameras
+    are reconnected on failure; file, image and synthetic sources simply end
+    when their input does.
+
+    Args:
+        config: Flask config (or dict) with FRAME_SOURCE*, CAMERA_* and CAPTURE_* settings
+
+    Returns:
+        Frame source with isOpened/read/release
+    """
+    source = open_frame_source(config)
+    if not config.get('CAPTURE_THREADED', False) or not source.isOpened():
+        return source
+    reopen = None
+    if config.get('FRAME_SOURCE', 'camera') == 'camera':
+        reopen = lambda: open_frame_source(config)
+    return ThreadedCapture(source, reopen=reopen,
+                           max_failures=config.get('CAPTURE_MAX_FAILURES', 5),
+                           reconnect_delay=config.get('CAPTURE_RECONNECT_DELAY', 0.5),
+                           max_reconnect_delay=config.get('CAPTURE_MAX_RECONNECT_DELAY', 10.0))
@@ -0,0 +1,256 @@
+"""
+On-demand per-frame span tracing and sampling profiler.
+
+The hot path is instrumented permanently with `with tracer.span('detect'):`
+blocks. While tracing is off, span() returns one shared no-op context
+manager, so the instrumentation costs a method call and nothing is
+recorded. An admin request turns tracing on for a few seconds. Every span
+is then recorded with its thread and frame number and can be exported as
+Chrome trace-event JSON (chrome://tracing, Perfetto). Optionally a sampling
+profiler snapshots every thread's Python stack over the same window and
+exports collapsed stacks (flamegraph.pl, speedscope).
+
+Detection worker processes trace with their own tracer while a window is
+open (see window_end) and send their spans back with each result; the
+server adds them under one row per worker. perf_counter is a system-wide
+monotonic clock, so their timestamps line up with the server's. The
+profiler samples the server process only.
+"""
+
+import os
+import sys
+import threading
+import time
+from collections import Counter
+
+
+class _NullSpan:
+    """Context manager used while tracing is off"""
+
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+_NULL_SPAN = _NullSpan()
+
+
+class _Span:
+    __slots__ = ('tracer', 'name', 'args', 'start')
+
+    def __init__(self, tracer, name, args):
+        self.tracer = tracer
+        self.name = name
+        self.args = args
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.tracer._record(self.name, self.start, time.perf_counter(), self.args)
+        return False
+
+
+class FrameTracer:
+    """Record named spans for a limited time window"""
+
+    def __init__(self):
+        self.enabled = False
+        self._lock = threading.Lock()
+        self._events = []
+        self._deadline = 0.0
+        self._origin = time.perf_counter()
+        self._max_events = 0
+        self._dropped = 0
+        self._started_at = None
+        self._stopped_at = None
+        # Labels of rows that are not threads of this process (detection workers)
+        self._thread_names = {}
+        self._profiler = None
+        self._samples = Counter()
+        self._sample_count = 0
+
+    def span(self, name, **args):
+        """
+        Context manager timing one stage
+
+        Args:
+            name: Stage name (capture, resize, detect, align, extract, match, overlay, encode, ...)
+            **args: Extra fields shown with the span, e.g. frame=frame_count
+
+        Returns:
+            A recording span while tracing is on, otherwise a shared no-op
+        """
+        if not self.enabled:
+            return _NULL_SPAN
+        if time.perf_counter() > self._deadline:
+            self.stop()
+            return _NULL_SPAN
+        return _Span(self, name, args)
+
+    def _record(self, name, start, end, args):
+        if len(self._events) >= self._max_events:
+            self._dropped += 1
+            return
+        # list.append is atomic, so spans from any thread can record without a lock
+        self._events.append((name, start, end, threading.get_ident(), args))
+
+    def window_end(self):
+        """perf_counter time the current window ends, or None while tracing is off"""
+        return self._deadline if self.enabled else None
+
+    def drain(self):
+        """
+        Remove and return the recorded spans (used by detection workers)
+
+        Returns:
+            List of (name, start, end, args) tuples
+        """
+        events, self._events = self._events, []
+        return [(name, start, end, args) for name, start, end, _, args in events]
+
+    def add_spans(self, spans, thread_id, thread_name):
+        """
+        Record spans timed in another process
+
+        Args:
+            spans: (name, start, end, args) tuples from drain()
+            thread_id: Row the spans are shown on (e.g. the worker's PID)
+            thread_name: Label of that row
+        """
+        if not self.enabled:
+            return
+        self._thread_names[thread_id] = thread_name
+        for name, start, end, args in spans:
+            if len(self._events) >= self._max_events:
+                self._dropped += 1
+                continue
+            self._events.append((name, start, end, thread_id, args))
+
+    def start(self, seconds, profile=False, max_events=200000, profile_interval=0.005):
+        """
+        Start a tracing window, discarding the previous one
+
+        Args:
+            seconds: Window length; tracing stops by itself afterwards
+            profile: Also run the sampling profiler over the window
+            max_events: Spans kept; later spans are counted as dropped
+            profile_interval: Seconds between profiler samples
+        """
+        self.stop()
+        with self._lock:
+            self._events = []
+            self._dropped = 0
+            self._thread_names = {}
+            self._samples = Counter()
+            self._sample_count = 0
+            self._max_events = max_events
+            self._origin = time.perf_counter()
+            self._deadline = self._origin + seconds
+            self._started_at = time.time()
+            self._stopped_at = None
+            self.enabled = True
+            if profile:
+                self._profiler = threading.Thread(target=self._sample_loop, args=(profile_interval,),
+                                                  name='trace-profiler', daemon=True)
+                self._profiler.start()
+        print(f"🔍 Tracing for {seconds:.0f} s{' with profiler' if profile else ''}")
+
+    def stop(self):
+        """End the current window (no-op if tracing is off)"""
+        with self._lock:
+            if not self.enabled:
+                return
+            self.enabled = False
+            self._stopped_at = time.time()
+            profiler, self._profiler = self._profiler, None
+        if profiler is not None and profiler is not threading.current_thread():
+            profiler.join(timeout=1.0)
+        print(f"🔍 Tracing stopped: {len(self._events)} spans, {self._sample_count} profiler samples")
+
+    def _sample_loop(self, interval):
+        own_id = threading.get_ident()
+        while self.enabled and time.perf_counter() < self._deadline:
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_id:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})")
+                    frame = frame.f_back
+                stack.append(names.get(thread_id, str(thread_id)))
+                self._samples[';'.join(reversed(stack))] += 1
+            self._sample_count += 1
+            time.sleep(interval)
+        # The window may end without any span noticing the deadline
+        if self.enabled:
+            self.stop()
+
+    def chrome_trace(self):
+        """
+        Export the recorded spans as Chrome trace-event JSON
+
+        Returns:
+            Dict with traceEvents ('X' complete events in microseconds, plus thread names)
+        """
+        pid = os.getpid()
+        names = {thread.ident: thread.name for thread in threading.enumerate()}
+        names.update(self._thread_names)
+        events = []
+        thread_ids = set()
+        for name, start, end, thread_id, args in list(self._events):
+            event = {
+                'name': name,
+                'ph': 'X',
+                'ts': (start - self._origin) * 1e6,
+                'dur': (end - start) * 1e6,
+                'pid': pid,
+                'tid': thread_id,
+            }
+            if args:
+                event['args'] = args
+            events.append(event)
+            thread_ids.add(thread_id)
+        for thread_id in thread_ids:
+            events.append({'name': 'thread_name', 'ph': 'M', 'pid': pid, 'tid': thread_id,
+                           'args': {'name': names.get(thread_id, str(thread_id))}})
+        return {
+            'traceEvents': events,
+            'displayTimeUnit': 'ms',
+            'otherData': {'started_at': self._started_at, 'stopped_at': self._stopped_at,
+                          'dropped_spans': self._dropped},
+        }
+
+    def collapsed_stacks(self):
+        """Profiler samples as 'thread;outer;...;inner count' lines"""
+        return ''.join(f"{stack} {count}\n" for stack, count in self._samples.most_common())
+
+    def get_stats(self):
+        """Return the state of the current or last window with per-stage timings"""
+        stages = {}
+        for name, start, end, _, _ in list(self._events):
+            stages.setdefault(name, []).append((end - start) * 1000)
+        return {
+            'enabled': self.enabled,
+            'started_at': self._started_at,
+            'stopped_at': self._stopped_at,
+            'remaining_s': max(0.0, self._deadline - time.perf_counter()) if self.enabled else 0.0,
+            'spans': len(self._events),
+            'dropped_spans': self._dropped,
+            'profiler_samples': self._sample_count,
+            'stages': {name: {'count': len(durations),
+                              'total_ms': sum(durations),
+                              'max_ms': max(durations)}
+                       for name, durations in stages.items()},
+        }
+
+
+# Process-wide tracer shared by every instrumented module
+tracer = FrameTracer()
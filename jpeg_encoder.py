@@ -0,0 +1,168 @@
+"""
+JPEG encoders for the MJPEG stream.
+
+libjpeg-turbo (through PyTurboJPEG or simplejpeg) is used when it is installed,
+with cv2.imencode as the fallback. Encoders are not thread-safe: each stream
+generator should create its own instance so output buffers can be reused.
+"""
+
+import cv2
+import numpy as np
+
+
+class OpenCVJpegEncoder:
+    """JPEG encoder backed by cv2.imencode (always available)"""
+
+    name = 'opencv'
+
+    def __init__(self, quality=80):
+        self.quality = int(quality)
+        self._params = [int(cv2.IMWRITE_JPEG_QUALITY), self.quality]
+
+    def set_quality(self, quality):
+        """Change the JPEG quality used by the following encode calls"""
+        self.quality = int(quality)
+        self._params[1] = self.quality
+
+    def encode(self, image):
+        """
+        Encode a BGR image to JPEG
+
+        Args:
+            image: BGR uint8 image
+
+        Returns:
+            Bytes-like JPEG data (valid until the next encode call) or None
+        """
+        ret, buffer = cv2.imencode('.jpg', image, self._params)
+        if not ret:
+            return None
+        # Expose the encoded array directly instead of copying it with tobytes()
+        return buffer.data
+
+
+class SimpleJpegEncoder:
+    """JPEG encoder backed by simplejpeg (libjpeg-turbo)"""
+
+    name = 'simplejpeg'
+
+    def __init__(self, quality=80):
+        import simplejpeg
+        self._simplejpeg = simplejpeg
+        self.quality = int(quality)
+
+    def set_quality(self, quality):
+        """See OpenCVJpegEncoder.set_quality"""
+        self.quality = int(quality)
+
+    def encode(self, image):
+        """Encode a BGR image to JPEG, see OpenCVJpegEncoder.encode"""
+        image = np.ascontiguousarray(image)
+        return self._simplejpeg.encode_jpeg(image, quality=self.quality,
+                                            colorspace='BGR', colorsubsampling='420')
+
+
+class TurboJpegEncoder:
+    """JPEG encoder backed by PyTurboJPEG, compressing into a reused buffer"""
+
+    name = 'turbojpeg'
+
+    def __init__(self, quality=80, lib_path=None):
+        import turbojpeg
+        self._turbojpeg = turbojpeg
+        self._jpeg = turbojpeg.TurboJPEG(lib_path) if lib_path else turbojpeg.TurboJPEG()
+        self.quality = int(quality)
+        self._buffer = None
+        self._buffer_shape = None
+        # Older PyTurboJPEG releases cannot compress into a caller-owned buffer
+        self._supports_dst = hasattr(self._jpeg, 'buffer_size')
+
+    def _get_buffer(self, image):
+        """Return an output buffer large enough for image, reusing the last one"""
+        if self._buffer is None or self._buffer_shape != image.shape:
+            size = self._jpeg.buffer_size(image, self._turbojpeg.TJSAMP_420)
+            if self._buffer is None or len(self._buffer) < size:
+                self._buffer = bytearray(size)
+            self._buffer_shape = image.shape
+        return self._buffer
+
+    def set_quality(self, quality):
+        """See OpenCVJpegEncoder.set_quality"""
+        self.quality = int(quality)
+
+    def encode(self, image):
+        """Encode a BGR image to JPEG, see OpenCVJpegEncoder.encode"""
+        image = np.ascontiguousarray(image)
+        if not self._supports_dst:
+            return self._jpeg.encode(image, quality=self.quality,
+                                     pixel_format=self._turbojpeg.TJPF_BGR,
+                                     jpeg_subsample=self._turbojpeg.TJSAMP_420)
+
+        buffer, size = self._jpeg.encode(image, quality=self.quality,
+                                         pixel_format=self._turbojpeg.TJPF_BGR,
+                                         jpeg_subsample=self._turbojpeg.TJSAMP_420,
+                                         dst=self._get_buffer(image))
+        return memoryview(buffer)[:size]
+
+
+ENCODERS = {
+    'turbojpeg': TurboJpegEncoder,
+    'simplejpeg': SimpleJpegEncoder,
+    'opencv': OpenCVJpegEncoder,
+}
+
+# Preference order used by the 'auto' backend
+AUTO_ORDER = ['turbojpeg', 'simplejpeg', 'opencv']
+
+
+def available_encoders(lib_path=None):
+    """
+    List the encoder backends that can be created on this machine
+
+    Args:
+        lib_path: Optional path to libturbojpeg for PyTurboJPEG
+
+    Returns:
+        List of backend names in preference order
+    """
+    available = []
+    for name in AUTO_ORDER:
+        try:
+            _create(name, 80, lib_path)
+            available.append(name)
+        except Exception:
+            continue
+    return available
+
+
+def _create(name, quality, lib_path):
+    if name == 'turbojpeg':
+        return TurboJpegEncoder(quality, lib_path=lib_path)
+    return ENCODERS[name](quality)
+
+
+def create_jpeg_encoder(backend='auto', quality=80, lib_path=None):
+    """
+    Create a JPEG encoder, falling back to OpenCV when a backend is unavailable
+
+    Args:
+        backend: 'auto', 'turbojpeg', 'simplejpeg' or 'opencv'
+        quality: JPEG quality (1-100)
+        lib_path: Optional path to libturbojpeg for PyTurboJPEG
+
+    Returns:
+        Encoder instance with an encode(image) method
+    """
+    if backend != 'auto' and backend not in ENCODERS:
+        print(f"Unknown JPEG encoder '{backend}', using auto")
+        backend = 'auto'
+
+    candidates = AUTO_ORDER if backend == 'auto' else [backend, 'opencv']
+    for name in candidates:
+        try:
+            return _create(name, quality, lib_path)
+        except Exception as e:
+            if backend != 'auto':
+                print(f"JPEG encoder '{name}' unavailable ({e}), falling back to OpenCV")
+
+    return OpenCVJpegEncoder(quality)
@@ -0,0 +1,173 @@
+#!/usr/bin/env python3
+"""
+Load generator for the streaming server.
+
+Opens N concurrent /video_feed viewers and M /detection_status pollers
+against a running server and reports delivered stream FPS, bandwidth and
+status latency. Pair it with FRAME_SOURCE=synthetic (or file/images) to
+measure server capacity on a machine without a webcam:
+
+    FRAME_SOURCE=synthetic python app.py
+    python load_test.py --viewers 20 --pollers 5 --duration 30
+"""
+
+import argparse
+import json
+import threading
+import time
+
+import numpy as np
+import requests
+
+BOUNDARY = b'--frame'
+
+
+class ViewerStats:
+    """Counters collected by one /video_feed client"""
+
+    def __init__(self):
+        self.frames = 0
+        self.bytes = 0
+        self.first_frame_s = None
+        self.error = None
+
+
+def run_viewer(base_url, stop_event, stats, started):
+    """Consume the MJPEG stream, counting frames by multipart boundary"""
+    try:
+        with requests.get(f"{base_url}/video_feed", stream=True, timeout=10) as response:
+            tail = b''
+            for chunk in response.iter_content(chunk_size=64 * 1024):
+                if stop_event.is_set():
+                    break
+                stats.bytes += len(chunk)
+                data = tail + chunk
+                count = data.count(BOUNDARY)
+                if count and stats.first_frame_s is None:
+                    stats.first_frame_s = time.perf_counter() - started
+                stats.frames += count
+                # Keep enough bytes to catch a boundary split across chunks
+                tail = data[-(len(BOUNDARY) - 1):]
+    except Exception as e:
+        if not stop_event.is_set():
+            stats.error = str(e)
+
+
+def run_poller(base_url, stop_event, latencies, errors, interval):
+    """Poll /detection_status and record request latency"""
+    session = requests.Session()
+    while not stop_event.is_set():
+        start = time.perf_counter()
+        try:
+            session.get(f"{base_url}/detection_status", timeout=10).json()
+            latencies.append(time.perf_counter() - start)
+        except Exception:
+            errors.append(time.perf_counter())
+        remaining = interval - (time.perf_counter() - start)
+        if remaining > 0:
+            stop_event.wait(remaining)
+
+
+def run_load_test(base_url, viewers, pollers, duration, poll_interval=1.0, start_detection=True):
+    """
+    Run the load test
+
+    Returns:
+        Dict with per-viewer and aggregate results
+    """
+    if start_detection:
+        print(requests.get(f"{base_url}/start_detection", timeout=30).json().get('message'))
+
+    stop_event = threading.Event()
+    viewer_stats = [ViewerStats() for _ in range(viewers)]
+    latencies = []
+    errors = []
+    threads = []
+    started = time.perf_counter()
+
+    for stats in viewer_stats:
+        threads.append(threading.Thread(target=run_viewer, args=(base_url, stop_event, stats, started),
+                                        daemon=True))
+    for _ in range(pollers):
+        threads.append(threading.Thread(target=run_poller,
+                                        args=(base_url, stop_event, latencies, errors, poll_interval),
+                                        daemon=True))
+    for thread in threads:
+        thread.start()
+
+    try:
+        time.sleep(duration)
+    except KeyboardInterrupt:
+        print("Interrupted, collecting results...")
+    stop_event.set()
+    elapsed = time.perf_counter() - started
+    for thread in threads:
+        thread.join(timeout=5)
+
+    fps = [stats.frames / elapsed for stats in viewer_stats]
+    result = {
+        'viewers': viewers,
+        'pollers': pollers,
+        'duration_s': elapsed,
+        'stream': {
+            'total_fps': float(sum(fps)),
+            'mean_fps_per_viewer': float(np.mean(fps)) if fps else 0.0,
+            'min_fps_per_viewer': float(np.min(fps)) if fps else 0.0,
+            'mbit_per_s': sum(stats.bytes for stats in viewer_stats) * 8 / elapsed / 1e6,
+            'first_frame_s': [stats.first_frame_s for stats in viewer_stats],
+            'errors': [stats.error for stats in viewer_stats if stats.error],
+        },
+        'status': {
+            'requests': len(latencies),
+            'errors': len(errors),
+        },
+    }
+    if latencies:
+        ms = np.asarray(latencies) * 1000
+        result['status'].update({
+            'mean_ms': float(ms.mean()),
+            'p50_ms': float(np.percentile(ms, 50)),
+            'p99_ms': float(np.percentile(ms, 99)),
+        })
+    return result
+
+
+def main():
+    """Command line entry point"""
+    parser = argparse.ArgumentParser(description='Load test /video_feed and /detection_status')
+    parser.add_argument('--url', default='http://127.0.0.1:5000', help='Server base URL')
+    parser.add_argument('--viewers', type=int, default=10, help='Concurrent /video_feed clients')
+    parser.add_argument('--pollers', type=int, default=2, help='Concurrent /detection_status clients')
+    parser.add_argument('--poll-interval', type=float, default=1.0, help='Seconds between status polls')
+    parser.add_argument('--duration', type=float, default=30, help='Test length in seconds')
+    parser.add_argument('--no-start', action='store_true', help='Do not call /start_detection first')
+    parser.add_argument('--json', help='Write results to this JSON file')
+    args = parser.parse_args()
+
+    print("🔥 Streaming Server Load Test")
+    print("=" * 50)
+    print(f"Target: {args.url}  viewers: {args.viewers}  pollers: {args.pollers}  duration: {args.duration}s")
+
+    result = run_load_test(args.url.rstrip('/'), args.viewers, args.pollers, args.duration,
+                           poll_interval=args.poll_interval, start_detection=not args.no_start)
+
+    stream = result['stream']
+    status = result['status']
+    print("\n" + "=" * 50)
+    print(f"Stream: {stream['total_fps']:.1f} frames/s total, "
+          f"{stream['mean_fps_per_viewer']:.1f} mean / {stream['min_fps_per_viewer']:.1f} min per viewer, "
+          f"{stream['mbit_per_s']:.1f} Mbit/s")
+    if stream['errors']:
+        print(f"Viewer errors: {len(stream['errors'])} (first: {stream['errors'][0]})")
+    if 'mean_ms' in status:
+        print(f"Status: {status['requests']} requests, {status['mean_ms']:.1f} ms mean, "
+              f"{status['p99_ms']:.1f} ms p99, {status['errors']} errors")
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(result, f, indent=2)
+        print(f"💾 Results written to {args.json}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,224 @@
+"""
+Region-of-interest and motion gating for face detection.
+
+A cheap low-resolution frame-differencing (or MOG2 background subtraction)
+motion detector decides whether the detector needs to run at all, and the
+configured regions of interest plus the moving areas decide which parts of
+the frame it runs on.
+"""
+
+import cv2
+import numpy as np
+
+
+def clip_region(region, width, height):
+    """Clip an (x, y, w, h) region to the frame, returning None if it is empty"""
+    x, y, w, h = region
+    x1, y1 = max(0, int(x)), max(0, int(y))
+    x2, y2 = min(width, int(x + w)), min(height, int(y + h))
+    if x2 <= x1 or y2 <= y1:
+        return None
+    return (x1, y1, x2 - x1, y2 - y1)
+
+
+def intersect_region(a, b):
+    """Intersection of two (x, y, w, h) regions, or None if they do not overlap"""
+    x1, y1 = max(a[0], b[0]), max(a[1], b[1])
+    x2, y2 = min(a[0] + a[2], b[0] + b[2]), min(a[1] + a[3], b[1] + b[3])
+    if x2 <= x1 or y2 <= y1:
+        return None
+    return (x1, y1, x2 - x1, y2 - y1)
+
+
+def union_region(regions):
+    """Bounding box of several (x, y, w, h) regions"""
+    x1 = min(r[0] for r in regions)
+    y1 = min(r[1] for r in regions)
+    x2 = max(r[0] + r[2] for r in regions)
+    y2 = max(r[1] + r[3] for r in regions)
+    return (x1, y1, x2 - x1, y2 - y1)
+
+
+def expand_region(region, padding, min_size, width, height):
+    """Grow a region by a fraction of its size (and to at least min_size), clipped to the frame"""
+    x, y, w, h = region
+    pad_x = max(w * padding, (min_size - w) / 2, 0)
+    pad_y = max(h * padding, (min_size - h) / 2, 0)
+    return clip_region((x - pad_x, y - pad_y, w + 2 * pad_x, h + 2 * pad_y), width, height)
+
+
+class MotionDetector:
+    """Low-resolution motion detector returning moving areas in frame coordinates"""
+
+    def __init__(self, method='diff', downscale_width=160, threshold=25, min_area=0.002):
+        """
+        Args:
+            method: 'diff' (frame differencing) or 'mog2' (background subtraction)
+            downscale_width: Width of the analysis image
+            threshold: Pixel difference treated as motion (diff method)
+            min_area: Minimum moving area as a fraction of the frame
+        """
+        self.method = method
+        self.downscale_width = downscale_width
+        self.threshold = threshold
+        self.min_area = min_area
+        self._previous = None
+        self._subtractor = None
+        if method == 'mog2':
+            self._subtractor = cv2.createBackgroundSubtractorMOG2(history=200, detectShadows=False)
+        self._kernel = np.ones((3, 3), np.uint8)
+
+    def detect(self, frame):
+        """
+        Find moving areas
+
+        Args:
+            frame: BGR frame
+
+        Returns:
+            List of (x, y, w, h) boxes in frame coordinates
+        """
+        height, width = frame.shape[:2]
+        scale = min(1.0, self.downscale_width / width)
+        small = cv2.resize(frame, (max(1, int(width * scale)), max(1, int(height * scale))),
+                           interpolation=cv2.INTER_AREA)
+        gray = cv2.GaussianBlur(cv2.cvtColor(small, cv2.COLOR_BGR2GRAY), (5, 5), 0)
+
+        if self._subtractor is not None:
+            mask = self._subtractor.apply(gray)
+        else:
+            if self._previous is None or self._previous.shape != gray.shape:
+                self._previous = gray
+                # No reference yet: treat the whole frame as changed
+                return [(0, 0, width, height)]
+            diff = cv2.absdiff(gray, self._previous)
+            self._previous = gray
+            _, mask = cv2.threshold(diff, self.threshold, 255, cv2.THRESH_BINARY)
+
+        mask = cv2.dilate(mask, self._kernel, iterations=2)
+        contours, _ = cv2.findContours(mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+
+        min_pixels = self.min_area * gray.shape[0] * gray.shape[1]
+        boxes = []
+        for contour in contours:
+            if cv2.contourArea(contour) < min_pixels:
+                continue
+            x, y, w, h = cv2.boundingRect(contour)
+            boxes.append((int(x / scale), int(y / scale), int(w / scale) + 1, int(h / scale) + 1))
+        return boxes
+
+    def reset(self):
+        self._previous = None
+
+
+class DetectionGate:
+    """Decide whether and where to run the face detector for a frame"""
+
+    def __init__(self, rois=None, motion_detector=None, padding=0.2, min_region_size=96,
+                 force_every=30):
+        """
+        Args:
+            rois: List of (x, y, w, h) regions as fractions of the frame (None = whole frame)
+            motion_detector: Optional MotionDetector; without one every pass runs
+            padding: Fractional padding added around active regions
+            min_region_size: Minimum crop size in pixels passed to the detector
+            force_every: Run a full (ungated) pass every N passes so still scenes refresh
+        """
+        self.rois = rois or []
+        self.motion_detector = motion_detector
+        self.padding = padding
+        self.min_region_size = min_region_size
+        self.force_every = force_every
+        self.passes = 0
+        self.skipped = 0
+        self.detected_pixels = 0
+        self.total_pixels = 0
+
+    def _roi_regions(self, width, height):
+        if not self.rois:
+            return [(0, 0, width, height)]
+        regions = []
+        for fx, fy, fw, fh in self.rois:
+            region = clip_region((fx * width, fy * height, fw * width, fh * height), width, height)
+            if region is not None:
+                regions.append(region)
+        return regions
+
+    def plan(self, frame):
+        """
+        Choose detector regions for a frame
+
+        Args:
+            frame: BGR frame
+
+        Returns:
+            List of (x, y, w, h) crops to run the detector on, or None to skip detection
+        """
+        height, width = frame.shape[:2]
+        self.passes += 1
+        self.total_pixels += width * height
+        roi_regions = self._roi_regions(width, height)
+
+        motion = None
+        if self.motion_detector is not None:
+            motion = self.motion_detector.detect(frame)
+
+        forced = self.force_every and self.passes % self.force_every == 0
+        if motion is None or forced:
+            active = roi_regions
+        else:
+            # Keep, per ROI, the union of the moving areas that overlap it
+            active = []
+            for roi in roi_regions:
+                inside = [region for region in (intersect_region(m, roi) for m in motion)
+                          if region is not None]
+                if inside:
+                    active.append(union_region(inside))
+
+        regions = []
+        for region in active:
+            region = expand_region(region, self.padding, self.min_region_size, width, height)
+            if region is not None:
+                regions.append(region)
+
+        if not regions:
+            self.skipped += 1
+            return None
+
+        self.detected_pixels += sum(w * h for _, _, w, h in regions)
+        return regions
+
+    def get_stats(self):
+        """Pass/skip counters and the share of pixels actually sent to the detector"""
+        return {
+            'passes': self.passes,
+            'skipped': self.skipped,
+            'skip_rate': self.skipped / self.passes if self.passes else 0.0,
+            'detected_pixel_fraction': self.detected_pixels / self.total_pixels if self.total_pixels else 0.0,
+        }
+
+
+def create_detection_gate(config):
+    """
+    Build the DetectionGate described by the configuration
+
+    Args:
+        config: Flask config with DETECTION_ROIS and MOTION_* settings
+
+    Returns:
+        DetectionGate, or None when neither ROIs nor motion gating are configured
+    """
+    rois = config['DETECTION_ROIS'].get(config['CAMERA_INDEX'])
+    motion_detector = None
+    if config['MOTION_GATING']:
+        motion_detector = MotionDetector(method=config['MOTION_METHOD'],
+                                         downscale_width=config['MOTION_DOWNSCALE_WIDTH'],
+                                         threshold=config['MOTION_THRESHOLD'],
+                                         min_area=config['MOTION_MIN_AREA'])
+
+    if not rois and motion_detector is None:
+        return None
+
+    return DetectionGate(rois=rois, motion_detector=motion_detector,
+                         padding=config['ROI_PADDING'],
+                         force_every=config['MOTION_FORCE_DETECT_EVERY'])
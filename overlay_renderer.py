@@ -0,0 +1,164 @@
+"""
+Cached overlay rendering for the video stream.
+
+Text is by far the most expensive part of the overlay: cv2.putText
+rasterizes anti-aliased Hershey strokes on every call, and the same few
+labels ("AUTHORIZED", "No faces detected", ...) were redrawn for every
+streamed frame. Labels are rasterized once per (text, color, scale,
+thickness) into a sprite with an alpha mask and alpha-blended into just the
+pixels they cover. Boxes and keypoints stay cheap OpenCV primitives.
+"""
+
+import threading
+from collections import OrderedDict
+
+import cv2
+import numpy as np
+
+FONT = cv2.FONT_HERSHEY_SIMPLEX
+KEYPOINT_COLORS = {
+    'left_eye': (255, 0, 0),
+    'right_eye': (255, 0, 0),
+    'nose': (0, 255, 255),
+    'mouth_left': (0, 0, 255),
+    'mouth_right': (0, 0, 255),
+}
+
+
+class LabelSprite:
+    """Pre-rasterized text: premultiplied color and inverse alpha, ready to blend"""
+
+    def __init__(self, text, color, scale, thickness):
+        (width, height), baseline = cv2.getTextSize(text, FONT, scale, thickness)
+        pad = thickness
+        mask = np.zeros((height + baseline + 2 * pad, width + 2 * pad), dtype=np.uint8)
+        cv2.putText(mask, text, (pad, pad + height), FONT, scale, 255, thickness)
+
+        # Kept as 3-channel uint8 planes so blending is two saturating OpenCV calls
+        alpha = np.repeat(mask[:, :, None], 3, axis=2)
+        self.premultiplied = np.round(alpha / 255.0 * np.array(color)).astype(np.uint8)
+        self.inverse_alpha = 255 - alpha
+        # Offset from the putText origin (bottom-left of the text) to the sprite's top-left
+        self.offset = (-pad, -(pad + height))
+        self.height, self.width = mask.shape
+
+    def blend(self, image, x, y):
+        """Draw onto image as cv2.putText(image, text, (x, y), ...) would"""
+        left, top = x + self.offset[0], y + self.offset[1]
+        # Clip the sprite to the image
+        x1, y1 = max(0, left), max(0, top)
+        x2 = min(image.shape[1], left + self.width)
+        y2 = min(image.shape[0], top + self.height)
+        if x1 >= x2 or y1 >= y2:
+            return
+        sx, sy = x1 - left, y1 - top
+        region = image[y1:y2, x1:x2]
+        inverse_alpha = self.inverse_alpha[sy:sy + y2 - y1, sx:sx + x2 - x1]
+        premultiplied = self.premultiplied[sy:sy + y2 - y1, sx:sx + x2 - x1]
+        # region * (1 - alpha) + color * alpha, in place
+        cv2.multiply(region, inverse_alpha, dst=region, scale=1 / 255)
+        cv2.add(region, premultiplied, dst=region)
+
+
+class LabelSpriteCache:
+    """LRU cache of LabelSprites keyed by text and style"""
+
+    def __init__(self, max_size=256):
+        """
+        Args:
+            max_size: Sprites kept (least recently used are dropped)
+        """
+        self.max_size = max_size
+        self._sprites = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, text, color, scale=0.6, thickness=2):
+        """Sprite for a label, rasterized on first use"""
+        key = (text, color, scale, thickness)
+        with self._lock:
+            sprite = self._sprites.get(key)
+            if sprite is not None:
+                self._sprites.move_to_end(key)
+                self.hits += 1
+                return sprite
+            self.misses += 1
+
+        sprite = LabelSprite(text, color, scale, thickness)
+        with self._lock:
+            self._sprites[key] = sprite
+            while len(self._sprites) > self.max_size:
+                self._sprites.popitem(last=False)
+        return sprite
+
+    def get_stats(self):
+        """Return cache counters"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'size': len(self._sprites),
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+            }
+
+
+class OverlayRenderer:
+    """Draw face boxes, labels and keypoints with cached label sprites"""
+
+    def __init__(self, max_sprites=256, draw_keypoints=True):
+        """
+        Args:
+            max_sprites: Label sprites kept in the cache
+            draw_keypoints: Draw the five MTCNN keypoints
+        """
+        self.sprites = LabelSpriteCache(max_sprites)
+        self.draw_keypoints = draw_keypoints
+
+    def render(self, image, faces, is_authorized):
+        """
+        Return a copy of image with the overlay drawn on it
+
+        Args:
+            image: BGR frame (not modified)
+            faces: Face dicts with box, confidence and optional keypoints
+            is_authorized: Callable(image, face) -> bool
+
+        Returns:
+            New BGR image
+        """
+        vis_image = image.copy()
+        if not faces:
+            self.sprites.get("No faces detected", (0, 0, 255), 1.0, 2).blend(vis_image, 10, 30)
+            return vis_image
+
+        for i, face in enumerate(faces):
+            try:
+                x, y, width, height = face['box']
+
+                # Ensure coordinates are within image bounds
+                x = max(0, x)
+                y = max(0, y)
+                width = min(width, image.shape[1] - x)
+                height = min(height, image.shape[0] - y)
+
+                authorized = is_authorized(image, face)
+                color = (0, 255, 0) if authorized else (0, 0, 255)
+                cv2.rectangle(vis_image, (x, y), (x + width, y + height), color, 2)
+
+                self.sprites.get(f"Face {i + 1}: {face['confidence']:.3f}", color).blend(vis_image, x, y - 25)
+                self.sprites.get("AUTHORIZED" if authorized else "UNAUTHORIZED", color).blend(vis_image, x, y - 5)
+
+                if self.draw_keypoints and 'keypoints' in face:
+                    for key, (kx, ky) in face['keypoints'].items():
+                        cv2.circle(vis_image, (int(kx), int(ky)), 3, KEYPOINT_COLORS.get(key, (255, 255, 255)), -1)
+            except Exception as e:
+                print(f"Error visualizing face {i}: {e}")
+                continue
+
+        return vis_image
+
+    def get_stats(self):
+        """Return sprite cache counters"""
+        return self.sprites.get_stats()
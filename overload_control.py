@@ -0,0 +1,230 @@
+"""
+Load shedding under overload.
+
+When the box is saturated, detection falls behind while the stream keeps
+encoding every frame and status polls keep running recognition, so
+everything gets slower together. The controller watches pipeline lag (grab
+to publish) and the process CPU share, and steps through degradation
+levels, each keeping the cuts of the levels below it:
+
+    0 normal
+    1 reduced_stream      stream FPS and JPEG quality are lowered
+    2 slow_detection      the detection interval is widened
+    3 known_tracks_only   tracks that already have a recognition result are
+                          not recognized again
+    4 viewer_cap          new stream viewers are refused above a cap
+
+It escalates one level after a few consecutive overloaded checks and
+recovers one level after a longer run of healthy checks, so the level does
+not flap around the thresholds.
+"""
+
+import os
+import threading
+import time
+
+import numpy as np
+
+OVERLOAD_LEVELS = ('normal', 'reduced_stream', 'slow_detection', 'known_tracks_only', 'viewer_cap')
+
+
+def _available_cpus():
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+
+class OverloadController:
+    """Pick a degradation level from pipeline lag and CPU use, with hysteresis"""
+
+    def __init__(self, max_lag_ms=300.0, recover_lag_ms=150.0, max_cpu=0.9, recover_cpu=0.6,
+                 check_interval=1.0, escalate_after=2, recover_after=5, stream_fps=10,
+                 jpeg_quality=60, detection_interval_scale=2, track_result_max_age=10.0,
+                 max_viewers=2):
+        """
+        Args:
+            max_lag_ms: p95 grab-to-publish lag above which a check counts as overloaded
+            recover_lag_ms: p95 lag below which a check counts as healthy
+            max_cpu: Process CPU share of the available cores counted as overloaded
+            recover_cpu: CPU share counted as healthy
+            check_interval: Seconds between checks
+            escalate_after: Consecutive overloaded checks before moving up a level
+            recover_after: Consecutive healthy checks before moving down a level
+            stream_fps: Stream frame rate cap from level 1
+            jpeg_quality: Stream JPEG quality from level 1
+            detection_interval_scale: PROCESS_EVERY_N_FRAMES multiplier from level 2
+            track_result_max_age: Seconds a track's last recognition result is reused from level 3
+            max_viewers: Concurrent stream viewers allowed at level 4
+        """
+        self.max_lag_ms = max_lag_ms
+        self.recover_lag_ms = recover_lag_ms
+        self.max_cpu = max_cpu
+        self.recover_cpu = recover_cpu
+        self.check_interval = check_interval
+        self.escalate_after = escalate_after
+        self.recover_after = recover_after
+        self.track_result_max_age = track_result_max_age
+        self._policies = [{
+            'stream_fps': stream_fps if level >= 1 else None,
+            'jpeg_quality': jpeg_quality if level >= 1 else None,
+            'detection_interval_scale': detection_interval_scale if level >= 2 else 1,
+            'skip_known_tracks': level >= 3,
+            'max_viewers': max_viewers if level >= 4 else None,
+        } for level in range(len(OVERLOAD_LEVELS))]
+        self._cpus = _available_cpus()
+        self._lock = threading.Lock()
+        self.viewers = 0
+        self.viewers_rejected = 0
+        self.reset()
+
+    def reset(self):
+        """Return to level 0 and start a fresh measurement window"""
+        with self._lock:
+            self.level = 0
+            self._lag_samples = []
+            self._overloaded_checks = 0
+            self._healthy_checks = 0
+            self._last_check = time.monotonic()
+            self._last_cpu = time.process_time()
+            self._level_since = time.time()
+            self.last_lag_ms = None
+            self.last_cpu = None
+            self.escalations = 0
+            self.recoveries = 0
+
+    @property
+    def policy(self):
+        """Settings of the current level (shared dict, do not modify)"""
+        return self._policies[self.level]
+
+    def observe_lag(self, ms):
+        """Record one grab-to-publish latency sample (capture thread)"""
+        self._lag_samples.append(ms)
+
+    def update(self):
+        """
+        Re-evaluate the level once check_interval has passed (call once per captured frame)
+
+        Returns:
+            Current level
+        """
+        now = time.monotonic()
+        if now - self._last_check < self.check_interval:
+            return self.level
+
+        cpu_now = time.process_time()
+        with self._lock:
+            samples, self._lag_samples = self._lag_samples, []
+            elapsed = now - self._last_check
+            self.last_cpu = (cpu_now - self._last_cpu) / elapsed / self._cpus
+            self.last_lag_ms = float(np.percentile(samples, 95)) if samples else None
+            self._last_check = now
+            self._last_cpu = cpu_now
+
+            lag = self.last_lag_ms
+            if (lag is not None and lag > self.max_lag_ms) or self.last_cpu > self.max_cpu:
+                self._overloaded_checks += 1
+                self._healthy_checks = 0
+            elif (lag is None or lag < self.recover_lag_ms) and self.last_cpu < self.recover_cpu:
+                self._healthy_checks += 1
+                self._overloaded_checks = 0
+            else:
+                # Between the thresholds: hold the current level
+                self._overloaded_checks = 0
+                self._healthy_checks = 0
+
+            if self._overloaded_checks >= self.escalate_after and self.level < len(OVERLOAD_LEVELS) - 1:
+                self._set_level(self.level + 1)
+                self.escalations += 1
+            elif self._healthy_checks >= self.recover_after and self.level > 0:
+                self._set_level(self.level - 1)
+                self.recoveries += 1
+            return self.level
+
+    def _set_level(self, level):
+        rising = level > self.level
+        self.level = level
+        self._level_since = time.time()
+        self._overloaded_checks = 0
+        self._healthy_checks = 0
+        lag = f"{self.last_lag_ms:.0f} ms" if self.last_lag_ms is not None else 'n/a'
+        print(f"{'⚠️' if rising else '✅'} Overload level {level} ({OVERLOAD_LEVELS[level]}): "
+              f"lag {lag}, CPU {self.last_cpu:.0%}")
+
+    def detection_interval(self, every_n_frames):
+        """Detection interval in frames for the current level"""
+        return every_n_frames * self.policy['detection_interval_scale']
+
+    def stream_interval(self):
+        """Minimum seconds between streamed frames (0 = every frame)"""
+        fps = self.policy['stream_fps']
+        return 1.0 / fps if fps else 0.0
+
+    def jpeg_quality(self, default):
+        """Stream JPEG quality for the current level"""
+        quality = self.policy['jpeg_quality']
+        return default if quality is None else min(default, quality)
+
+    def acquire_viewer(self):
+        """
+        Admit a new stream viewer
+
+        Returns:
+            False if the viewer cap of the current level is reached; otherwise
+            the viewer is counted until release_viewer() is called
+        """
+        with self._lock:
+            cap = self.policy['max_viewers']
+            if cap is not None and self.viewers >= cap:
+                self.viewers_rejected += 1
+                return False
+            self.viewers += 1
+            return True
+
+    def release_viewer(self):
+        """Stop counting a viewer admitted by acquire_viewer()"""
+        with self._lock:
+            self.viewers = max(0, self.viewers - 1)
+
+    def get_stats(self):
+        """Return the current level, its settings and the last measurements"""
+        with self._lock:
+            return {
+                'level': self.level,
+                'state': OVERLOAD_LEVELS[self.level],
+                'policy': dict(self.policy),
+                'seconds_at_level': time.time() - self._level_since,
+                'lag_p95_ms': self.last_lag_ms,
+                'cpu': self.last_cpu,
+                'escalations': self.escalations,
+                'recoveries': self.recoveries,
+                'viewers': self.viewers,
+                'viewers_rejected': self.viewers_rejected,
+            }
+
+
+def create_overload_controller(config):
+    """
+    Build the OverloadController described by the configuration
+
+    Args:
+        config: Flask config with OVERLOAD_* settings
+
+    Returns:
+        OverloadController, or None when OVERLOAD_CONTROL is off
+    """
+    if not config['OVERLOAD_CONTROL']:
+        return None
+    return OverloadController(max_lag_ms=config['OVERLOAD_MAX_LAG_MS'],
+                              recover_lag_ms=config['OVERLOAD_RECOVER_LAG_MS'],
+                              max_cpu=config['OVERLOAD_MAX_CPU'],
+                              recover_cpu=config['OVERLOAD_RECOVER_CPU'],
+                              check_interval=config['OVERLOAD_CHECK_INTERVAL'],
+                              escalate_after=config['OVERLOAD_ESCALATE_AFTER'],
+                              recover_after=config['OVERLOAD_RECOVER_AFTER'],
+                              stream_fps=config['OVERLOAD_STREAM_FPS'],
+                              jpeg_quality=config['OVERLOAD_JPEG_QUALITY'],
+                              detection_interval_scale=config['OVERLOAD_DETECTION_INTERVAL_SCALE'],
+                              track_result_max_age=config['OVERLOAD_TRACK_RESULT_MAX_AGE'],
+                              max_viewers=config['OVERLOAD_MAX_VIEWERS'])
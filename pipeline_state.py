@@ -0,0 +1,106 @@
+"""
+Immutable, versioned snapshots of the capture pipeline's output.
+
+The capture thread builds a new FrameSnapshot for every frame and publishes
+it with a single reference assignment, which is atomic in CPython. Readers
+(stream generators, status endpoints) just read the current reference: they
+never take a lock and never need defensive copies, and they can compare
+sequence numbers to skip work when nothing changed.
+"""
+
+import threading
+import time
+from collections import namedtuple
+
+FrameSnapshot = namedtuple('FrameSnapshot', ['seq', 'frame', 'faces', 'timestamp', 'captured'],
+                           defaults=(None,))
+FrameSnapshot.__doc__ = """
+Pipeline output for one frame
+
+Args:
+    seq: Sequence number, increases by one per published frame (0 = no frame yet)
+    frame: Read-only BGR frame (None before the first frame)
+    faces: Tuple of face dicts (treat as read-only)
+    timestamp: time.time() when the frame was published
+    captured: time.time() when the frame was grabbed from the source (None before the first frame)
+"""
+
+EMPTY_SNAPSHOT = FrameSnapshot(0, None, (), 0.0)
+
+
+class SnapshotPublisher:
+    """Single-writer publisher of FrameSnapshot objects"""
+
+    def __init__(self):
+        self._snapshot = EMPTY_SNAPSHOT
+        self._new_frame = threading.Event()
+        self._listeners = []
+
+    def publish(self, frame, faces, captured=None):
+        """
+        Publish a new frame and its detection results (capture thread only)
+
+        Args:
+            frame: BGR frame; it is marked read-only and must not be modified afterwards
+            faces: Face dicts for this frame; they must not be modified afterwards
+            captured: time.time() the frame was grabbed (defaults to now)
+
+        Returns:
+            The published FrameSnapshot
+        """
+        if frame is not None:
+            frame.flags.writeable = False
+        now = time.time()
+        snapshot = FrameSnapshot(self._snapshot.seq + 1, frame, tuple(faces), now,
+                                 captured if captured is not None else now)
+
+        # Assign the snapshot before waking waiters so they always observe it
+        self._snapshot = snapshot
+        self._notify()
+        return snapshot
+
+    def latest(self):
+        """Return the current snapshot (lock-free)"""
+        return self._snapshot
+
+    def wait_for_update(self, last_seq, timeout=None):
+        """
+        Wait until a snapshot newer than last_seq is published
+
+        Args:
+            last_seq: Sequence number the caller already processed
+            timeout: Maximum seconds to wait
+
+        Returns:
+            The current snapshot (check its seq to see whether it is new)
+        """
+        event = self._new_frame
+        snapshot = self._snapshot
+        if snapshot.seq != last_seq:
+            return snapshot
+        event.wait(timeout)
+        return self._snapshot
+
+    def reset(self):
+        """Publish an empty snapshot (e.g. when detection stops)"""
+        self._snapshot = EMPTY_SNAPSHOT._replace(seq=self._snapshot.seq + 1, timestamp=time.time())
+        self._notify()
+
+    def add_listener(self, callback):
+        """
+        Call callback(snapshot) after every publish
+
+        Callbacks run on the capture thread and must return quickly
+        (e.g. loop.call_soon_threadsafe).
+        """
+        self._listeners.append(callback)
+
+    def _notify(self):
+        event, self._new_frame = self._new_frame, threading.Event()
+        event.set()
+        snapshot = self._snapshot
+        for callback in self._listeners:
+            try:
+                callback(snapshot)
+            except Exception as e:
+                print(f"Snapshot listener failed: {e}")
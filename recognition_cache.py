@@ -0,0 +1,167 @@
+"""
+Bounded LRU/TTL cache of recognition results.
+
+Entries are keyed by track ID when the face has one, otherwise by a
+perceptual (difference) hash of the face crop. A cached match is reused as
+long as the entry is fresh and the appearance hash has not moved more than
+a few bits, so a person standing still in front of the camera is only
+matched against the gallery once per TTL. Faces without a track (worker
+pool, batch processing) are looked up by the nearest stored hash.
+"""
+
+import threading
+import time
+from collections import OrderedDict
+
+import cv2
+import numpy as np
+
+
+def appearance_hash(face_img, hash_size=8):
+    """
+    Compute a 64-bit difference hash (dHash) of a face crop
+
+    Args:
+        face_img: BGR face image
+        hash_size: Hash grid size (hash has hash_size * hash_size bits)
+
+    Returns:
+        Integer hash
+    """
+    if face_img.ndim == 3:
+        face_img = cv2.cvtColor(face_img, cv2.COLOR_BGR2GRAY)
+    small = cv2.resize(face_img, (hash_size + 1, hash_size), interpolation=cv2.INTER_AREA)
+    bits = (small[:, 1:] > small[:, :-1]).flatten()
+    return int.from_bytes(np.packbits(bits).tobytes(), 'big')
+
+
+def hamming_distance(a, b):
+    """Number of differing bits between two hashes"""
+    return bin(a ^ b).count('1')
+
+
+class RecognitionCache:
+    """Thread-safe LRU cache of (name, similarity) results with a TTL"""
+
+    def __init__(self, max_size=256, ttl=2.0, max_hash_distance=6):
+        """
+        Args:
+            max_size: Maximum number of cached entries (least recently used are evicted)
+            ttl: Seconds a cached result stays valid
+            max_hash_distance: Maximum dHash bit difference still treated as the same appearance
+        """
+        self.max_size = max_size
+        self.ttl = ttl
+        self.max_hash_distance = max_hash_distance
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    @staticmethod
+    def make_key(face_info, face_hash):
+        """Key by track ID when available, otherwise by the appearance hash (see get)"""
+        track_id = face_info.get('track_id') if isinstance(face_info, dict) else None
+        if track_id is not None:
+            return ('track', track_id)
+        return ('hash', face_hash)
+
+    def get(self, key, face_hash):
+        """
+        Look up a cached result
+
+        Hash keys match the nearest fresh stored hash within
+        max_hash_distance, not only the identical hash.
+
+        Args:
+            key: Key from make_key
+            face_hash: Appearance hash of the current face crop
+
+        Returns:
+            Cached (name, similarity) tuple or None on a miss
+        """
+        now = time.monotonic()
+        with self._lock:
+            if key[0] == 'hash':
+                key = self._nearest_hash_key(face_hash, now)
+            entry = self._entries.get(key) if key is not None else None
+            if entry is not None:
+                result, stored_hash, created = entry
+                if now - created > self.ttl:
+                    del self._entries[key]
+                    self.expirations += 1
+                elif hamming_distance(stored_hash, face_hash) <= self.max_hash_distance:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return result
+            self.misses += 1
+            return None
+
+    def _nearest_hash_key(self, face_hash, now):
+        """Key of the closest fresh hash entry within max_hash_distance (caller holds the lock)"""
+        best_key = None
+        best_distance = self.max_hash_distance + 1
+        for key, (_, stored_hash, created) in list(self._entries.items()):
+            if key[0] != 'hash':
+                continue
+            if now - created > self.ttl:
+                del self._entries[key]
+                self.expirations += 1
+                continue
+            distance = hamming_distance(stored_hash, face_hash)
+            if distance < best_distance:
+                best_key, best_distance = key, distance
+                if distance == 0:
+                    break
+        return best_key
+
+    def peek(self, key, max_age=None):
+        """
+        Last fresh result stored under a key, whatever the current appearance
+
+        Used to carry a track's result over frames that are not recognized
+        (e.g. rejected by the quality gate). Does not count as a hit or miss.
+
+        Args:
+            key: Key from make_key
+            max_age: Oldest result accepted in seconds (defaults to the TTL)
+
+        Returns:
+            Cached (name, similarity) tuple or None
+        """
+        max_age = self.ttl if max_age is None else max_age
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or time.monotonic() - entry[2] > max_age:
+                return None
+            return entry[0]
+
+    def put(self, key, face_hash, result):
+        """Store a (name, similarity) result, evicting the least recently used entry if full"""
+        with self._lock:
+            self._entries[key] = (result, face_hash, time.monotonic())
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        """Drop all cached results (e.g. after the gallery changed)"""
+        with self._lock:
+            self._entries.clear()
+
+    def get_stats(self):
+        """Return hit/miss/eviction counters"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'size': len(self._entries),
+                'max_size': self.max_size,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+                'evictions': self.evictions,
+                'expirations': self.expirations,
+            }
@@ -0,0 +1,681 @@
+"""
+Identity gallery split into shards, optionally served by worker processes.
+
+Identities are routed to a shard by a stable hash of their name. Each shard
+stores its samples in a memory-mapped .npy file plus a small JSON manifest,
+so the OS page cache (not each process's heap) holds the embeddings and
+several processes can map the same shard. Queries are scattered to every
+shard and the per-shard top-k lists are merged, so one core scans only
+1/N of a large watchlist.
+
+Every change writes a new generation of the shard and then swaps the
+manifest in with an atomic rename. Other processes notice the change with a
+stat() of the manifest (refresh()), map the new files and publish them in
+one reference swap, so matching never pauses and never sees a partial
+update. Writers from different processes are serialized by a lock file and
+refresh before they modify, so no enrollment is lost. Searches never wait
+for a writer: in-process shards are searched without a lock, and shard
+processes take modifications on a separate pipe served by their own thread.
+
+On-disk layout:
+    gallery.json             {"num_shards": 4, "migrated": true}  (migrated: the legacy pickle was imported)
+    rebalance.pkl            all identities, only while the shard count is being changed
+    shard_003.json           {"generation": 7, "dim": 10000, "prototypes_per_identity": 1,
+                              "identities": [[name, rows, prototype rows], ...]}
+    shard_003.7.npy          float32 (rows, dim) samples in manifest order
+    shard_003.7.proto.npy    float32 prototypes in manifest order
+    shard_003.lock           present while a process writes the shard
+    gallery.lock             present while a process checks or changes the shard count
+"""
+
+import glob
+import heapq
+import json
+import multiprocessing as mp
+import os
+import pickle
+import threading
+import time
+import zlib
+
+import numpy as np
+
+from face_gallery import IdentityGallery
+
+
+def shard_for(name, num_shards):
+    """Stable shard index for an identity name (same in every process)"""
+    return zlib.crc32(name.encode('utf-8')) % num_shards
+
+
+def _read_json(path):
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def _write_json(path, data):
+    with open(path + '.tmp', 'w', encoding='utf-8') as f:
+        json.dump(data, f, ensure_ascii=False)
+    # Readers see either the old or the new file, never a partial one
+    os.replace(path + '.tmp', path)
+
+
+def _file_stamp(path):
+    """Cheap change check: (inode, mtime_ns, size) of a file, or None if it is missing"""
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    # The manifest is replaced by rename, so every generation is a new inode
+    return stat.st_ino, stat.st_mtime_ns, stat.st_size
+
+
+class _FileLock:
+    """Cross-process lock held by creating a file exclusively"""
+
+    def __init__(self, path, timeout=10.0, stale_after=30.0):
+        """
+        Args:
+            path: Lock file path
+            timeout: Seconds to wait for the lock before giving up
+            stale_after: A lock file older than this is left over from a crashed writer
+        """
+        self.path = path
+        self.timeout = timeout
+        self.stale_after = stale_after
+
+    def __enter__(self):
+        deadline = time.time() + self.timeout
+        while True:
+            try:
+                fd = os.open(self.path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+                os.write(fd, str(os.getpid()).encode('ascii'))
+                os.close(fd)
+                return self
+            except FileExistsError:
+                try:
+                    if time.time() - os.path.getmtime(self.path) > self.stale_after:
+                        os.remove(self.path)
+                        continue
+                except OSError:
+                    continue
+                if time.time() > deadline:
+                    raise TimeoutError(f"Timed out waiting for {self.path}")
+                time.sleep(0.01)
+
+    def __exit__(self, *exc):
+        try:
+            os.remove(self.path)
+        except OSError:
+            pass
+
+
+class GalleryShard:
+    """One shard of the gallery, backed by a memory-mapped file"""
+
+    def __init__(self, shard_id, shard_dir, prototypes_per_identity=1, rerank_candidates=3):
+        """
+        Args:
+            shard_id: Shard index
+            shard_dir: Directory holding the shard files
+            prototypes_per_identity: Prototype vectors kept per identity
+            rerank_candidates: Identities re-ranked against their samples (0 = prototypes only)
+        """
+        self.shard_id = shard_id
+        self.shard_dir = shard_dir
+        self.gallery = IdentityGallery(prototypes_per_identity=prototypes_per_identity,
+                                       rerank_candidates=rerank_candidates)
+        self.generation = 0
+        # Manifest stamp of the loaded generation, compared by refresh()
+        self._stamp = None
+        self._lock = threading.RLock()
+        self.load()
+
+    @property
+    def manifest_path(self):
+        return os.path.join(self.shard_dir, f'shard_{self.shard_id:03d}.json')
+
+    @property
+    def lock_path(self):
+        return os.path.join(self.shard_dir, f'shard_{self.shard_id:03d}.lock')
+
+    def _data_path(self, generation):
+        return os.path.join(self.shard_dir, f'shard_{self.shard_id:03d}.{generation}.npy')
+
+    def _prototype_path(self, generation):
+        return os.path.join(self.shard_dir, f'shard_{self.shard_id:03d}.{generation}.proto.npy')
+
+    def load(self):
+        """(Re)map the shard's current generation from disk"""
+        with self._lock:
+            stamp = _file_stamp(self.manifest_path)
+            if stamp is None:
+                self.generation = 0
+                self._stamp = None
+                self.gallery.clear()
+                return
+
+            manifest = _read_json(self.manifest_path)
+            identities = manifest.get('identities', [])
+            generation = manifest.get('generation', 0)
+
+            mapped = {}
+            prototypes = {}
+            if identities:
+                data = np.load(self._data_path(generation), mmap_mode='r')
+                if sum(entry[1] for entry in identities) != len(data):
+                    raise ValueError(f"Shard {self.shard_id} manifest does not match its data file")
+
+                start = 0
+                for entry in identities:
+                    # Slices of the memory map: samples are paged in on demand, not copied
+                    mapped[entry[0]] = data[start:start + entry[1]]
+                    start += entry[1]
+
+                # Stored prototypes are reused only if they were built with the same setting
+                stored = os.path.exists(self._prototype_path(generation)) and all(len(entry) > 2 for entry in identities)
+                if stored and manifest.get('prototypes_per_identity') == self.gallery.prototypes_per_identity:
+                    matrix = np.load(self._prototype_path(generation), mmap_mode='r')
+                    start = 0
+                    for name, _, rows in identities:
+                        prototypes[name] = matrix[start:start + rows]
+                        start += rows
+
+            # One snapshot swap: matching keeps using the old generation until here
+            self.gallery.load_dict(mapped, prototypes)
+            self.generation = generation
+            self._stamp = stamp
+
+    def refresh(self):
+        """
+        Map a newer generation written by another process, if there is one
+
+        Returns:
+            True if the shard changed
+        """
+        with self._lock:
+            stamp = _file_stamp(self.manifest_path)
+            if stamp == self._stamp:
+                return False
+            previous = self.generation
+            self.load()
+            return self.generation != previous
+
+    def persist(self):
+        """Write the shard as a new generation and switch the manifest to it"""
+        os.makedirs(self.shard_dir, exist_ok=True)
+        generation = self.generation + 1
+        identities = self.gallery.to_dict()
+        prototypes = self.gallery.prototypes()
+
+        if identities:
+            matrix = np.vstack([samples for samples in identities.values()]).astype(np.float32)
+            for path, array in ((self._data_path(generation), matrix),
+                                (self._prototype_path(generation),
+                                 np.vstack([prototypes[name] for name in identities]).astype(np.float32))):
+                with open(path + '.tmp', 'wb') as f:
+                    np.save(f, array)
+                os.replace(path + '.tmp', path)
+            dim = int(matrix.shape[1])
+        else:
+            dim = 0
+
+        _write_json(self.manifest_path, {
+            'generation': generation,
+            'dim': dim,
+            'prototypes_per_identity': self.gallery.prototypes_per_identity,
+            'identities': [[name, int(len(samples)), int(len(prototypes[name]))]
+                           for name, samples in identities.items()],
+        })
+
+        # Map the file just written so the samples go back to the page cache
+        self.load()
+        self._remove_stale_generations()
+
+    def _remove_stale_generations(self):
+        """
+        Drop files of generations older than the previous one
+
+        The previous generation is kept: another process may have read the
+        old manifest and not yet mapped its data files.
+        """
+        for path in glob.glob(os.path.join(self.shard_dir, f'shard_{self.shard_id:03d}.*.npy')):
+            generation = os.path.basename(path).split('.')[1]
+            if generation.isdigit() and int(generation) < self.generation - 1:
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+
+    def _modify(self, update):
+        """Apply an update on top of the newest generation and persist it"""
+        with self._lock, _FileLock(self.lock_path):
+            # Another process may have written since our last refresh
+            self.refresh()
+            result = update()
+            if result is not False:
+                self.persist()
+            return result
+
+    def search(self, features, k):
+        """Top-k (name, similarity) lists for each row of a feature matrix"""
+        return self.gallery.search_batch(features, k)
+
+    def samples(self, name):
+        samples = self.gallery.samples(name)
+        return None if samples is None else np.array(samples)
+
+    def sample_counts(self):
+        return self.gallery.sample_counts()
+
+    def set_samples(self, name, samples):
+        self._modify(lambda: self.gallery.set_samples(name, samples))
+        return len(self.gallery.samples(name))
+
+    def add_sample(self, name, features):
+        self._modify(lambda: self.gallery.add_sample(name, features))
+        return len(self.gallery.samples(name))
+
+    def remove_identity(self, name):
+        return self._modify(lambda: self.gallery.remove_identity(name))
+
+    def load_dict(self, identities):
+        self._modify(lambda: self.gallery.load_dict(identities))
+
+    def clear(self):
+        self.load_dict({})
+
+    def to_dict(self):
+        return {name: np.array(samples) for name, samples in self.gallery.to_dict().items()}
+
+    def destroy(self):
+        """Delete the shard's files"""
+        paths = [self.manifest_path, self.lock_path]
+        paths += glob.glob(os.path.join(self.shard_dir, f'shard_{self.shard_id:03d}.*.npy'))
+        for path in paths:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+
+def _serve_shard(conn, shard):
+    """Answer GalleryShard calls arriving on a pipe until it is closed"""
+    while True:
+        try:
+            message = conn.recv()
+        except (EOFError, OSError):
+            break
+        if message is None:
+            break
+
+        method, args = message
+        try:
+            conn.send(('ok', getattr(shard, method)(*args)))
+        except Exception as e:
+            conn.send(('error', f"{type(e).__name__}: {e}"))
+    conn.close()
+
+
+def _shard_main(conn, control_conn, shard_id, shard_dir, prototypes_per_identity, rerank_candidates):
+    """
+    Shard process entry point
+
+    Searches arrive on conn. Modifications, refreshes and reads arrive on
+    control_conn and run on their own thread, so a search never waits behind
+    the file lock or a write of the shard files.
+    """
+    shard = GalleryShard(shard_id, shard_dir, prototypes_per_identity, rerank_candidates)
+    conn.send(('ok', shard.sample_counts()))
+    threading.Thread(target=_serve_shard, args=(control_conn, shard), daemon=True).start()
+    _serve_shard(conn, shard)
+
+
+class _LocalShard:
+    """GalleryShard called directly in this process"""
+
+    def __init__(self, shard):
+        self.shard = shard
+
+    def call(self, method, *args):
+        # GalleryShard serializes its writers itself; searches need no lock
+        return getattr(self.shard, method)(*args)
+
+    def control(self, method, *args):
+        return self.call(method, *args)
+
+    def close(self):
+        pass
+
+
+class _RemoteShard:
+    """GalleryShard running in a worker process"""
+
+    def __init__(self, ctx, shard_id, shard_dir, prototypes_per_identity, rerank_candidates):
+        self.conn, child_conn = ctx.Pipe()
+        self.control_conn, child_control_conn = ctx.Pipe()
+        # One request at a time on the control pipe; the search pipe is guarded by the gallery
+        self._control_lock = threading.Lock()
+        self.process = ctx.Process(target=_shard_main,
+                                   args=(child_conn, child_control_conn, shard_id, shard_dir,
+                                         prototypes_per_identity, rerank_candidates),
+                                   daemon=True)
+        self.process.start()
+        child_conn.close()
+        child_control_conn.close()
+
+    def send(self, method, *args):
+        self.conn.send((method, args))
+
+    def receive(self):
+        return self._unwrap(self.conn.recv())
+
+    @staticmethod
+    def _unwrap(reply):
+        status, result = reply
+        if status != 'ok':
+            raise RuntimeError(result)
+        return result
+
+    def control(self, method, *args):
+        """Call a method over the control pipe (writes, refreshes, reads)"""
+        with self._control_lock:
+            self.control_conn.send((method, args))
+            return self._unwrap(self.control_conn.recv())
+
+    def close(self):
+        for conn in (self.control_conn, self.conn):
+            try:
+                conn.send(None)
+            except (BrokenPipeError, OSError):
+                pass
+        self.process.join(timeout=5)
+        if self.process.is_alive():
+            self.process.terminate()
+        self.conn.close()
+        self.control_conn.close()
+
+
+class ShardedGallery:
+    """IdentityGallery-compatible gallery split across memory-mapped shards"""
+
+    def __init__(self, num_shards, shard_dir, prototypes_per_identity=1, rerank_candidates=3,
+                 use_processes=True, reshard=False):
+        """
+        Args:
+            num_shards: Number of shards
+            shard_dir: Directory holding the shard files
+            prototypes_per_identity: Prototype vectors kept per identity
+            rerank_candidates: Identities re-ranked against their samples (0 = prototypes only)
+            use_processes: Serve each shard from its own process; False maps every shard
+                           in this process (e.g. inside detection workers)
+            reshard: Redistribute the identities when the directory holds a different
+                     shard count (compact_gallery.py --reshard); otherwise that is an error
+
+        Raises:
+            ValueError: The directory holds a different shard count and reshard is False
+        """
+        self.num_shards = num_shards
+        self.shard_dir = shard_dir
+        self.use_processes = use_processes
+        # One scatter/gather at a time on the shard processes' search pipes
+        self._search_lock = threading.Lock()
+        # Guards the name -> count bookkeeping only (never held during shard I/O)
+        self._counts_lock = threading.Lock()
+        self._check_layout(prototypes_per_identity, rerank_candidates, reshard)
+
+        if use_processes:
+            ctx = mp.get_context('spawn')
+            self._shards = [_RemoteShard(ctx, i, shard_dir, prototypes_per_identity, rerank_candidates)
+                            for i in range(num_shards)]
+            counts = [shard.receive() for shard in self._shards]
+        else:
+            self._shards = [_LocalShard(GalleryShard(i, shard_dir, prototypes_per_identity, rerank_candidates))
+                            for i in range(num_shards)]
+            counts = [shard.shard.sample_counts() for shard in self._shards]
+
+        # name -> sample count, so membership and sizes need no round trip
+        self._counts = {}
+        for shard_counts in counts:
+            self._counts.update(shard_counts)
+        self._stamps = [_file_stamp(self._manifest_path(i)) for i in range(num_shards)]
+
+    def _manifest_path(self, shard_id):
+        return os.path.join(self.shard_dir, f'shard_{shard_id:03d}.json')
+
+    @property
+    def _layout_path(self):
+        return os.path.join(self.shard_dir, 'gallery.json')
+
+    def _update_layout(self, **fields):
+        layout = _read_json(self._layout_path) if os.path.exists(self._layout_path) else {}
+        layout.update(fields)
+        _write_json(self._layout_path, layout)
+
+    def is_migrated(self):
+        """True once the legacy pickle was imported (or the shards were found in use)"""
+        if not os.path.exists(self._layout_path):
+            return False
+        return bool(_read_json(self._layout_path).get('migrated'))
+
+    def mark_migrated(self):
+        """Record that the legacy pickle must never seed this gallery again"""
+        with _FileLock(os.path.join(self.shard_dir, 'gallery.lock')):
+            self._update_layout(migrated=True)
+
+    def _check_layout(self, prototypes_per_identity, rerank_candidates, reshard):
+        """Record the shard count on disk; redistribute the identities only when asked to"""
+        os.makedirs(self.shard_dir, exist_ok=True)
+        # A process opening the gallery must not read it halfway through a redistribution
+        with _FileLock(os.path.join(self.shard_dir, 'gallery.lock'), timeout=300.0, stale_after=300.0):
+            self._redistribute(prototypes_per_identity, rerank_candidates, reshard)
+
+    def _redistribute(self, prototypes_per_identity, rerank_candidates, reshard):
+        layout_path = self._layout_path
+        staging_path = os.path.join(self.shard_dir, 'rebalance.pkl')
+        if os.path.exists(layout_path):
+            previous = _read_json(layout_path).get('num_shards')
+        else:
+            # Shards written before the layout file existed
+            previous = len(glob.glob(os.path.join(self.shard_dir, 'shard_*.json'))) or None
+
+        if os.path.exists(staging_path):
+            if not reshard:
+                raise ValueError(f"An interrupted redistribution left {staging_path}; "
+                                 f"finish it with: python compact_gallery.py --reshard <shards>")
+            # An earlier redistribution was interrupted: the staged copy is complete
+            with open(staging_path, 'rb') as f:
+                identities = pickle.load(f)
+        elif previous is not None and previous != self.num_shards:
+            if not reshard:
+                # Silently rewriting a live gallery would also delete the shards other processes map
+                raise ValueError(f"Gallery in {self.shard_dir} has {previous} shard(s) but {self.num_shards} "
+                                 f"were requested; set GALLERY_SHARDS to match or run: "
+                                 f"python compact_gallery.py --reshard {self.num_shards}")
+            identities = {}
+            for shard_id in range(previous):
+                shard = GalleryShard(shard_id, self.shard_dir, prototypes_per_identity, rerank_candidates)
+                identities.update(shard.to_dict())
+            # Keep a complete copy until every new shard is written
+            with open(staging_path + '.tmp', 'wb') as f:
+                pickle.dump(identities, f)
+            os.replace(staging_path + '.tmp', staging_path)
+        else:
+            if previous is None:
+                self._update_layout(num_shards=self.num_shards)
+            return
+
+        print(f"🔀 Redistributing {len(identities)} identities to {self.num_shards} gallery shards")
+        parts = [{} for _ in range(self.num_shards)]
+        for name, samples in identities.items():
+            parts[shard_for(name, self.num_shards)][name] = samples
+        for shard_id, part in enumerate(parts):
+            GalleryShard(shard_id, self.shard_dir, prototypes_per_identity, rerank_candidates).load_dict(part)
+        for shard_id in range(self.num_shards, max(self.num_shards, previous or 0)):
+            GalleryShard(shard_id, self.shard_dir, prototypes_per_identity, rerank_candidates).destroy()
+        self._update_layout(num_shards=self.num_shards)
+        os.remove(staging_path)
+
+    def refresh(self):
+        """
+        Pick up changes other processes wrote to the shard files
+
+        Only shards whose manifest changed are touched, so the check is one
+        stat() per shard. A reload maps the new files and swaps them in by
+        reference, so concurrent searches keep running on the old generation.
+
+        Returns:
+            True if any shard changed
+        """
+        changed = False
+        for shard_id, shard in enumerate(self._shards):
+            stamp = _file_stamp(self._manifest_path(shard_id))
+            if stamp == self._stamps[shard_id]:
+                continue
+            shard.control('refresh')
+            counts = shard.control('sample_counts')
+            self._stamps[shard_id] = stamp
+            with self._counts_lock:
+                current = {name: count for name, count in self._counts.items()
+                           if shard_for(name, self.num_shards) != shard_id}
+                if len(current) + len(counts) != len(self._counts) or any(
+                        self._counts.get(name) != count for name, count in counts.items()):
+                    changed = True
+                current.update(counts)
+                self._counts = current
+        return changed
+
+    def _shard(self, name):
+        return self._shards[shard_for(name, self.num_shards)]
+
+    def __len__(self):
+        return len(self._counts)
+
+    def __contains__(self, name):
+        return name in self._counts
+
+    def is_empty(self):
+        """True if no identities are enrolled"""
+        return not self._counts
+
+    def names(self):
+        """List of enrolled identity names (one entry per person)"""
+        return list(self._counts)
+
+    def samples(self, name):
+        """Sample matrix of one identity (None if unknown)"""
+        if name not in self._counts:
+            return None
+        return self._shard(name).control('samples', name)
+
+    def sample_counts(self):
+        """Number of enrolled samples per identity"""
+        return dict(self._counts)
+
+    def num_samples(self):
+        """Total number of enrolled samples"""
+        return sum(self._counts.values())
+
+    def set_samples(self, name, samples):
+        """Replace all samples of an identity on its shard"""
+        count = self._shard(name).control('set_samples', name, np.asarray(samples, dtype=np.float32))
+        with self._counts_lock:
+            self._counts[name] = count
+
+    def add_sample(self, name, features):
+        """Add one feature vector to an identity on its shard"""
+        count = self._shard(name).control('add_sample', name, np.asarray(features, dtype=np.float32))
+        with self._counts_lock:
+            self._counts[name] = count
+
+    def remove_identity(self, name):
+        """Remove an identity and all of its samples"""
+        if name not in self._counts:
+            return False
+        removed = self._shard(name).control('remove_identity', name)
+        with self._counts_lock:
+            self._counts.pop(name, None)
+        return removed
+
+    def clear(self):
+        """Remove all identities from every shard"""
+        self.load_dict({})
+
+    def search_batch(self, features, k=1):
+        """
+        Scatter a batch of queries to every shard and merge the per-shard top-k
+
+        Args:
+            features: (n, d) matrix of L2-normalized feature vectors
+            k: Identities returned per query
+
+        Returns:
+            List (one per query) of up to k (name, similarity) tuples, best first
+        """
+        features = np.asarray(features, dtype=np.float32)
+        if features.ndim == 1:
+            features = features[None, :]
+        if not self._counts:
+            return [[] for _ in range(len(features))]
+
+        if self.use_processes:
+            with self._search_lock:
+                for shard in self._shards:
+                    shard.send('search', features, k)
+                per_shard = [shard.receive() for shard in self._shards]
+        else:
+            # IdentityGallery searches are lock-free snapshots
+            per_shard = [shard.call('search', features, k) for shard in self._shards]
+
+        merged = []
+        for query in range(len(features)):
+            candidates = [hit for results in per_shard for hit in results[query]]
+            merged.append(heapq.nlargest(k, candidates, key=lambda hit: hit[1]))
+        return merged
+
+    def top_k(self, features, k=1):
+        """Top-k (name, similarity) tuples for one feature vector"""
+        return self.search_batch(features, k)[0]
+
+    def match(self, features):
+        """
+        Find the best matching identity for a feature vector
+
+        Returns:
+            Tuple of (name, similarity), or (None, 0.0) if the gallery is empty
+        """
+        ranked = self.top_k(features, 1)
+        if not ranked:
+            return None, 0.0
+        return ranked[0]
+
+    def to_dict(self):
+        """{name: samples} mapping gathered from every shard (loads everything into memory)"""
+        identities = {}
+        for shard in self._shards:
+            identities.update(shard.control('to_dict'))
+        return identities
+
+    def load_dict(self, identities):
+        """Replace the gallery with a {name: samples} mapping, routed by identity"""
+        parts = [{} for _ in range(self.num_shards)]
+        for name, samples in identities.items():
+            parts[shard_for(name, self.num_shards)][name] = np.asarray(samples, dtype=np.float32)
+
+        for shard, part in zip(self._shards, parts):
+            shard.control('load_dict', part)
+        with self._counts_lock:
+            self._counts = {name: len(np.atleast_2d(samples)) for name, samples in identities.items()}
+
+    def load_legacy(self, faces, names):
+        """Build the gallery from the old parallel faces/names lists"""
+        grouped = {}
+        for features, name in zip(faces, names):
+            grouped.setdefault(name, []).append(np.asarray(features, dtype=np.float32))
+        self.load_dict({name: np.vstack(samples) for name, samples in grouped.items()})
+
+    def close(self):
+        """Stop the shard processes"""
+        for shard in self._shards:
+            shard.close()
+
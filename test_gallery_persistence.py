@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+"""
+Tests for the on-disk gallery: removals, clears and the shard layout across restarts
+"""
+
+import pickle
+
+import numpy as np
+import pytest
+
+from face_recognition_system import FaceRecognitionSystem
+from sharded_gallery import ShardedGallery
+
+
+def _write_legacy_pickle(path, names):
+    rng = np.random.default_rng(0)
+    identities = {}
+    for name in names:
+        samples = rng.standard_normal((2, 64)).astype(np.float32)
+        identities[name] = samples / np.linalg.norm(samples, axis=1, keepdims=True)
+    with open(path, 'wb') as f:
+        pickle.dump({'version': 2, 'identities': identities}, f)
+
+
+def _open_recognizer(tmp_path):
+    """A fresh FaceRecognitionSystem on the test directory, like a server restart"""
+    return FaceRecognitionSystem(shard_dir=str(tmp_path / 'shards'),
+                                 encodings_file=str(tmp_path / 'face_encodings.pkl'))
+
+
+def test_pickle_seeds_new_gallery(tmp_path):
+    _write_legacy_pickle(tmp_path / 'face_encodings.pkl', ['alice', 'bob'])
+    recognizer = _open_recognizer(tmp_path)
+    assert sorted(recognizer.get_authorized_users()) == ['alice', 'bob']
+    assert recognizer.gallery.is_migrated()
+
+
+def test_clear_survives_restart(tmp_path):
+    _write_legacy_pickle(tmp_path / 'face_encodings.pkl', ['alice', 'bob'])
+    _open_recognizer(tmp_path).clear_all_users()
+
+    recognizer = _open_recognizer(tmp_path)
+    assert recognizer.gallery.is_empty()
+
+
+def test_removing_last_user_survives_restart(tmp_path):
+    _write_legacy_pickle(tmp_path / 'face_encodings.pkl', ['alice'])
+    assert _open_recognizer(tmp_path).remove_authorized_user('alice')
+
+    recognizer = _open_recognizer(tmp_path)
+    assert recognizer.gallery.is_empty()
+
+
+def test_existing_shards_are_not_reseeded(tmp_path):
+    # Shards written before the migration flag existed
+    recognizer = _open_recognizer(tmp_path)
+    recognizer.gallery.set_samples('carol', np.eye(1, 64, dtype=np.float32))
+    layout = tmp_path / 'shards' / 'gallery.json'
+    layout.write_text('{"num_shards": 1}')
+    _write_legacy_pickle(tmp_path / 'face_encodings.pkl', ['alice'])
+
+    recognizer = _open_recognizer(tmp_path)
+    assert recognizer.get_authorized_users() == ['carol']
+    recognizer.clear_all_users()
+    assert _open_recognizer(tmp_path).gallery.is_empty()
+
+
+def test_shard_count_mismatch_is_an_error(tmp_path):
+    shard_dir = str(tmp_path / 'shards')
+    gallery = ShardedGallery(2, shard_dir, use_processes=False)
+    gallery.load_dict({name: np.eye(1, 64, i, dtype=np.float32) for i, name in enumerate(['alice', 'bob', 'carol'])})
+
+    with pytest.raises(ValueError):
+        ShardedGallery(1, shard_dir, use_processes=False)
+    # Nothing was rewritten
+    assert sorted(ShardedGallery(2, shard_dir, use_processes=False).names()) == ['alice', 'bob', 'carol']
+
+
+def test_explicit_reshard_keeps_identities(tmp_path):
+    shard_dir = str(tmp_path / 'shards')
+    gallery = ShardedGallery(2, shard_dir, use_processes=False)
+    gallery.load_dict({name: np.eye(1, 64, i, dtype=np.float32) for i, name in enumerate(['alice', 'bob', 'carol'])})
+
+    resharded = ShardedGallery(3, shard_dir, use_processes=False, reshard=True)
+    assert sorted(resharded.names()) == ['alice', 'bob', 'carol']
+    assert sorted(ShardedGallery(3, shard_dir, use_processes=False).names()) == ['alice', 'bob', 'carol']
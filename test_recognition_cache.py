@@ -0,0 +1,45 @@
+#!/usr/bin/env python3
+"""
+Tests for the recognition cache lookups of tracked and untracked faces
+"""
+
+from recognition_cache import RecognitionCache
+
+
+def test_untracked_face_hits_with_one_bit_difference():
+    cache = RecognitionCache(max_hash_distance=6)
+    face_hash = 0x0123456789ABCDEF
+    cache.put(cache.make_key({}, face_hash), face_hash, ('alice', 0.93))
+
+    moved = face_hash ^ (1 << 17)
+    assert cache.get(cache.make_key({}, moved), moved) == ('alice', 0.93)
+    assert cache.hits == 1
+
+
+def test_untracked_face_misses_beyond_max_distance():
+    cache = RecognitionCache(max_hash_distance=6)
+    face_hash = 0x0123456789ABCDEF
+    cache.put(cache.make_key({}, face_hash), face_hash, ('alice', 0.93))
+
+    other = face_hash ^ 0xFF  # 8 bits apart
+    assert cache.get(cache.make_key({}, other), other) is None
+    assert cache.misses == 1
+
+
+def test_untracked_lookup_picks_nearest_hash():
+    cache = RecognitionCache(max_hash_distance=6)
+    base = 0x0F0F0F0F0F0F0F0F
+    cache.put(cache.make_key({}, base ^ 0b111), base ^ 0b111, ('bob', 0.85))
+    cache.put(cache.make_key({}, base ^ 0b1), base ^ 0b1, ('alice', 0.91))
+
+    assert cache.get(cache.make_key({}, base), base) == ('alice', 0.91)
+
+
+def test_tracked_face_uses_its_own_entry():
+    cache = RecognitionCache(max_hash_distance=6)
+    face_hash = 0x0123456789ABCDEF
+    cache.put(cache.make_key({'track_id': 1}, face_hash), face_hash, ('alice', 0.93))
+
+    # Same appearance, different track: no hit
+    assert cache.get(cache.make_key({'track_id': 2}, face_hash), face_hash) is None
+    assert cache.get(cache.make_key({'track_id': 1}, face_hash ^ 1), face_hash ^ 1) == ('alice', 0.93)
@@ -0,0 +1,151 @@
+"""
+CPU thread budget for OpenCV and TensorFlow.
+
+OpenCV and TensorFlow's intra-op and inter-op pools are each sized to the
+whole machine by default. With the capture thread, the stream generators
+and several detection workers each running them, the process ends up with
+several times more runnable threads than cores. The budget sets every pool
+explicitly per stage (the server process and each detection worker), can
+pin processes to CPUs, and can be loaded from a profile that
+tune_threads.py measured on this machine.
+
+TensorFlow only accepts threading settings before its runtime starts, so
+apply_thread_budget() must run before the first model is built.
+"""
+
+import json
+import os
+import threading
+
+import cv2
+
+# Config keys a tuned profile may set
+PROFILE_KEYS = (
+    'OPENCV_THREADS', 'TF_INTRA_OP_THREADS', 'TF_INTER_OP_THREADS', 'CPU_AFFINITY',
+    'DETECTION_WORKERS', 'WORKER_OPENCV_THREADS', 'WORKER_TF_INTRA_OP_THREADS',
+    'WORKER_TF_INTER_OP_THREADS', 'WORKER_CPU_AFFINITY', 'ASGI_EXECUTOR_WORKERS',
+)
+
+
+def available_cpus():
+    """CPU ids this process may run on"""
+    try:
+        return sorted(os.sched_getaffinity(0))
+    except AttributeError:
+        return list(range(os.cpu_count() or 1))
+
+
+def apply_thread_budget(opencv_threads=None, tf_intra_op=None, tf_inter_op=None, cpus=None):
+    """
+    Size the OpenCV and TensorFlow thread pools of this process and optionally pin it
+
+    Args:
+        opencv_threads: cv2.setNumThreads value (None = leave OpenCV's default)
+        tf_intra_op: TensorFlow threads per op (None = default, one per core)
+        tf_inter_op: TensorFlow ops run in parallel (None = default)
+        cpus: CPU ids to pin the process to (None = no pinning; Linux only)
+
+    Returns:
+        Dict of the settings that were applied
+    """
+    applied = {}
+    if cpus:
+        try:
+            os.sched_setaffinity(0, cpus)
+            applied['cpus'] = sorted(cpus)
+        except (AttributeError, OSError) as e:
+            print(f"⚠️ CPU affinity not applied: {e}")
+
+    if opencv_threads is not None:
+        cv2.setNumThreads(opencv_threads)
+        applied['opencv_threads'] = opencv_threads
+
+    if tf_intra_op is not None or tf_inter_op is not None:
+        import tensorflow as tf
+        try:
+            if tf_intra_op is not None:
+                tf.config.threading.set_intra_op_parallelism_threads(tf_intra_op)
+                applied['tf_intra_op'] = tf_intra_op
+            if tf_inter_op is not None:
+                tf.config.threading.set_inter_op_parallelism_threads(tf_inter_op)
+                applied['tf_inter_op'] = tf_inter_op
+        except RuntimeError as e:
+            # TensorFlow already ran an op in this process
+            print(f"⚠️ TensorFlow threading not applied: {e}")
+    return applied
+
+
+def server_budget(config):
+    """apply_thread_budget() arguments for the server process"""
+    return {
+        'opencv_threads': config['OPENCV_THREADS'],
+        'tf_intra_op': config['TF_INTRA_OP_THREADS'],
+        'tf_inter_op': config['TF_INTER_OP_THREADS'],
+        'cpus': config['CPU_AFFINITY'],
+    }
+
+
+def worker_budget(config, worker_id, num_workers):
+    """
+    apply_thread_budget() arguments for one detection worker process
+
+    Without an explicit WORKER_TF_INTRA_OP_THREADS the cores are split evenly
+    between the workers. With WORKER_CPU_AFFINITY each worker is pinned to
+    its own slice of the CPUs.
+    """
+    cpus = available_cpus()
+    share = max(1, len(cpus) // max(1, num_workers))
+    intra_op = config['WORKER_TF_INTRA_OP_THREADS']
+    budget = {
+        'opencv_threads': config['WORKER_OPENCV_THREADS'],
+        'tf_intra_op': intra_op if intra_op is not None else share,
+        'tf_inter_op': config['WORKER_TF_INTER_OP_THREADS'],
+        'cpus': None,
+    }
+    if config['WORKER_CPU_AFFINITY']:
+        start = (worker_id * share) % len(cpus)
+        budget['cpus'] = cpus[start:start + share]
+    return budget
+
+
+def load_thread_profile(config, path=None):
+    """
+    Override the thread settings in config with a profile written by tune_threads.py
+
+    Args:
+        config: Flask config to update
+        path: Profile path (defaults to config['THREAD_PROFILE_PATH'])
+
+    Returns:
+        Dict of the settings that were applied, or None if there is no profile
+    """
+    path = path or config['THREAD_PROFILE_PATH']
+    if not path or not os.path.exists(path):
+        return None
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            profile = json.load(f)
+    except (OSError, ValueError) as e:
+        print(f"⚠️ Could not read thread profile {path}: {e}")
+        return None
+
+    settings = {key: value for key, value in profile.get('settings', {}).items() if key in PROFILE_KEYS}
+    config.update(settings)
+    print(f"⚙️ Thread profile loaded from {path}: {settings}")
+    return settings
+
+
+def get_thread_stats():
+    """Current pool sizes, pinning and Python thread count of this process"""
+    stats = {
+        'opencv_threads': cv2.getNumThreads(),
+        'cpus': available_cpus(),
+        'python_threads': threading.active_count(),
+    }
+    try:
+        import tensorflow as tf
+        stats['tf_intra_op'] = tf.config.threading.get_intra_op_parallelism_threads()
+        stats['tf_inter_op'] = tf.config.threading.get_inter_op_parallelism_threads()
+    except ImportError:
+        pass
+    return stats
@@ -0,0 +1,256 @@
+#!/usr/bin/env python3
+"""
+Auto-tune the CPU thread budget on this machine.
+
+Each candidate setting (detection workers, OpenCV threads, TensorFlow
+intra/inter-op threads, optionally CPU pinning) runs in a fresh process,
+because TensorFlow's threading is fixed once its runtime starts. The
+workload mimics the server: frames are detected and every face is
+recognized back to back (in-process or in the detection workers) while
+--viewers stream threads draw the overlay and encode JPEGs at the camera
+rate. Recognition runs against a temporary copy of the gallery, so tuning
+never writes to the live shard files. The candidate with the best detection rate whose streams keep up is
+written as a profile that app.py loads at startup:
+
+    python tune_threads.py                        # writes data/thread_profile.json
+    python tune_threads.py --quick --viewers 2 --output /tmp/profile.json
+"""
+
+import argparse
+import json
+import multiprocessing as mp
+import os
+import platform
+import shutil
+import tempfile
+import threading
+import time
+from collections import deque
+from datetime import datetime
+
+import numpy as np
+
+from config import Config
+from thread_budget import available_cpus
+
+# Face boxes drawn by the simulated stream viewers
+OVERLAY_FACES = [
+    {'box': [200, 100, 160, 190], 'confidence': 0.998, 'authorized': True},
+    {'box': [420, 160, 110, 130], 'confidence': 0.951, 'authorized': False},
+]
+
+
+def _settings_with_defaults(settings):
+    from thread_budget import PROFILE_KEYS
+    merged = {key: getattr(Config, key) for key in PROFILE_KEYS}
+    merged.update(settings)
+    return merged
+
+
+def _stream_viewer(frame, fps, deadline, latencies):
+    """Overlay + encode at the camera rate, like one generate_frames() viewer"""
+    from jpeg_encoder import create_jpeg_encoder
+    from overlay_renderer import OverlayRenderer
+
+    encoder = create_jpeg_encoder(Config.JPEG_ENCODER, Config.JPEG_QUALITY)
+    renderer = OverlayRenderer()
+    interval = 1.0 / fps
+    next_time = time.perf_counter()
+    while time.perf_counter() < deadline:
+        start = time.perf_counter()
+        encoder.encode(renderer.render(frame, OVERLAY_FACES, lambda image, face: face['authorized']))
+        latencies.append(time.perf_counter() - start)
+        next_time = max(next_time + interval, time.perf_counter())
+        time.sleep(max(0.0, next_time - time.perf_counter()))
+
+
+def _recognizer_options(shard_dir):
+    """FaceRecognitionSystem options of the server, on the tuner's copy of the gallery"""
+    from face_recognition_system import recognizer_options
+    return dict(recognizer_options(vars(Config)), shard_dir=shard_dir, shard_processes=False, reload_interval=0)
+
+
+def _copy_gallery(shard_dir):
+    """Copy the live gallery shards to shard_dir (an empty gallery is seeded from the pickle later)"""
+    if os.path.isdir(Config.GALLERY_SHARD_DIR):
+        shutil.copytree(Config.GALLERY_SHARD_DIR, shard_dir, dirs_exist_ok=True,
+                        ignore=shutil.ignore_patterns('*.lock', '*.tmp'))
+
+
+def _run_candidate(settings, seconds, viewers, fps, shard_dir, results):
+    """Fresh-process run of one candidate; puts a result dict on the results queue"""
+    from thread_budget import apply_thread_budget, server_budget
+    from benchmark_suite import load_corpus
+
+    settings = _settings_with_defaults(settings)
+    apply_thread_budget(**server_budget(settings))
+
+    import tensorflow as tf
+    from detection_pipeline import detect_faces_in_frame, warm_up_detector
+    from face_recognition_system import FaceRecognitionSystem
+    from worker_pool import DetectionWorkerPool
+
+    tf.get_logger().setLevel('ERROR')
+    corpus = load_corpus()
+    buckets = Config.DETECTOR_INPUT_BUCKETS
+    max_width = Config.FRAME_RESIZE_MAX_WIDTH
+    workers = settings['DETECTION_WORKERS']
+
+    pool = None
+    detector = None
+    recognizer = None
+    if workers > 0:
+        # Workers detect and recognize every face, so the in-process arm below does both too
+        pool = DetectionWorkerPool(workers, max_width=max_width, slot_bytes=corpus[0].nbytes,
+                                   recognizer_options=_recognizer_options(shard_dir),
+                                   buckets=buckets, warmup_shapes=buckets,
+                                   thread_config={key: settings[key] for key in settings
+                                                  if key.startswith('WORKER_')})
+        pool.wait_ready()
+    else:
+        from mtcnn import MTCNN
+        detector = MTCNN()
+        warm_up_detector(detector, buckets)
+        recognizer = FaceRecognitionSystem(**_recognizer_options(shard_dir))
+
+    try:
+        latencies = []
+        start = time.perf_counter()
+        deadline = start + seconds
+        threads = [threading.Thread(target=_stream_viewer, args=(corpus[0], fps, deadline, latencies), daemon=True)
+                   for _ in range(viewers)]
+        for thread in threads:
+            thread.start()
+
+        detections = 0
+        pending = deque()
+        while time.perf_counter() < deadline:
+            frame = corpus[detections % len(corpus)]
+            if pool is None:
+                for face in detect_faces_in_frame(detector, frame, max_width, buckets) or []:
+                    recognizer.recognize_person(frame, face)
+                detections += 1
+                continue
+            # Keep every worker busy, collecting the oldest result when the pipeline is full
+            pending.append(pool.submit(frame, block=True))
+            if len(pending) >= workers * 2:
+                pool.get_result(pending.popleft())
+                detections += 1
+        elapsed = time.perf_counter() - start
+        for thread in threads:
+            thread.join()
+    finally:
+        if pool is not None:
+            pool.close()
+
+    stream_fps = len(latencies) / elapsed / viewers if viewers else 0.0
+    results.put({
+        'detections_per_s': detections / elapsed,
+        'stream_fps': stream_fps,
+        'stream_p95_ms': float(np.percentile(latencies, 95) * 1000) if latencies else None,
+    })
+
+
+def candidate_settings(cpus, max_workers, try_affinity):
+    """Thread budgets to try: library defaults, then in-process and worker layouts"""
+    candidates = [{}]
+    worker_counts = [0] + [count for count in (1, 2, 4, 8, 16) if count <= max_workers]
+    for workers in worker_counts:
+        per_process = max(1, cpus // max(1, workers))
+        for intra_op in sorted({per_process, max(1, per_process // 2), 1}, reverse=True):
+            for opencv_threads in sorted({1, per_process}):
+                if workers == 0:
+                    candidates.append({'DETECTION_WORKERS': 0, 'OPENCV_THREADS': opencv_threads,
+                                       'TF_INTRA_OP_THREADS': intra_op, 'TF_INTER_OP_THREADS': 1})
+                    continue
+                settings = {'DETECTION_WORKERS': workers, 'OPENCV_THREADS': opencv_threads,
+                            'WORKER_OPENCV_THREADS': 1, 'WORKER_TF_INTRA_OP_THREADS': intra_op,
+                            'WORKER_TF_INTER_OP_THREADS': 1, 'WORKER_CPU_AFFINITY': False}
+                candidates.append(settings)
+                if try_affinity:
+                    candidates.append(dict(settings, WORKER_CPU_AFFINITY=True))
+    return candidates
+
+
+def score(result, fps):
+    """Detection rate, discounted when the streams fall below 90% of the camera rate"""
+    keep_up = min(1.0, result['stream_fps'] / (0.9 * fps)) if fps else 1.0
+    return result['detections_per_s'] * keep_up
+
+
+def main():
+    """Benchmark the candidates and write the best profile"""
+    parser = argparse.ArgumentParser(description='Auto-tune OpenCV/TensorFlow thread settings')
+    parser.add_argument('--output', default=Config.THREAD_PROFILE_PATH, help='Profile JSON to write')
+    parser.add_argument('--seconds', type=float, default=10.0, help='Measurement time per candidate')
+    parser.add_argument('--viewers', type=int, default=1, help='Simulated stream viewers')
+    parser.add_argument('--fps', type=float, default=Config.CAMERA_FPS, help='Stream rate each viewer needs')
+    parser.add_argument('--max-workers', type=int, help='Largest worker count tried (default: CPUs - 1)')
+    parser.add_argument('--affinity', action='store_true', help='Also try pinning workers to CPUs')
+    parser.add_argument('--quick', action='store_true', help='3 s per candidate')
+    args = parser.parse_args()
+
+    cpus = len(available_cpus())
+    max_workers = args.max_workers if args.max_workers is not None else cpus - 1
+    seconds = 3.0 if args.quick else args.seconds
+    candidates = candidate_settings(cpus, max_workers, args.affinity)
+
+    print("🧪 Thread Budget Auto-Tune")
+    print("=" * 72)
+    print(f"CPUs: {cpus}, candidates: {len(candidates)}, {seconds:.0f} s each, "
+          f"{args.viewers} viewer(s) at {args.fps:.0f} FPS")
+    print("=" * 72)
+
+    ctx = mp.get_context('spawn')
+    results = []
+    shard_dir = tempfile.mkdtemp(prefix='tune_threads_gallery_')
+    try:
+        _copy_gallery(shard_dir)
+        for settings in candidates:
+            queue = ctx.Queue()
+            process = ctx.Process(target=_run_candidate,
+                                  args=(settings, seconds, args.viewers, args.fps, shard_dir, queue))
+            process.start()
+            try:
+                result = queue.get(timeout=seconds + 300)
+            except Exception as e:
+                print(f"❌ Candidate {settings or 'defaults'} failed: {e}")
+                process.terminate()
+                continue
+            process.join()
+
+            result['settings'] = settings
+            result['score'] = score(result, args.fps)
+            results.append(result)
+            print(f"{json.dumps(settings) if settings else 'library defaults':<70}"
+                  f"{result['detections_per_s']:6.1f} det/s  {result['stream_fps']:5.1f} stream FPS")
+    finally:
+        shutil.rmtree(shard_dir, ignore_errors=True)
+
+    if not results:
+        print("❌ No candidate completed")
+        return
+
+    best = max(results, key=lambda result: result['score'])
+    profile = {
+        'created': datetime.now().isoformat(timespec='seconds'),
+        'machine': {'cpus': cpus, 'platform': platform.platform(), 'processor': platform.processor()},
+        'workload': {'seconds': seconds, 'viewers': args.viewers, 'fps': args.fps},
+        'settings': best['settings'],
+        'best': {key: value for key, value in best.items() if key != 'settings'},
+        'candidates': results,
+    }
+    output_dir = os.path.dirname(args.output)
+    if output_dir:
+        os.makedirs(output_dir, exist_ok=True)
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(profile, f, indent=2)
+
+    print("\n" + "=" * 72)
+    print(f"🏆 Best: {best['settings'] or 'library defaults'} "
+          f"({best['detections_per_s']:.1f} det/s, {best['stream_fps']:.1f} stream FPS)")
+    print(f"💾 Profile written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,271 @@
+"""
+Process pool for face detection and recognition.
+
+Frames are copied into pre-allocated multiprocessing.shared_memory slots and
+only a small (seq, slot, shape) task goes through the queue. Each worker
+process owns its own MTCNN detector and FaceRecognitionSystem, so the
+Python-side pre/post-processing and feature matching run outside the
+server's GIL. Workers answer with lightweight result dicts. While the
+server is tracing, tasks carry the window end and workers return their
+detect/align/extract/match spans with the result.
+"""
+
+import multiprocessing as mp
+import queue
+import threading
+import time
+from collections import OrderedDict
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from config import Config
+from face_quality import merge_quality_stats
+from frame_tracer import tracer
+
+
+def _worker_main(worker_id, slot_names, task_queue, result_queue, max_width, recognizer_options,
+                 quality_config, buckets, warmup_shapes, thread_config, num_workers):
+    """Worker process entry point"""
+    import tensorflow as tf
+    from mtcnn import MTCNN
+    from detection_pipeline import detect_faces_in_frame, warm_up_detector
+    from face_recognition_system import FaceRecognitionSystem
+    from face_quality import create_quality_gate
+    from thread_budget import apply_thread_budget, worker_budget
+
+    tf.get_logger().setLevel('ERROR')
+    # Before the detector is built: TensorFlow threading is fixed once its runtime starts
+    apply_thread_budget(**worker_budget(thread_config, worker_id, num_workers))
+    slots = [shared_memory.SharedMemory(name=name) for name in slot_names]
+
+    detector = MTCNN()
+    # Warm up every input shape so the first real frames do not pay model initialization
+    warm_up_detector(detector, warmup_shapes or [(48, 48)])
+    # The gate runs here instead of inside the recognizer: deferring needs track IDs,
+    # which only the server assigns, so rejected faces are tagged for it
+    quality_gate = create_quality_gate(quality_config) if quality_config else None
+    recognizer = FaceRecognitionSystem(**recognizer_options)
+    result_queue.put({'type': 'ready', 'worker': worker_id})
+
+    while True:
+        task = task_queue.get()
+        if task is None:
+            break
+
+        seq, slot, shape, trace_until = task
+        # Trace this worker's stages for the rest of the server's window
+        if trace_until is not None and not tracer.enabled and trace_until > time.perf_counter():
+            tracer.start(trace_until - time.perf_counter())
+        frame = np.ndarray(shape, dtype=np.uint8, buffer=slots[slot].buf)
+        result = {'type': 'result', 'seq': seq, 'slot': slot, 'worker': worker_id, 'faces': []}
+        try:
+            start = time.perf_counter()
+            faces = detect_faces_in_frame(detector, frame, max_width, buckets) or []
+            detected = time.perf_counter()
+
+            for face in faces:
+                failed = quality_gate.check(frame, face) if quality_gate is not None else None
+                if failed is None:
+                    name, score = recognizer.recognize_person(frame, face)
+                else:
+                    name, score = None, 0.0
+                entry = {
+                    'box': [int(v) for v in face['box']],
+                    'confidence': float(face.get('confidence', 0.0)),
+                    'keypoints': {key: (int(x), int(y)) for key, (x, y) in face.get('keypoints', {}).items()},
+                    'name': name,
+                    'score': float(score),
+                    'authorized': name is not None,
+                }
+                if failed is not None:
+                    entry['quality_failed'] = failed
+                result['faces'].append(entry)
+
+            result['detect_ms'] = (detected - start) * 1000
+            result['recognize_ms'] = (time.perf_counter() - detected) * 1000
+            result['quality'] = quality_gate.get_stats() if quality_gate is not None else None
+        except Exception as e:
+            result['error'] = str(e)
+        finally:
+            # Release the view before the slot can be reused or closed
+            del frame
+        spans = tracer.drain()
+        if spans:
+            result['spans'] = spans
+        result_queue.put(result)
+
+    for slot in slots:
+        slot.close()
+
+
+def _default_recognizer_options():
+    from face_recognition_system import recognizer_options
+    # Workers map the shard files themselves instead of starting their own shard processes
+    return dict(recognizer_options(vars(Config)), shard_processes=False)
+
+
+def _default_thread_config():
+    return {key: getattr(Config, key) for key in dir(Config) if key.startswith('WORKER_')}
+
+
+class DetectionWorkerPool:
+    """Run detection + recognition in worker processes fed through shared memory"""
+
+    def __init__(self, num_workers, max_width=480, slot_bytes=1920 * 1080 * 3, slots_per_worker=2,
+                 recognizer_options=None, quality_config=None, buckets=None, warmup_shapes=None,
+                 thread_config=None):
+        """
+        Args:
+            num_workers: Number of worker processes
+            max_width: Maximum detector input width (see detection_pipeline)
+            slot_bytes: Size of each shared-memory frame slot (largest frame accepted)
+            slots_per_worker: Frames that can be in flight per worker
+            recognizer_options: Keyword arguments for each worker's FaceRecognitionSystem
+                                (None = the Config gallery, mapped in each worker)
+            quality_config: FACE_QUALITY_* settings for each worker's quality gate (None = no gate)
+            buckets: Fixed detector input shapes (see detection_pipeline.choose_bucket)
+            warmup_shapes: Detector input shapes each worker warms up before reporting ready
+            thread_config: WORKER_* thread budget settings (None = the Config defaults)
+        """
+        self.num_workers = num_workers
+        self.slot_bytes = slot_bytes
+        self._ctx = mp.get_context('spawn')
+        self._slots = [shared_memory.SharedMemory(create=True, size=slot_bytes)
+                       for _ in range(num_workers * slots_per_worker)]
+        self._free_slots = queue.Queue()
+        for index in range(len(self._slots)):
+            self._free_slots.put(index)
+
+        self._task_queue = self._ctx.Queue()
+        self._result_queue = self._ctx.Queue()
+        self._results = OrderedDict()
+        self._max_results = len(self._slots) * 4
+        self._condition = threading.Condition()
+        self._latest = None
+        self._seq = 0
+        self._ready = 0
+        # Latest quality gate counters reported by each worker
+        self._quality = {}
+        self._running = True
+
+        slot_names = [slot.name for slot in self._slots]
+        self._workers = [self._ctx.Process(target=_worker_main,
+                                           args=(i, slot_names, self._task_queue, self._result_queue, max_width,
+                                                 recognizer_options or _default_recognizer_options(),
+                                                 quality_config, buckets,
+                                                 warmup_shapes, thread_config or _default_thread_config(),
+                                                 num_workers),
+                                           daemon=True)
+                         for i in range(num_workers)]
+        for worker in self._workers:
+            worker.start()
+
+        self._collector = threading.Thread(target=self._collect_results, daemon=True)
+        self._collector.start()
+
+    def _collect_results(self):
+        """Collector thread: move finished results from the queue into the result table"""
+        while self._running:
+            try:
+                result = self._result_queue.get(timeout=0.5)
+            except queue.Empty:
+                continue
+            except (EOFError, OSError):
+                break
+
+            with self._condition:
+                if result['type'] == 'ready':
+                    self._ready += 1
+                else:
+                    self._free_slots.put(result['slot'])
+                    if result.get('quality') is not None:
+                        self._quality[result['worker']] = result['quality']
+                    if result.get('spans'):
+                        tracer.add_spans(result['spans'], self._workers[result['worker']].pid,
+                                         f"detection-worker-{result['worker']}")
+                    self._results[result['seq']] = result
+                    while len(self._results) > self._max_results:
+                        self._results.popitem(last=False)
+                    if self._latest is None or result['seq'] > self._latest['seq']:
+                        self._latest = result
+                self._condition.notify_all()
+
+    def wait_ready(self, timeout=None):
+        """Block until every worker has loaded its models"""
+        with self._condition:
+            return self._condition.wait_for(lambda: self._ready >= self.num_workers, timeout)
+
+    def submit(self, frame, block=False, timeout=None):
+        """
+        Queue a frame for detection
+
+        Args:
+            frame: BGR uint8 image
+            block: Wait for a free slot instead of dropping the frame
+            timeout: Maximum wait when blocking
+
+        Returns:
+            Sequence number, or None if all slots are busy or the frame is too large
+        """
+        if frame.nbytes > self.slot_bytes:
+            print(f"Frame too large for worker slot ({frame.nbytes} > {self.slot_bytes} bytes)")
+            return None
+
+        try:
+            slot = self._free_slots.get(block=block, timeout=timeout)
+        except queue.Empty:
+            return None
+
+        view = np.ndarray(frame.shape, dtype=np.uint8, buffer=self._slots[slot].buf)
+        view[...] = frame
+        del view
+
+        with self._condition:
+            self._seq += 1
+            seq = self._seq
+        self._task_queue.put((seq, slot, frame.shape, tracer.window_end()))
+        return seq
+
+    def get_result(self, seq, timeout=None):
+        """Wait for and return the result of a submitted frame (None on timeout)"""
+        with self._condition:
+            if not self._condition.wait_for(lambda: seq in self._results, timeout):
+                return None
+            return self._results.pop(seq)
+
+    def latest_result(self):
+        """Return the most recent completed result (or None)"""
+        return self._latest
+
+    def process(self, frame, timeout=None):
+        """Submit a frame and wait for its result"""
+        seq = self.submit(frame, block=True, timeout=timeout)
+        if seq is None:
+            return None
+        return self.get_result(seq, timeout)
+
+    def quality_stats(self):
+        """Quality gate counters summed over the workers (None if no worker has a gate)"""
+        with self._condition:
+            return merge_quality_stats(list(self._quality.values()))
+
+    def in_flight(self):
+        """Number of frames currently being processed"""
+        return len(self._slots) - self._free_slots.qsize()
+
+    def close(self):
+        """Stop the workers and release the shared memory"""
+        if not self._running:
+            return
+        for _ in self._workers:
+            self._task_queue.put(None)
+        for worker in self._workers:
+            worker.join(timeout=5)
+            if worker.is_alive():
+                worker.terminate()
+        self._running = False
+        self._collector.join(timeout=2)
+        for slot in self._slots:
+            slot.close()
+            slot.unlink()